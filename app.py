@@ -5,11 +5,11 @@ Flask application following OOP principles with proper separation of concerns
 
 import os
 import html
-from flask import Flask, send_from_directory
-from flask_login import LoginManager
+from flask import Flask, abort, redirect
+from werkzeug.exceptions import NotFound
+from flask_login import LoginManager, current_user, login_required
 from flask_migrate import Migrate
 from flask_mail import Mail
-from flask_caching import Cache
 from celery import Celery
 from dotenv import load_dotenv
 
@@ -34,11 +34,14 @@ except Exception as e:
     pass
 
 # Initialize extensions
-from app import db
+from app import db, cache, configure_cache
 login_manager = LoginManager()
 migrate = Migrate()
 mail = Mail()
-cache = Cache()
+
+# /uploads subdirectories: question audio may sit in shared caches; recordings are owner-only
+PUBLIC_UPLOAD_DIRECTORIES = ('questions',)
+PRIVATE_UPLOAD_DIRECTORIES = ('responses', 'media')
 
 
 def create_app():
@@ -51,6 +54,14 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16777216))
     app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', 'uploads')
+    # Recordings arrive in resumable chunks (see app/services/upload_service.py)
+    app.config['UPLOAD_CHUNK_SIZE'] = int(os.environ.get('UPLOAD_CHUNK_SIZE', 1048576))
+    app.config['MAX_RECORDING_SIZE'] = int(os.environ.get('MAX_RECORDING_SIZE', 104857600))
+    # Media serving: browser cache lifetime of non-content-addressed files, and optional
+    # web server offload (MEDIA_OFFLOAD=x-accel for nginx, x-sendfile for Apache/lighttpd)
+    app.config['MEDIA_CACHE_MAX_AGE'] = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 3600))
+    app.config['MEDIA_OFFLOAD'] = os.environ.get('MEDIA_OFFLOAD', '')
+    app.config['MEDIA_ACCEL_PREFIX'] = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected')
     
     # AI Configuration - Also store in Flask config for services to access
     app.config['GOOGLE_AI_API_KEY'] = os.environ.get('GOOGLE_AI_API_KEY') or os.environ.get('GEMINI_API_KEY')
@@ -65,10 +76,32 @@ def create_app():
         'pool_timeout': 30,  # Timeout for getting connection from pool
     }
     
-    # Caching Configuration
-    app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'simple')  # Use 'redis' in production
-    app.config['CACHE_REDIS_URL'] = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-    app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # 5 minutes
+    # Caching Configuration (CACHE_TYPE=RedisCache in production so all workers share it)
+    configure_cache(app)
+    app.config['USER_CACHE_TIMEOUT'] = int(os.environ.get('USER_CACHE_TIMEOUT', 300))
+    
+    # Question catalog: seconds between checks of the shared catalog version
+    app.config['QUESTION_CATALOG_CHECK_INTERVAL'] = float(os.environ.get('QUESTION_CATALOG_CHECK_INTERVAL', 5))
+    # Seconds browsers may reuse the topics listing before revalidating its ETag
+    app.config['TOPICS_CACHE_MAX_AGE'] = int(os.environ.get('TOPICS_CACHE_MAX_AGE', 60))
+    # Days notifications are kept; scripts/purge_notifications.py deletes older ones
+    app.config['NOTIFICATION_RETENTION_DAYS'] = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 30))
+    # Push unread counts over Server-Sent Events; each open tab holds a worker thread, so
+    # enable it only with threaded/async gunicorn workers (GUNICORN_WORKER_CLASS=gthread or gevent).
+    # NOTIFICATION_PUSH_BACKEND=redis shares events between worker processes.
+    app.config['NOTIFICATION_PUSH_ENABLED'] = os.environ.get('NOTIFICATION_PUSH_ENABLED', 'false').lower() == 'true'
+    app.config['NOTIFICATION_PUSH_BACKEND'] = os.environ.get('NOTIFICATION_PUSH_BACKEND', 'memory')
+    app.config['NOTIFICATION_STREAM_SECONDS'] = int(os.environ.get('NOTIFICATION_STREAM_SECONDS', 55))
+    # Queue new recordings for Opus transcoding (processed by scripts/media_worker.py, needs ffmpeg)
+    app.config['AUDIO_TRANSCODE_ENABLED'] = os.environ.get('AUDIO_TRANSCODE_ENABLED', 'true').lower() == 'true'
+    app.config['AUDIO_OPUS_BITRATE'] = os.environ.get('AUDIO_OPUS_BITRATE', '32k')
+    app.config['AUDIO_LOUDNESS_TARGET'] = float(os.environ.get('AUDIO_LOUDNESS_TARGET', -16))
+    # Compute prosody features (pitch, pauses, rate) of new responses for AI scoring
+    app.config['AUDIO_FEATURES_ENABLED'] = os.environ.get('AUDIO_FEATURES_ENABLED', 'true').lower() == 'true'
+    # Transcribe new responses on the media worker (TRANSCRIPTION_ENGINE=faster-whisper needs
+    # `pip install faster-whisper` there; 'fake' is for tests)
+    app.config['TRANSCRIPTION_ENABLED'] = os.environ.get('TRANSCRIPTION_ENABLED', 'false').lower() == 'true'
+    app.config['TRANSCRIPTION_ENGINE'] = os.environ.get('TRANSCRIPTION_ENGINE', 'faster-whisper')
     
     # Session configuration - Optimized for concurrent users
     app.config['SESSION_TYPE'] = 'filesystem'  # Use 'redis' in production
@@ -178,10 +211,29 @@ def create_app():
     # Register the filter with Flask (recommended method)
     app.add_template_filter(unescape_html_filter, 'unescape_html')
 
-    # Serve uploaded files (question/response audio)
+    # Serve uploaded files (question/response audio) with ETag and Range support
     @app.route('/uploads/<path:filename>')
+    @login_required
     def uploaded_file(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        from app.services.media_serving_service import media_server
+        from app.services.media_storage_service import media_store, content_hash
+        directory = filename.split('/', 1)[0]
+        if directory == 'incoming':
+            abort(404)  # Chunked uploads still in progress
+        # Recordings are private: only their owner (or an admin) may play them
+        if directory in PRIVATE_UPLOAD_DIRECTORIES and not media_store.may_read(current_user, f"uploads/{filename}"):
+            abort(404)
+        sha256 = content_hash(f"uploads/{filename}")
+        try:
+            return media_server.send(app.config['UPLOAD_FOLDER'], filename, 'uploads',
+                                     etag=sha256, immutable=sha256 is not None,
+                                     public=directory in PUBLIC_UPLOAD_DIRECTORIES)
+        except NotFound:
+            # Recordings moved into the content-addressed store keep their old URLs
+            moved_to = media_store.resolve(f"uploads/{filename}")
+            if not moved_to:
+                raise
+            return redirect(f"/{moved_to}", code=302)
     
     # Add ngrok-skip-browser-warning header to all responses
     @app.after_request
@@ -239,6 +291,7 @@ def register_blueprints(app):
     from app.blueprints.admin import admin_bp
     from app.blueprints.comments import comments_bp
     from app.blueprints.notifications import notifications_bp
+    from app.blueprints.uploads import uploads_bp
     
     # Import chatbot blueprint (with error handling)
     try:
@@ -256,6 +309,7 @@ def register_blueprints(app):
     app.register_blueprint(practice_mode_bp, url_prefix='/practice')
     app.register_blueprint(comments_bp)
     app.register_blueprint(notifications_bp)
+    app.register_blueprint(uploads_bp)
     app.register_blueprint(admin_bp, url_prefix='/admin')
 
 def create_celery(app=None):
@@ -5,6 +5,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_mail import Mail
+from flask_caching import Cache
 from celery import Celery
 from dotenv import load_dotenv
 
@@ -34,6 +35,29 @@ db = SQLAlchemy()
 login_manager = LoginManager()
 migrate = Migrate()
 mail = Mail()
+cache = Cache()
+
+# Pre-2.0 Flask-Caching backend names still used in env files
+LEGACY_CACHE_TYPES = {'simple': 'SimpleCache', 'redis': 'RedisCache', 'null': 'NullCache'}
+
+
+def configure_cache(app):
+    """Cache backend from the environment: SimpleCache by default, RedisCache in production
+
+    SimpleCache lives in one process, so with several gunicorn workers
+    (WEB_CONCURRENCY > 1) an invalidation would only reach the worker that made
+    the change; NullCache is used there instead until CACHE_TYPE=RedisCache.
+    """
+    cache_type = os.environ.get('CACHE_TYPE', 'SimpleCache')
+    cache_type = LEGACY_CACHE_TYPES.get(cache_type, cache_type)
+    if cache_type == 'SimpleCache' and int(os.environ.get('WEB_CONCURRENCY') or 1) > 1:
+        app.logger.warning("[Cache] SimpleCache is per process and WEB_CONCURRENCY > 1; "
+                           "caching disabled (set CACHE_TYPE=RedisCache to share it)")
+        cache_type = 'NullCache'
+    app.config['CACHE_TYPE'] = cache_type
+    app.config['CACHE_REDIS_URL'] = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # 5 minutes
+    app.config['CACHE_KEY_PREFIX'] = os.environ.get('CACHE_KEY_PREFIX', 'opic:')
 
 def create_app():
     app = Flask(__name__)
@@ -56,11 +80,15 @@ def create_app():
     app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
     app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
     
+    # Caching configuration
+    configure_cache(app)
+    
     # Initialize extensions with app
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
     mail.init_app(app)
+    cache.init_app(app)
     
     # Configure login manager
     login_manager.login_view = 'auth.login'
@@ -81,6 +109,7 @@ def create_app():
     from app.blueprints.admin import admin_bp
     from app.blueprints.comments import comments_bp
     from app.blueprints.notifications import notifications_bp
+    from app.blueprints.uploads import uploads_bp
     
     # Import chatbot blueprint (with error handling)
     try:
@@ -98,6 +127,7 @@ def create_app():
     app.register_blueprint(practice_mode_bp, url_prefix='/practice')
     app.register_blueprint(comments_bp)
     app.register_blueprint(notifications_bp)
+    app.register_blueprint(uploads_bp)
     app.register_blueprint(admin_bp, url_prefix='/admin')
     
     # User loader for Flask-Login
@@ -7,6 +7,7 @@ from flask_login import login_required, current_user
 from sqlalchemy import or_, desc, asc, func
 from app import db
 from app.models import User, Response as UserResponse, Survey, Tip, Question
+from app.services.search_service import search_index
 from app.utils.pdf_thumbnail import generate_pdf_thumbnail, get_thumbnail_path
 
 admin_bp = Blueprint("admin", __name__, template_folder="../../templates/admin")
@@ -382,14 +383,19 @@ def _apply_question_filters(query, filters):
 
     search = filters.get('q')
     if search:
-        like = f"%{search}%"
-        query = query.filter(
-            or_(
-                Question.topic.ilike(like),
-                Question.text.ilike(like),
-                Question.sample_answer_text.ilike(like)
+        connection = db.session.connection()
+        if search_index.is_ready(connection):
+            query = query.filter(Question.id.in_(search_index.matching_question_ids(connection, search)))
+        else:
+            # Index not built yet (scripts/rebuild_search_index.py): fall back to a scan
+            like = f"%{search}%"
+            query = query.filter(
+                or_(
+                    Question.topic.ilike(like),
+                    Question.text.ilike(like),
+                    Question.sample_answer_text.ilike(like)
+                )
             )
-        )
 
     return query
 
@@ -605,6 +611,24 @@ def questions_api():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@admin_bp.route("/search/api", methods=['GET'])
+@login_required
+@admin_required
+def search_api():
+    """Ranked full-text search across all languages, including comments"""
+    connection = db.session.connection()
+    if not search_index.is_ready(connection):
+        return jsonify({'success': False, 'error': 'Search index has not been built.'}), 503
+
+    kinds = request.args.getlist('kind') or None
+    results = search_index.search(
+        connection, request.args.get('q', ''), kinds=kinds,
+        language=_clean_str(request.args.get('language')),
+        limit=request.args.get('limit', 20, type=int)
+    )
+    return jsonify({'success': True, 'results': results})
+
+
 @admin_bp.route("/questions/api/<int:question_id>", methods=['GET', 'PUT', 'DELETE'])
 @login_required
 @admin_required
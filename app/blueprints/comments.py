@@ -1,17 +1,15 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import login_required, current_user
 from app import db
-from app.models import Comment, CommentLike, Question, User
+from app.models import Comment, Question, User
+from app.services.comment_service import comment_like_service, comment_thread_loader
+from app.services.notification_service import notification_outbox, unread_counter
+from app.services.media_storage_service import media_store
 from datetime import datetime
 import os
-import time
-from werkzeug.utils import secure_filename
 
 comments_bp = Blueprint('comments', __name__, url_prefix='/api/comments')
 
-# Import notification helper
-from app.blueprints.notifications import create_mention_notifications
-
 
 @comments_bp.route('/test-auth', methods=['GET'])
 @login_required
@@ -29,41 +27,30 @@ def test_auth():
 @comments_bp.route('/question/<int:question_id>', methods=['GET'])
 @login_required
 def get_comments(question_id):
-    """Get all comments for a question"""
+    """Get a page of comment threads for a question
+    
+    Pages are keyset-paginated: pass the `next_cursor` of the previous page
+    as `cursor` to continue with the same sort.
+    """
     try:
         sort_by = request.args.get('sort', 'recent')  # 'recent' or 'popular'
-        offset = int(request.args.get('offset', 0))
-        limit = int(request.args.get('limit', 10))
-        
-        # Base query for top-level comments (no parent)
-        query = Comment.query.filter_by(question_id=question_id, parent_id=None)
-        
-        # Sort (pinned comments always appear first)
-        if sort_by == 'popular':
-            query = query.order_by(Comment.is_pinned.desc(), Comment.likes_count.desc(), Comment.created_at.desc())
-        else:  # recent
-            query = query.order_by(Comment.is_pinned.desc(), Comment.created_at.desc())
-        
-        # Paginate
-        total = query.count()
-        comments = query.offset(offset).limit(limit).all()
-        
-        # Convert to dict and include replies
-        comments_data = []
-        for comment in comments:
-            comment_dict = comment.to_dict(current_user_id=current_user.id)
-            
-            # Get replies for this comment
-            replies = Comment.query.filter_by(parent_id=comment.id).order_by(Comment.created_at.asc()).all()
-            comment_dict['replies'] = [reply.to_dict(current_user_id=current_user.id) for reply in replies]
-            
-            comments_data.append(comment_dict)
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', 10, type=int)
+        
+        # Top-level comments, replies, authors and likes in a fixed number of queries
+        try:
+            comments_data, next_cursor, total = comment_thread_loader.load_page(
+                question_id, sort_by=sort_by, cursor=cursor, limit=limit, current_user_id=current_user.id
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         return jsonify({
             'success': True,
             'comments': comments_data,
             'total': total,
-            'has_more': (offset + limit) < total
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         }), 200
         
     except Exception as e:
@@ -107,12 +94,8 @@ def post_comment(question_id):
             if file_ext not in allowed_extensions:
                 return jsonify({'success': False, 'error': f'Invalid file type. Allowed: {", ".join(allowed_extensions)}'}), 400
             
-            # Save audio file
-            filename = secure_filename(f"comment_{current_user.id}_{question_id}_{int(time.time())}{file_ext}")
-            upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'comments', filename)
-            os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-            audio_file.save(upload_path)
-            audio_url = f"uploads/comments/{filename}"
+            # Save audio file (content-addressed, identical files stored once)
+            audio_url = media_store.save_upload(audio_file, file_ext)
         
         # Create comment (supports UTF-8, emojis, special characters)
         comment = Comment(
@@ -123,10 +106,12 @@ def post_comment(question_id):
         )
         
         db.session.add(comment)
-        db.session.commit()
+        db.session.flush()  # Assigns comment.id for the notifications
         
-        # Create notifications for mentions
-        create_mention_notifications(comment, content)
+        # Notify mentioned users in the same transaction
+        notification_outbox.notify_mentions(comment, current_user.id)
+        
+        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -176,12 +161,8 @@ def post_reply(comment_id):
             if file_ext not in allowed_extensions:
                 return jsonify({'success': False, 'error': f'Invalid file type. Allowed: {", ".join(allowed_extensions)}'}), 400
             
-            # Save audio file
-            filename = secure_filename(f"reply_{current_user.id}_{comment_id}_{int(time.time())}{file_ext}")
-            upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'comments', filename)
-            os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-            audio_file.save(upload_path)
-            audio_url = f"uploads/comments/{filename}"
+            # Save audio file (content-addressed, identical files stored once)
+            audio_url = media_store.save_upload(audio_file, file_ext)
         
         # Create reply (supports UTF-8, emojis, special characters)
         reply = Comment(
@@ -196,24 +177,14 @@ def post_reply(comment_id):
         
         # Update parent's replies count
         parent_comment.replies_count += 1
+        db.session.flush()  # Assigns reply.id for the notifications
         
-        db.session.commit()
+        # Notify mentioned users and the parent comment author (never yourself)
+        notification_outbox.notify_mentions(reply, current_user.id)
+        notification_outbox.notify([parent_comment.user_id], current_user.id, 'reply',
+                                   reply.question_id, reply.id)
         
-        # Create notifications for mentions
-        create_mention_notifications(reply, content)
-        
-        # Create notification for the parent comment author (if not replying to self)
-        if parent_comment.user_id != current_user.id:
-            from app.models import Notification
-            notification = Notification(
-                user_id=parent_comment.user_id,
-                actor_id=current_user.id,
-                type='reply',
-                comment_id=reply.id,
-                question_id=reply.question_id
-            )
-            db.session.add(notification)
-            db.session.commit()
+        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -229,59 +200,40 @@ def post_reply(comment_id):
 @comments_bp.route('/<int:comment_id>/like', methods=['POST'])
 @login_required
 def like_comment(comment_id):
-    """Like or unlike a comment"""
+    """Like or unlike a comment
+    
+    Send {"action": "like"} or {"action": "unlike"} to set the state
+    idempotently (two statements under any contention); without an action
+    the current state is toggled.
+    """
     try:
-        from app.models import Notification
-        
-        comment = Comment.query.get(comment_id)
-        if not comment:
+        data = request.get_json(silent=True) or {}
+        action = data.get('action')
+        if action not in ('like', 'unlike', None):
+            return jsonify({'success': False, 'error': 'Invalid action'}), 400
+        if action is None:
+            action = 'unlike' if comment_like_service.has_liked(comment_id, current_user.id) else 'like'
+        liked = action == 'like'
+        
+        result = comment_like_service.set_like(comment_id, current_user.id, liked)
+        if result is None:
+            db.session.rollback()
             return jsonify({'success': False, 'error': 'Comment not found'}), 404
+        likes_count, changed, author_id, question_id = result
         
-        # Check if already liked
-        existing_like = CommentLike.query.filter_by(
-            comment_id=comment_id,
-            user_id=current_user.id
-        ).first()
-        
-        if existing_like:
-            # Unlike
-            db.session.delete(existing_like)
-            comment.likes_count = max(0, comment.likes_count - 1)
-            action = 'unliked'
-            
-            # Delete like notification
-            Notification.query.filter_by(
-                comment_id=comment_id,
-                actor_id=current_user.id,
-                type='like'
-            ).delete()
-        else:
-            # Like
-            like = CommentLike(
-                comment_id=comment_id,
-                user_id=current_user.id
-            )
-            db.session.add(like)
-            comment.likes_count += 1
-            action = 'liked'
-            
-            # Create notification (don't notify if user likes own comment)
-            if comment.user_id != current_user.id:
-                notification = Notification(
-                    user_id=comment.user_id,
-                    actor_id=current_user.id,
-                    type='like',
-                    comment_id=comment_id,
-                    question_id=comment.question_id
-                )
-                db.session.add(notification)
+        # Only a real state change touches the author's notification
+        if changed and liked:
+            notification_outbox.notify([author_id], current_user.id, 'like', question_id, comment_id)
+        elif changed:
+            notification_outbox.retract(author_id, current_user.id, 'like', comment_id)
         
         db.session.commit()
         
         return jsonify({
             'success': True,
-            'action': action,
-            'likes_count': comment.likes_count
+            'action': 'liked' if liked else 'unliked',
+            'likes_count': likes_count,
+            'user_has_liked': liked
         }), 200
         
     except Exception as e:
@@ -339,8 +291,11 @@ def delete_comment(comment_id):
         if comment.user_id != current_user.id and not current_user.is_admin:
             return jsonify({'success': False, 'error': 'Unauthorized'}), 403
         
-        # Delete related notifications first
+        # Delete related notifications first, then recount their recipients' unread counters
+        recipients = [user_id for (user_id,) in Notification.query.with_entities(Notification.user_id)
+                      .filter_by(comment_id=comment_id).distinct()]
         Notification.query.filter_by(comment_id=comment_id).delete()
+        unread_counter.refresh(recipients)
         
         # If it's a reply, update parent's replies count
         if comment.parent_id:
@@ -371,6 +326,13 @@ def toggle_pin(comment_id):
             return jsonify({'success': False, 'error': 'Comment not found'}), 404
         
         comment.is_pinned = not comment.is_pinned
+        
+        # Let the author know their comment was pinned
+        if comment.is_pinned:
+            notification_outbox.notify([comment.user_id], current_user.id, 'pin',
+                                       comment.question_id, comment_id)
+        else:
+            notification_outbox.retract(comment.user_id, current_user.id, 'pin', comment_id)
         db.session.commit()
         
         action = 'pinned' if comment.is_pinned else 'unpinned'
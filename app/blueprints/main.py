@@ -3,9 +3,10 @@ Main Blueprint
 Handles main application routes
 """
 
-from flask import Blueprint, send_from_directory
+from flask import Blueprint
 from flask_login import login_required
 from app.controllers import MainController
+from app.services.media_serving_service import media_server
 import os
 
 # Create blueprint
@@ -105,20 +106,10 @@ def serve_file(filename):
         # Determine if this is a download request
         download = request.args.get('download', 'false').lower() == 'true'
         
-        # Serve the file
-        response = send_from_directory(files_dir, safe_filename, as_attachment=download)
-        
-        # Set proper headers
-        response.headers['Content-Type'] = 'application/pdf'
-        if download:
-            response.headers['Content-Disposition'] = f'attachment; filename="{safe_filename}"'
-        else:
-            response.headers['Content-Disposition'] = f'inline; filename="{safe_filename}"'
-        
-        # Allow caching
-        response.headers['Cache-Control'] = 'public, max-age=3600'
-        
-        return response
+        # Serve the file (ETag, Range requests, optional X-Accel-Redirect/X-Sendfile offload)
+        return media_server.send(files_dir, safe_filename, 'files', mimetype='application/pdf',
+                                 max_age=3600, as_attachment=download, download_name=safe_filename,
+                                 public=True)
     except Exception as e:
         current_app.logger.error(f"Error serving PDF file {filename}: {e}")
         import traceback
@@ -186,6 +177,21 @@ def upload_avatar():
 def history():
     return main_controller.history()
 
+@main_bp.route('/progress/api')
+@login_required
+def progress_api():
+    return main_controller.progress_api()
+
+@main_bp.route('/history/api')
+@login_required
+def history_api():
+    return main_controller.history_api()
+
+@main_bp.route('/search/api')
+@login_required
+def search_api():
+    return main_controller.search_api()
+
 @main_bp.route('/update-levels', methods=['POST'])
 @login_required
 def update_levels():
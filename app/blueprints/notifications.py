@@ -1,8 +1,11 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, current_app, session
 from flask_login import login_required, current_user
 from app import db
 from app.models import Notification
-import re
+from app.services.notification_service import notification_feed, unread_counter
+from app.services.push_service import notification_broker
+import json
+import time
 
 notifications_bp = Blueprint('notifications', __name__, url_prefix='/api/notifications')
 
@@ -10,57 +13,32 @@ notifications_bp = Blueprint('notifications', __name__, url_prefix='/api/notific
 @notifications_bp.route('/', methods=['GET'])
 @login_required
 def get_notifications():
-    """Get all notifications for the current user"""
+    """Get notifications for the current user (read-only; expired ones are purged by a scheduled job)"""
     try:
-        from datetime import datetime, timedelta
-        
         limit = int(request.args.get('limit', 20))
         offset = int(request.args.get('offset', 0))
         unread_only = request.args.get('unread_only', 'false').lower() == 'true'
         read_only = request.args.get('read_only', 'false').lower() == 'true'
         
-        print(f"[Notifications API] User {current_user.id} ({current_user.username}) requesting notifications (offset={offset}, limit={limit}, unread_only={unread_only}, read_only={read_only})")
-        
-        # Auto-delete notifications older than 30 days
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        deleted_count = Notification.query.filter(
-            Notification.user_id == current_user.id,
-            Notification.created_at < thirty_days_ago
-        ).delete()
-        if deleted_count > 0:
-            db.session.commit()
-            print(f"[Notifications API] Deleted {deleted_count} old notifications (>30 days)")
-        
-        # Base query
-        query = Notification.query.filter_by(user_id=current_user.id)
-        
-        if unread_only:
-            query = query.filter_by(is_read=False)
-        elif read_only:
-            query = query.filter_by(is_read=True)
-        
-        # Order by most recent first
-        query = query.order_by(Notification.created_at.desc())
-        
-        # Get total count
-        total = query.count()
-        unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-        
-        # Paginate
-        notifications = query.offset(offset).limit(limit).all()
-        
-        print(f"[Notifications API] Found {len(notifications)} notifications, {unread_count} unread, {total} total")
+        # Notifications past the retention window are hidden until the purge job removes them;
+        # one joined query serializes the whole page
+        is_read = False if unread_only else True if read_only else None
+        notifications, total = notification_feed.page(current_user.id, is_read=is_read,
+                                                      offset=offset, limit=limit)
+        unread_count = current_user.unread_notifications or 0
+        current_app.logger.debug("[Notifications API] user %s: %d of %d notifications, %d unread",
+                                 current_user.id, len(notifications), total, unread_count)
         
         return jsonify({
             'success': True,
-            'notifications': [n.to_dict() for n in notifications],
+            'notifications': notifications,
             'total': total,
             'unread_count': unread_count,
             'has_more': (offset + limit) < total
         }), 200
         
     except Exception as e:
-        print(f"[Notifications API] Error: {e}")
+        current_app.logger.exception("[Notifications API] Error listing notifications: %s", e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -80,12 +58,9 @@ def mark_as_read(notification_id):
         notification.is_read = True
         db.session.commit()
         
-        # Get updated unread count
-        unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-        
         return jsonify({
             'success': True,
-            'unread_count': unread_count
+            'unread_count': current_user.unread_notifications or 0
         }), 200
         
     except Exception as e:
@@ -99,6 +74,7 @@ def mark_all_as_read():
     """Mark all notifications as read"""
     try:
         Notification.query.filter_by(user_id=current_user.id, is_read=False).update({'is_read': True})
+        unread_counter.refresh([current_user.id])
         db.session.commit()
         
         return jsonify({'success': True, 'unread_count': 0}), 200
@@ -108,61 +84,69 @@ def mark_all_as_read():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def extract_mentions(text):
-    """Extract @mentions from text"""
-    # Find all @username patterns (supports dots, underscores, hyphens)
-    mentions = re.findall(r'@([\w.-]+)', text)
-    return list(set(mentions))  # Remove duplicates
+def _session_unread_count():
+    """(user id, unread count) for the signed session's user without loading the user row
+
+    The count comes from the cache kept current by the notification outbox;
+    (None, None) when nobody is signed in or the user no longer exists.
+    """
+    user_id = session.get('_user_id')
+    if not user_id:
+        return None, None
+    count = unread_counter.cached(int(user_id))
+    return (int(user_id), count) if count is not None else (None, None)
 
 
-def create_mention_notifications(comment, content):
-    """Create notifications for mentioned users"""
-    from app.models import User
+@notifications_bp.route('/unread-count', methods=['GET'])
+def unread_count():
+    """Unread badge count from the cached counter (no COUNT query, no user row)"""
+    _, count = _session_unread_count()
+    if count is None:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+    return jsonify({'success': True, 'unread_count': count}), 200
+
+
+@notifications_bp.route('/stream', methods=['GET'])
+def stream():
+    """Server-Sent Events stream of unread-count changes for the current user
     
-    mentions = extract_mentions(content)
-    print(f"[Mentions] Extracted mentions from content: {mentions}")
+    Authenticates from the signed session and the cached unread counter
+    (sent as the first event), so connecting and reconnecting normally cost
+    no query and an idle stream holds no pooled connection. Each stream ends after
+    NOTIFICATION_STREAM_SECONDS (kept below the worker timeout); EventSource
+    reconnects on its own. Needs threaded or async workers in production,
+    see NOTIFICATION_PUSH_ENABLED.
+    """
+    if not current_app.config.get('NOTIFICATION_PUSH_ENABLED'):
+        return jsonify({'success': False, 'error': 'Push notifications are disabled'}), 404
+    user_id, count = _session_unread_count()
+    if user_id is None:
+        return jsonify({'success': False, 'error': 'Authentication required'}), 401
+    db.session.remove()
     
-    if not mentions:
-        print("[Mentions] No mentions found")
-        return
+    subscription = notification_broker.subscribe(user_id)
+    duration = current_app.config.get('NOTIFICATION_STREAM_SECONDS', 55)
+    keepalive = current_app.config.get('NOTIFICATION_KEEPALIVE_SECONDS', 20)
     
-    # Get users by username
-    for username in mentions:
-        user = User.query.filter_by(username=username).first()
-        if not user:
-            print(f"[Mentions] User @{username} not found")
-            continue
-            
-        if user.id == current_user.id:
-            print(f"[Mentions] Skipping self-mention for @{username}")
-            continue
-        
-        # Check if notification already exists
-        existing = Notification.query.filter_by(
-            user_id=user.id,
-            actor_id=current_user.id,
-            type='mention',
-            comment_id=comment.id
-        ).first()
-        
-        if existing:
-            print(f"[Mentions] Notification already exists for @{username}")
-            continue
-        
-        notification = Notification(
-            user_id=user.id,
-            actor_id=current_user.id,
-            type='mention',
-            comment_id=comment.id,
-            question_id=comment.question_id
-        )
-        db.session.add(notification)
-        print(f"[Mentions] Created notification for user {user.id} (@{username})")
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            yield f'event: unread\ndata: {json.dumps({"unread_count": count})}\n\n'
+            deadline = time.monotonic() + duration
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                event = subscription.get(timeout=min(keepalive, remaining))
+                if event is None:
+                    yield ': keepalive\n\n'
+                else:
+                    yield f'event: unread\ndata: {json.dumps(event)}\n\n'
+        finally:
+            notification_broker.unsubscribe(subscription)
     
-    try:
-        db.session.commit()
-        print("[Mentions] Notifications committed successfully")
-    except Exception as e:
-        db.session.rollback()
-        print(f"[Mentions] Error creating notifications: {e}")
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Don't let nginx buffer the stream
+    })
 
@@ -34,6 +34,11 @@ def question(question_id):
 def record_practice_response(question_id):
     return practice_mode_controller.record_practice_response(question_id)
 
+@practice_mode_bp.route('/topics')
+@login_required
+def get_all_topics():
+    return practice_mode_controller.get_all_topics()
+
 @practice_mode_bp.route('/topics/<level>')
 @login_required
 def get_topics_by_level(level):
@@ -0,0 +1,60 @@
+"""
+Uploads Blueprint
+Resumable chunked upload protocol for response recordings:
+
+    POST /api/uploads                     {"size": N}  -> upload_id, chunk_size
+    PUT  /api/uploads/<id>?offset=N       raw chunk    -> new offset (409 + offset on mismatch)
+    GET  /api/uploads/<id>                             -> bytes received so far
+
+The finished upload is handed to the normal response endpoints with the
+form fields upload_id and sha256, which verify and store it.
+"""
+from flask import Blueprint, request, jsonify
+from flask_login import login_required, current_user
+from app.services.upload_service import chunked_uploads, UploadError
+
+uploads_bp = Blueprint('uploads', __name__, url_prefix='/api/uploads')
+
+
+def _error(e: UploadError):
+    payload = {'success': False, 'error': str(e)}
+    if e.offset is not None:
+        payload['offset'] = e.offset
+    return jsonify(payload), e.status
+
+
+@uploads_bp.route('', methods=['POST'])
+@login_required
+def create_upload():
+    """Open a resumable upload"""
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = chunked_uploads.create(current_user.id, data.get('size'))
+    except UploadError as e:
+        return _error(e)
+    return jsonify(dict(upload, success=True)), 201
+
+
+@uploads_bp.route('/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    """Current offset of an upload"""
+    try:
+        return jsonify(dict(chunked_uploads.status(upload_id, current_user.id), success=True))
+    except UploadError as e:
+        return _error(e)
+
+
+@uploads_bp.route('/<upload_id>', methods=['PUT'])
+@login_required
+def append_chunk(upload_id):
+    """Append one chunk; the body is the raw bytes starting at ?offset="""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'success': False, 'error': 'offset is required'}), 400
+    try:
+        new_offset = chunked_uploads.append(upload_id, current_user.id, offset,
+                                            request.stream, request.content_length)
+    except UploadError as e:
+        return _error(e)
+    return jsonify({'success': True, 'offset': new_offset})
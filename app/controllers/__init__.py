@@ -5,15 +5,25 @@ Contains route handlers and controllers following OOP principles
 
 from flask import render_template, request, redirect, url_for, flash, jsonify, current_app, session
 from flask_login import login_user, logout_user, login_required, current_user
-from datetime import date
-import time
 import random
 import requests
 import os
+import json
 
 from app import db
-from app.services import AuthService, UserService, QuestionService, ResponseService, SurveyService
-from app.models import Survey
+from app.services import AuthService, UserService, QuestionService, ResponseService, SurveyService, TestSessionService
+from app.services.sampling_service import RecentQuestions
+from app.services.scheduler_service import coverage_service, practice_scheduler
+from app.services.progress_service import progress_service, SERIES_RANGES
+from app.services.cache_service import user_cache
+from app.services.search_service import search_index
+from app.services.upload_service import chunked_uploads, UploadError
+from app.services.audio_features_service import audio_feature_extractor
+from app.services.media_storage_service import media_store
+from app.models import Survey, now_hanoi
+
+# Surveys listed on the history page (the stat card shows the full count)
+HISTORY_SURVEY_LIMIT = 20
 
 
 class BaseController:
@@ -24,6 +34,47 @@ class BaseController:
         self.user_service = UserService()
         self.question_service = QuestionService()
         self.response_service = ResponseService()
+        self.test_session_service = TestSessionService()
+    
+    def _audio_features(self, response):
+        """Prosody features for AI scoring
+        
+        Computed on the server from the stored recording. When that fails
+        (e.g. no ffmpeg on this host) the response is scored without them and
+        nothing is stored; the queued media job fills them in later.
+        Features sent by the browser are never used.
+        """
+        try:
+            return audio_feature_extractor.features_for(response)
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Audio features unavailable for response {response.id}: {e}")
+            return None
+    
+    def _save_recording(self):
+        """Store the submitted recording in the media store and return its audio_url
+        
+        Accepts a finished chunked upload (form fields upload_id and sha256)
+        or a whole file in the 'audio' field. Returns None when neither was
+        sent; raises UploadError when the chunked upload does not verify.
+        """
+        upload_id = request.form.get('upload_id')
+        if upload_id:
+            sha256 = request.form.get('sha256')
+            data_path = chunked_uploads.finalize(upload_id, current_user.id, sha256)
+            # Keep the upload until the response is saved (see _discard_upload) so a failed save can be retried
+            return media_store.store(data_path, '.webm', sha256=sha256, move=False)
+        
+        audio_file = request.files.get('audio')
+        if not audio_file:
+            return None
+        return media_store.save_upload(audio_file, '.webm')
+    
+    def _discard_upload(self):
+        """Delete the chunked upload a saved response was stored from"""
+        upload_id = request.form.get('upload_id')
+        if upload_id:
+            chunked_uploads.discard(upload_id, current_user.id)
 
 
 class AuthController(BaseController):
@@ -129,18 +180,13 @@ class MainController(BaseController):
     
     @login_required
     def dashboard(self):
-        """Handle dashboard request"""
+        """Handle dashboard request (read-only; streaks are updated when responses are saved)"""
         # Get user statistics
-        user_stats = self.user_service.get_user_statistics(current_user.id)
+        user_stats = self.user_service.get_user_statistics(current_user.id, include_recent=True)
         
         # Get total questions count
         total_questions = self.question_service.get_all_questions_count()
         
-        # Update user streak if needed
-        if current_user.last_active_date != date.today():
-            self.user_service.update_user_streak(current_user)
-            user_stats = self.user_service.get_user_statistics(current_user.id)
-        
         # Get streak status and active status
         streak_status = current_user.check_streak_status()
         is_active_today = current_user.is_active_today()
@@ -313,7 +359,7 @@ class MainController(BaseController):
             return redirect(url_for('main.profile'))
         
         # GET request - show profile form
-        user_stats = self.user_service.get_user_statistics(current_user.id)
+        user_stats = self.user_service.get_user_statistics(current_user.id, include_recent=True)
         return render_template('main/profile.html', user_stats=user_stats)
     
     @login_required
@@ -475,88 +521,121 @@ class MainController(BaseController):
     
     @login_required
     def history(self):
-        """Handle user history/activity page"""
-        from collections import defaultdict
-        from datetime import datetime, timedelta
+        """Handle user history/activity page
         
-        # Get all user responses with related question data
-        responses = self.response_service.get_user_responses(current_user.id, limit=None)
-        
-        # Get user surveys
+        The timeline itself is loaded page by page from history_api; only the
+        latest surveys are listed.
+        """
+        survey_count = Survey.query.filter_by(user_id=current_user.id).count()
         surveys = Survey.query.filter_by(user_id=current_user.id)\
-            .order_by(Survey.created_at.desc()).all()
-        
-        # Get user statistics
+            .order_by(Survey.created_at.desc()).limit(HISTORY_SURVEY_LIMIT).all()
         user_stats = self.user_service.get_user_statistics(current_user.id)
+        active_days = self.response_service.count_active_days(current_user.id)
         
-        # Separate practice and test responses
-        practice_responses = [r for r in responses if r.mode == 'practice']
-        test_responses = [r for r in responses if r.mode == 'test']
+        return render_template('main/history.html',
+                             surveys=surveys,
+                             survey_count=survey_count,
+                             user_stats=user_stats,
+                             active_days=active_days)
+    
+    @login_required
+    def progress_api(self):
+        """Return the user's daily progress series for the last 7, 30 or 90 days"""
+        days = request.args.get('days', 30, type=int)
+        if days not in SERIES_RANGES:
+            return jsonify({'success': False, 'error': 'days must be one of 7, 30 or 90'}), 400
+        
+        # Keyed by day as well, since the window moves at midnight
+        today = now_hanoi().date().isoformat()
+        data = user_cache.get_or_set(
+            current_user.id, f'progress:{days}:{today}',
+            lambda: progress_service.get_series(current_user.id, days)
+        )
+        return jsonify(dict(data, success=True))
+    
+    @login_required
+    def history_api(self):
+        """Return one page of the activity timeline as JSON, grouped by date"""
+        import html
         
-        # Group test responses into sessions (responses within 2 hours are considered same session)
-        test_sessions = []
-        if test_responses:
-            # Sort test responses by date
-            test_responses.sort(key=lambda x: x.created_at)
-            
-            current_session = []
-            last_time = None
-            
-            for response in test_responses:
-                if not last_time or (response.created_at - last_time) < timedelta(hours=2):
-                    current_session.append(response)
-                else:
-                    # Start new session
-                    if current_session:
-                        test_sessions.append(current_session)
-                    current_session = [response]
-                last_time = response.created_at
-            
-            # Add the last session
-            if current_session:
-                test_sessions.append(current_session)
+        limit = min(max(request.args.get('limit', 30, type=int), 1), 100)
+        try:
+            responses, next_cursor = self.response_service.get_history_page(
+                current_user.id, limit=limit, cursor=request.args.get('cursor')
+            )
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
         
-        # Group everything by date for timeline display
-        responses_by_date = defaultdict(list)
+        # Test sessions (and their surveys) referenced on this page, in one query
+        test_sessions = self.test_session_service.get_sessions(
+            [response.test_session_id for response in responses if response.mode == 'test']
+        )
         
-        # Add practice responses
-        for response in practice_responses:
+        days = []
+        for response in responses:
             date_key = response.created_at.strftime('%Y-%m-%d')
-            responses_by_date[date_key].append(response)
-        
-        # Add test sessions as grouped entries
-        for session in test_sessions:
-            if session:
-                # Use the first response's date as the session date
-                date_key = session[0].created_at.strftime('%Y-%m-%d')
-                
-                # Find the matching survey (closest one by time)
-                session_survey = None
-                for survey in surveys:
-                    if survey.created_at.date() == session[0].created_at.date():
-                        session_survey = survey
-                        break
-                
-                # Create a test session entry
-                test_session_entry = {
-                    'type': 'test_session',
-                    'responses': session,
-                    'start_time': session[0].created_at,
-                    'survey': session_survey
+            if not days or days[-1]['date'] != date_key:
+                days.append({'date': date_key, 'items': []})
+            
+            question = response.question
+            item = {
+                'id': response.id,
+                'mode': response.mode,
+                'created_at': response.created_at.isoformat(),
+                'time': response.created_at.strftime('%H:%M'),
+                'duration': response.duration,
+                'audio_url': response.audio_url,
+                'question': {
+                    'id': question.id,
+                    'topic': question.topic,
+                    'text': html.unescape(question.text or ''),
+                    'language': question.language,
+                    'difficulty_level': question.difficulty_level
+                } if question else None
+            }
+            test_session = test_sessions.get(response.test_session_id)
+            if test_session:
+                survey = test_session.survey
+                item['test_session'] = {
+                    'id': test_session.id,
+                    'response_count': test_session.response_count,
+                    'survey': {
+                        'self_assessment': (survey.answers or {}).get('self_assessment'),
+                        'activities_count': len((survey.answers or {}).get('activities') or [])
+                    } if survey else None
                 }
-                responses_by_date[date_key].append(test_session_entry)
-        
-        # Sort items within each date by time
-        for date_key in responses_by_date:
-            responses_by_date[date_key].sort(key=lambda x: 
-                x.created_at if hasattr(x, 'created_at') else x['start_time'], 
-                reverse=True)
+            days[-1]['items'].append(item)
+        
+        return jsonify({
+            'success': True,
+            'days': days,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        })
+    
+    @login_required
+    def search_api(self):
+        """Ranked full-text search over questions, sample answers and comments in the user's language"""
+        query = (request.args.get('q') or '').strip()
+        kind = request.args.get('kind', 'all')
+        kinds = {'all': None, 'questions': ('question', 'answer'), 'comments': ('comment',)}
+        if kind not in kinds:
+            return jsonify({'success': False, 'error': 'kind must be one of all, questions or comments'}), 400
+        
+        connection = db.session.connection()
+        if not search_index.is_ready(connection):
+            return jsonify({'success': False, 'error': 'Search is not available'}), 503
+        
+        results = search_index.search(
+            connection, query, kinds=kinds[kind],
+            language=current_user.target_language or 'english',
+            limit=request.args.get('limit', 20, type=int)
+        )
+        for result in results:
+            anchor = f"#comment-{result['ref_id']}" if result['kind'] == 'comment' else ''
+            result['url'] = url_for('practice_mode.question', question_id=result['question_id']) + anchor
         
-        return render_template('main/history.html',
-                             responses=responses,
-                             responses_by_date=dict(responses_by_date),
-                             surveys=surveys,
-                             user_stats=user_stats)
+        return jsonify({'success': True, 'query': query, 'results': results})
 
 
 class TestModeController(BaseController):
@@ -584,6 +663,10 @@ class TestModeController(BaseController):
             survey = self.survey_service.create_survey(current_user.id, answers)
             
             if survey:
+                # Each survey opens a new test session; recorded responses are linked to it
+                test_session = self.test_session_service.start_session(current_user.id, survey)
+                if test_session:
+                    session['test_session_id'] = test_session.id
                 flash('Survey completed! Please proceed to self-assessment.', 'success')
                 return redirect(url_for('test_mode.self_assessment'))
             else:
@@ -661,6 +744,16 @@ class TestModeController(BaseController):
                              current_question_index=question_number,
                              total_questions=len(questions))
     
+    def _current_test_session(self):
+        """Test session the user is taking, started from the latest survey if missing"""
+        test_session = self.test_session_service.get_session(session.get('test_session_id'), current_user.id)
+        if test_session is None:
+            survey = self.survey_service.get_user_survey(current_user.id)
+            test_session = self.test_session_service.start_session(current_user.id, survey)
+            if test_session:
+                session['test_session_id'] = test_session.id
+        return test_session
+    
     def get_personalized_questions(self, survey_answers):
         """Get personalized questions based on survey answers and self-assessment level"""
         # Handle both dict and JSON types
@@ -767,7 +860,8 @@ class TestModeController(BaseController):
             random_questions = self.question_service.get_random_questions_by_level(
                 (target_count - len(questions)) * 2,  # Request 2x to have buffer
                 'english',
-                level=english_level
+                level=english_level,
+                exclude_ids=[q.id for q in questions]
             )
             for q in random_questions:
                 if len(questions) >= target_count:
@@ -802,31 +896,26 @@ class TestModeController(BaseController):
         """Handle response recording"""
         if request.method == 'POST':
             try:
-                # Get the uploaded audio file
-                audio_file = request.files.get('audio')
-                
-                if not audio_file:
+                # Save the recording (chunked upload or single file)
+                try:
+                    audio_url = self._save_recording()
+                except UploadError as e:
+                    return jsonify({'success': False, 'error': str(e)}), e.status
+                if not audio_url:
                     return jsonify({'success': False, 'error': 'No audio file provided'})
                 
-                # Save the audio file
-                import os
-                from werkzeug.utils import secure_filename
-                
-                filename = secure_filename(f"response_{current_user.id}_{question_id}_{int(time.time())}.webm")
-                upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'responses', filename)
-                
-                os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-                audio_file.save(upload_path)
-                
-                # Save response to database with mode='test'
+                # Save response to database with mode='test', linked to the current test session
+                test_session = self._current_test_session()
                 response = self.response_service.create_response(
                     user_id=current_user.id,
                     question_id=question_id,
-                    audio_url=f"uploads/responses/{filename}",
-                    mode='test'
+                    audio_url=audio_url,
+                    mode='test',
+                    test_session_id=test_session.id if test_session else None
                 )
                 
                 if response:
+                    self._discard_upload()
                     return jsonify({'success': True, 'response_id': response.id})
                 else:
                     return jsonify({'success': False, 'error': 'Failed to save response'})
@@ -840,8 +929,8 @@ class TestModeController(BaseController):
     @login_required
     def finish_test(self):
         """Handle test completion"""
-        # Update user streak
-        self.user_service.update_user_streak(current_user)
+        test_session = self.test_session_service.get_session(session.get('test_session_id'), current_user.id)
+        self.test_session_service.finish_session(test_session)
         
         # Redirect to congratulations page
         return redirect(url_for('test_mode.congratulations'))
@@ -852,19 +941,11 @@ class TestModeController(BaseController):
         # Get user statistics
         user_stats = self.user_service.get_user_statistics(current_user.id)
         
-        # Get the most recent test session (responses from last 2 hours)
-        from datetime import datetime, timedelta
-        from app.models import Response
-        
-        cutoff_time = datetime.utcnow() - timedelta(hours=2)
-        recent_test_responses = Response.query.filter(
-            Response.user_id == current_user.id,
-            Response.mode == 'test',
-            Response.created_at >= cutoff_time
-        ).count()
+        # The session just finished keeps its response counter
+        test_session = self.test_session_service.get_session(session.get('test_session_id'), current_user.id)
         
         test_data = {
-            'question_count': recent_test_responses,
+            'question_count': test_session.response_count if test_session else 0,
             'streak_count': current_user.current_streak,
             'total_tests': user_stats.get('test_responses_count', 0)
         }
@@ -904,18 +985,8 @@ class TestModeController(BaseController):
                     })
                 transcript = response.transcript
             
-            # Get audio features for tone/prosody evaluation
-            audio_features = None
-            if request.is_json:
-                audio_features = request.json.get('audio_features')
-            else:
-                audio_features_str = request.form.get('audio_features')
-                if audio_features_str:
-                    try:
-                        import json
-                        audio_features = json.loads(audio_features_str)
-                    except:
-                        audio_features = None
+            # Prosody features computed server-side from the recording (stored with the response)
+            audio_features = self._audio_features(response)
             
             # Get question text - prefer full text, fallback to topic
             question_text = response.question.text
@@ -940,12 +1011,14 @@ class TestModeController(BaseController):
             
             # Save AI results to database
             response.transcript = transcript
+            previous_score = response.ai_score
             response.ai_score = ai_result.get('score', 50)
             response.ai_feedback = ai_result.get('feedback', '')
             response.ai_data = json.dumps({
                 'strengths': ai_result.get('strengths', []),
                 'suggestions': ai_result.get('suggestions', [])
             })
+            coverage_service.record_score(response.user_id, response.question, response.ai_score, previous_score)
             
             db.session.commit()
             
@@ -976,17 +1049,44 @@ class PracticeModeController(BaseController):
         user_stats = self.user_service.get_user_statistics(current_user.id)
         return render_template('practice_mode/index.html', user_stats=user_stats)
     
+    TOPIC_LEVELS = ['IM', 'IH', 'AL']
+    
+    def _cached_topics_response(self, levels, build_payload):
+        """JSON topics response with a strong ETag derived from the question catalog version
+        
+        Browsers revalidate with If-None-Match and get a body-less 304 until
+        the question bank changes, so level switching costs nothing.
+        """
+        language = current_user.target_language or 'english'
+        version, topics = self.question_service.get_topics_by_levels(language, levels)
+        
+        # A negative version means the catalog counter is unavailable; don't cache then
+        etag = f"topics-v{version}-{language}-{'-'.join(levels)}" if version >= 0 else None
+        if etag and request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+        else:
+            response = jsonify(build_payload(topics))
+        
+        if etag:
+            response.set_etag(etag)
+            response.cache_control.private = True
+            response.cache_control.max_age = int(current_app.config.get('TOPICS_CACHE_MAX_AGE', 60))
+        else:
+            response.cache_control.no_store = True
+        return response
+    
     @login_required
     def get_topics_by_level(self, level):
         """Return topics available for a specific level as JSON"""
-        if level not in ['IM', 'IH', 'AL']:
+        if level not in self.TOPIC_LEVELS:
             return jsonify({'topics': [], 'error': 'Invalid level'})
         
-        topics = self.question_service.get_all_topics(
-            language=current_user.target_language,
-            level=level
-        )
-        return jsonify({'topics': topics})
+        return self._cached_topics_response([level], lambda topics: {'topics': topics[level]})
+    
+    @login_required
+    def get_all_topics(self):
+        """Return topics for every level in one payload so the client can switch levels locally"""
+        return self._cached_topics_response(self.TOPIC_LEVELS, lambda topics: {'levels': topics})
     
     @login_required
     def start_practice(self):
@@ -1000,31 +1100,19 @@ class PracticeModeController(BaseController):
                 flash('Please select a difficulty level.', 'error')
                 return redirect(url_for('practice_mode.index'))
             
-            if topic == 'random':
-                # Get random question with level filter
-                questions = self.question_service.get_random_questions_by_level(
-                    count=1, 
-                    language=language, 
-                    level=level
-                )
-                if questions:
-                    question_id = questions[0].id
-                    # Store allowed question in session for security
-                    session['allowed_practice_question'] = question_id
-                    return redirect(url_for('practice_mode.question', question_id=question_id))
-            else:
-                # Get questions by topic and level
-                questions = self.question_service.get_questions_by_topic_and_level(
-                    topic, 
-                    language, 
-                    level
-                )
-                if questions:
-                    question = random.choice(questions)
-                    question_id = question.id
-                    # Store allowed question in session for security
-                    session['allowed_practice_question'] = question_id
-                    return redirect(url_for('practice_mode.question', question_id=question_id))
+            # Schedule from the user's topic coverage (weak and overdue topics first),
+            # skipping questions this user has seen recently when possible
+            question_id = practice_scheduler.next_question_id(
+                current_user.id,
+                language=language,
+                level=level,
+                topic=None if topic == 'random' else topic,
+                exclude_ids=RecentQuestions.get()
+            )
+            if question_id:
+                # Store allowed question in session for security
+                session['allowed_practice_question'] = question_id
+                return redirect(url_for('practice_mode.question', question_id=question_id))
             
             flash('No questions found for your selection.', 'error')
             return redirect(url_for('practice_mode.index'))
@@ -1039,6 +1127,7 @@ class PracticeModeController(BaseController):
         
         # Allow direct access - store this as the current practice question
         session['allowed_practice_question'] = question_id
+        RecentQuestions.add(question_id)
         
         return render_template('practice_mode/question.html', question=question)
     
@@ -1053,28 +1142,20 @@ class PracticeModeController(BaseController):
                 return jsonify({'success': False, 'error': 'Unauthorized access to this question'})
             
             try:
-                audio_file = request.files.get('audio')
-                
-                if not audio_file:
+                try:
+                    audio_url = self._save_recording()
+                except UploadError as e:
+                    return jsonify({'success': False, 'error': str(e)}), e.status
+                if not audio_url:
                     return jsonify({'success': False, 'error': 'No audio file provided'})
                 
-                import os
-                from werkzeug.utils import secure_filename
-                import time
-                
-                filename = secure_filename(f"practice_response_{current_user.id}_{question_id}_{int(time.time())}.webm")
-                upload_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'responses', filename)
-                
-                os.makedirs(os.path.dirname(upload_path), exist_ok=True)
-                audio_file.save(upload_path)
-                
                 # Get transcript if provided
                 transcript = request.form.get('transcript', '').strip()
                 
                 response = self.response_service.create_response(
                     user_id=current_user.id,
                     question_id=question_id,
-                    audio_url=f"uploads/responses/{filename}"
+                    audio_url=audio_url
                 )
                 
                 # Save transcript if provided
@@ -1083,8 +1164,7 @@ class PracticeModeController(BaseController):
                     db.session.commit()
                 
                 if response:
-                    # Update user streak
-                    self.user_service.update_user_streak(current_user)
+                    self._discard_upload()
                     # Clear the session to prevent reuse of the same question
                     session.pop('allowed_practice_question', None)
                     # Return success with redirect URL
@@ -1161,18 +1241,8 @@ class PracticeModeController(BaseController):
                     })
                 transcript = response.transcript
             
-            # Get audio features for tone/prosody evaluation
-            audio_features = None
-            if request.is_json:
-                audio_features = request.json.get('audio_features')
-            else:
-                audio_features_str = request.form.get('audio_features')
-                if audio_features_str:
-                    try:
-                        import json
-                        audio_features = json.loads(audio_features_str)
-                    except:
-                        audio_features = None
+            # Prosody features computed server-side from the recording (stored with the response)
+            audio_features = self._audio_features(response)
             
             # Get question text - prefer full text, fallback to topic
             question_text = response.question.text
@@ -1203,12 +1273,14 @@ class PracticeModeController(BaseController):
             
             # Save AI results to database
             response.transcript = transcript
+            previous_score = response.ai_score
             response.ai_score = ai_result.get('score', 50)
             response.ai_feedback = ai_result.get('feedback', '')
             response.ai_data = json.dumps({
                 'strengths': ai_result.get('strengths', []),
                 'suggestions': ai_result.get('suggestions', [])
             })
+            coverage_service.record_score(response.user_id, response.question, response.ai_score, previous_score)
             
             db.session.commit()
             
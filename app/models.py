@@ -1,7 +1,8 @@
-from datetime import datetime, date
+from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import and_, case, func, or_, update
 from app import db
 import pytz
 
@@ -9,6 +10,9 @@ def now_hanoi():
     tz = pytz.timezone('Asia/Ho_Chi_Minh')
     return datetime.now(tz)
 
+def today_hanoi():
+    return now_hanoi().date()
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
@@ -20,7 +24,8 @@ class User(UserMixin, db.Model):
     target_language = db.Column(db.String(20), default='english')
     avatar = db.Column(db.String(200), default='default1.svg')  # Avatar file path or default avatar name
     streak_count = db.Column(db.Integer, default=0)
-    last_active_date = db.Column(db.Date, default=date.today)
+    last_active_date = db.Column(db.Date, default=today_hanoi)
+    unread_notifications = db.Column(db.Integer, default=0, nullable=False)  # Maintained by notification_service
     is_admin = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=now_hanoi)
     created_at = db.Column(db.DateTime, default=now_hanoi)
@@ -34,6 +39,9 @@ class User(UserMixin, db.Model):
     responses = db.relationship('Response', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     surveys = db.relationship('Survey', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='author', lazy='dynamic', cascade='all, delete-orphan')
+    stats = db.relationship('UserStats', backref='user', uselist=False, cascade='all, delete-orphan')
+    test_sessions = db.relationship('TestSession', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    daily_progress = db.relationship('UserDailyProgress', lazy='dynamic', cascade='all, delete-orphan')
     
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -41,52 +49,65 @@ class User(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
     
-    def update_streak(self):
-        """Update user's streak count based on last active date"""
-        today = date.today()
-        yesterday = date.fromordinal(today.toordinal() - 1)
-        
-        if self.last_active_date == yesterday:
-            # Consecutive day - increment streak
-            self.streak_count += 1
-        elif self.last_active_date == today:
-            # Already active today - don't change streak
-            return
-        else:
-            # More than 1 day gap - reset streak to 1
-            self.streak_count = 1
-        
-        self.last_active_date = today
-        db.session.commit()
-    
+    @classmethod
+    def record_activity(cls, user_id, today=None):
+        """UPDATE statement that counts `today` towards a user's streak
+
+        Meant to run in the same transaction as the response insert. The new
+        streak is computed by the database from the stored row, so concurrent
+        requests can't double count, and it is a no-op once the user has
+        already been counted today.
+        """
+        today = today or today_hanoi()
+        yesterday = today - timedelta(days=1)
+        return update(cls).where(
+            cls.id == user_id,
+            or_(cls.last_active_date.is_(None), cls.last_active_date != today,
+               func.coalesce(cls.streak_count, 0) == 0)
+        ).values(
+            streak_count=case(
+                (cls.last_active_date == yesterday, func.coalesce(cls.streak_count, 0) + 1),
+                (and_(cls.last_active_date == today, cls.streak_count > 0), cls.streak_count),
+                else_=1
+            ),
+            last_active_date=today
+        )
+
+    @classmethod
+    def rollover_broken_streaks(cls, today=None):
+        """UPDATE statement resetting streaks whose last activity is before yesterday"""
+        today = today or today_hanoi()
+        return update(cls).where(
+            cls.streak_count > 0,
+            cls.last_active_date < today - timedelta(days=1)
+        ).values(streak_count=0)
+
     def check_streak_status(self):
         """Check if user's streak is at risk"""
-        today = date.today()
+        today = today_hanoi()
         
         if self.last_active_date == today:
             return 'active_today'  # User has practiced today
-        elif self.last_active_date == date.fromordinal(today.toordinal() - 1):
+        elif self.last_active_date == today - timedelta(days=1):
             return 'at_risk'  # User practiced yesterday but not today
         else:
             return 'broken'  # Streak is broken (more than 1 day gap)
     
     def is_active_today(self):
         """Check if user has been active today"""
-        return self.last_active_date == date.today()
+        return self.last_active_date == today_hanoi()
 
     @property
     def current_streak(self):
         """
         Get the current effective streak.
-        Returns 0 if the streak is broken (last active date was before yesterday).
+        Returns 0 if the streak is broken (last active date was before yesterday)
+        even when the nightly rollover hasn't reset streak_count yet.
         Returns streak_count otherwise.
         """
-        today = date.today()
-        yesterday = date.fromordinal(today.toordinal() - 1)
-        
-        if self.last_active_date == today or self.last_active_date == yesterday:
-            return self.streak_count
-        return 0
+        if self.check_streak_status() == 'broken':
+            return 0
+        return self.streak_count or 0
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -103,12 +124,18 @@ class Question(db.Model):
     audio_url = db.Column(db.String(200))
     sample_answer_text = db.Column(db.Text, nullable=True)  # Sample answer transcription
     sample_answer_audio_url = db.Column(db.String(200), nullable=True)  # Sample answer audio path
+    topic_id = db.Column(db.Integer, db.ForeignKey('topics.id'), nullable=True)  # Normalized topic (kept in sync with `topic`)
+    comments_count = db.Column(db.Integer, default=0, nullable=False)  # Top-level comments (maintained by comment_service)
     created_at = db.Column(db.DateTime, default=now_hanoi)
     updated_at = db.Column(db.DateTime, default=now_hanoi, onupdate=now_hanoi)
     
     # Relationships
     responses = db.relationship('Response', backref='question', lazy='dynamic')
     comments = db.relationship('Comment', backref='question', lazy='dynamic', cascade='all, delete-orphan')
+    topic_ref = db.relationship('Topic', backref=db.backref('questions', lazy='dynamic'))
+    
+    # Topic lookups are equality joins on topic_id
+    __table_args__ = (db.Index('idx_questions_topic_level', 'topic_id', 'difficulty_level'),)
     
     def __repr__(self):
         text_preview = self.text[:50] if self.text else 'No text'
@@ -130,6 +157,61 @@ class Question(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
 
+class Topic(db.Model):
+    """Normalized question topic (e.g. "01. Newspapers" -> sort_order 1, name "Newspapers")"""
+    __tablename__ = 'topics'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # Display name without number prefix
+    language = db.Column(db.String(20), nullable=False, default='english')
+    sort_order = db.Column(db.Integer, default=0)  # Number prefix from the original topic string
+    created_at = db.Column(db.DateTime, default=now_hanoi)
+    
+    # Relationships
+    levels = db.relationship('TopicLevel', backref='topic', lazy='select', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.UniqueConstraint('language', 'name', name='unique_topic_language_name'),
+        db.Index('idx_topics_language_sort', 'language', 'sort_order', 'name'),
+    )
+    
+    def __repr__(self):
+        return f'<Topic {self.id}: {self.name} ({self.language})>'
+    
+    def to_dict(self):
+        """Convert topic to dictionary for JSON responses"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'language': self.language,
+            'sort_order': self.sort_order,
+            'levels': {level.level: level.question_count for level in self.levels},
+        }
+
+class TopicLevel(db.Model):
+    """Level availability of a topic, with the number of questions at that level"""
+    __tablename__ = 'topic_levels'
+    
+    topic_id = db.Column(db.Integer, db.ForeignKey('topics.id'), primary_key=True)
+    level = db.Column(db.String(10), primary_key=True)  # IM, IH, AL
+    question_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (db.Index('idx_topic_levels_level', 'level', 'topic_id'),)
+    
+    def __repr__(self):
+        return f'<TopicLevel {self.topic_id}: {self.level} ({self.question_count})>'
+
+class CatalogVersion(db.Model):
+    """Version counters used to invalidate per-process caches of shared data"""
+    __tablename__ = 'catalog_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)  # e.g. 'questions'
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=now_hanoi, onupdate=now_hanoi)
+    
+    def __repr__(self):
+        return f'<CatalogVersion {self.name}: {self.version}>'
+
 class Response(db.Model):
     __tablename__ = 'responses'
     
@@ -140,14 +222,86 @@ class Response(db.Model):
     duration = db.Column(db.Float)  # Duration in seconds
     mode = db.Column(db.String(20), default='practice')  # 'practice' or 'test'
     transcript = db.Column(db.Text, nullable=True)  # Transcribed text of the response
-    ai_score = db.Column(db.Integer, nullable=True)  # AI score out of 100
+    # active_history keeps the previous score available to the user_stats flush listener
+    ai_score = db.column_property(db.Column(db.Integer, nullable=True), active_history=True)  # AI score out of 100
     ai_feedback = db.Column(db.Text, nullable=True)  # AI feedback text
     ai_data = db.Column(db.JSON, nullable=True)  # Full AI response data (strengths, suggestions, etc.)
+    audio_features = db.Column(db.JSON, nullable=True)  # Server-computed prosody features ({} when no speech)
+    test_session_id = db.Column(db.Integer, db.ForeignKey('test_sessions.id'), nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=now_hanoi)
     
+    __table_args__ = (
+        # Keyset pagination of a user's history on (created_at, id)
+        db.Index('idx_responses_user_created', 'user_id', 'created_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Response {self.id} by User {self.user_id}>'
 
+class UserStats(db.Model):
+    """Materialized per-user response counters, maintained on response insert/delete"""
+    __tablename__ = 'user_stats'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_responses = db.Column(db.Integer, nullable=False, default=0)
+    practice_responses = db.Column(db.Integer, nullable=False, default=0)
+    test_responses = db.Column(db.Integer, nullable=False, default=0)
+    tests_completed = db.Column(db.Integer, nullable=False, default=0)  # Test sessions (one survey each)
+    last_response_at = db.Column(db.DateTime, nullable=True)
+    best_score = db.Column(db.Integer, nullable=True)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)
+    scored_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=now_hanoi, onupdate=now_hanoi)
+    
+    @property
+    def avg_score(self):
+        """Average ai_score over scored responses"""
+        if not self.scored_count:
+            return None
+        return round(self.score_sum / self.scored_count, 1)
+    
+    def __repr__(self):
+        return f'<UserStats user={self.user_id} total={self.total_responses}>'
+
+class UserDailyProgress(db.Model):
+    """Per-user daily rollup of responses by mode and level, maintained on write"""
+    __tablename__ = 'user_daily_progress'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    mode = db.Column(db.String(20), primary_key=True)   # 'practice' or 'test'
+    level = db.Column(db.String(10), primary_key=True)  # Question level; '' when unknown
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    seconds_spoken = db.Column(db.Float, nullable=False, default=0.0)
+    scored_count = db.Column(db.Integer, nullable=False, default=0)
+    score_sum = db.Column(db.Integer, nullable=False, default=0)
+    max_score = db.Column(db.Integer, nullable=True)
+    
+    def __repr__(self):
+        return f'<UserDailyProgress user={self.user_id} {self.day} {self.mode}/{self.level}>'
+
+class UserTopicCoverage(db.Model):
+    """Per-user practice coverage of a topic at one level, maintained on response insert"""
+    __tablename__ = 'user_topic_coverage'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    topic_id = db.Column(db.Integer, db.ForeignKey('topics.id'), nullable=False)
+    level = db.Column(db.String(10), nullable=False)  # IM, IH, AL
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_attempt_at = db.Column(db.DateTime, nullable=True)
+    score_avg = db.Column(db.Float, nullable=True)  # Rolling (exponential) average of ai_score
+    scored_count = db.Column(db.Integer, nullable=False, default=0)
+    seen_question_ids = db.Column(db.JSON, nullable=True)  # Questions seen in the current pass over the topic
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'topic_id', 'level', name='unique_user_topic_level'),
+        db.Index('idx_user_topic_coverage_user_level', 'user_id', 'level'),
+    )
+    
+    def __repr__(self):
+        return f'<UserTopicCoverage user={self.user_id} topic={self.topic_id} {self.level}: {self.attempts}>'
+
 class Survey(db.Model):
     __tablename__ = 'surveys'
     
@@ -159,6 +313,27 @@ class Survey(db.Model):
     def __repr__(self):
         return f'<Survey {self.id} by User {self.user_id}>'
 
+class TestSession(db.Model):
+    """One sitting of the test mode, started by a survey; responses are linked when recorded"""
+    __tablename__ = 'test_sessions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    survey_id = db.Column(db.Integer, db.ForeignKey('surveys.id'), nullable=True, index=True)
+    response_count = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=now_hanoi)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    survey = db.relationship('Survey', backref=db.backref('test_sessions', lazy='dynamic'))
+    responses = db.relationship('Response', backref='test_session', lazy='dynamic')
+    
+    __table_args__ = (
+        db.Index('idx_test_sessions_user_started', 'user_id', 'started_at'),
+    )
+    
+    def __repr__(self):
+        return f'<TestSession {self.id} by User {self.user_id}>'
+
 class Comment(db.Model):
     __tablename__ = 'comments'
     
@@ -180,16 +355,26 @@ class Comment(db.Model):
     replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), 
                              lazy='dynamic', cascade='all, delete-orphan')
     
+    # One index per comment sort order (keyset pagination), plus reply lookups
+    __table_args__ = (
+        db.Index('idx_comments_recent', 'question_id', 'parent_id', 'is_pinned', 'created_at', 'id'),
+        db.Index('idx_comments_popular', 'question_id', 'parent_id', 'is_pinned', 'likes_count', 'created_at', 'id'),
+        db.Index('idx_comments_parent_created', 'parent_id', 'created_at'),
+    )
+    
     def __repr__(self):
         content_preview = self.content[:30] if self.content else 'No content'
         reply_info = f" (reply to {self.parent_id})" if self.parent_id else ""
         return f'<Comment {self.id} by User {self.user_id}: {content_preview}...{reply_info}>'
     
-    def to_dict(self, include_replies=False, current_user_id=None):
-        """Convert comment to dictionary for JSON responses"""
+    def to_dict(self, include_replies=False, current_user_id=None, user_has_liked=None):
+        """Convert comment to dictionary for JSON responses
+
+        Pass `user_has_liked` when it is already known (see CommentThreadLoader)
+        to skip the per-comment like lookup.
+        """
         # Check if current user has liked this comment
-        user_has_liked = False
-        if current_user_id:
+        if user_has_liked is None and current_user_id:
             user_has_liked = CommentLike.query.filter_by(
                 comment_id=self.id, 
                 user_id=current_user_id
@@ -210,15 +395,15 @@ class Comment(db.Model):
             'is_pinned': self.is_pinned,
             'likes_count': self.likes_count,
             'replies_count': self.replies_count,
-            'user_has_liked': user_has_liked,
+            'user_has_liked': bool(user_has_liked),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
         
         # Include replies if requested
         if include_replies:
-            data['replies'] = [reply.to_dict(include_replies=False, current_user_id=current_user_id) 
-                              for reply in self.replies.order_by(Comment.created_at.asc()).all()]
+            from app.services.comment_service import comment_thread_loader
+            data['replies'] = comment_thread_loader.build_threads([self], current_user_id)[0]['replies']
         
         return data
 
@@ -276,6 +461,55 @@ class Notification(db.Model):
             'comment_preview': self.comment.content[:100] if self.comment else None
         }
 
+class MediaJob(db.Model):
+    """Queued background work on an uploaded recording, run by scripts/media_worker.py"""
+    __tablename__ = 'media_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)    # e.g. 'transcode'
+    target = db.Column(db.String(20), nullable=False)  # 'comment' or 'response'
+    target_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.JSON, nullable=True)  # Handler output, e.g. bytes before/after transcoding
+    created_at = db.Column(db.DateTime, default=now_hanoi)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_media_jobs_status_kind', 'status', 'kind', 'id'),
+    )
+
+    def __repr__(self):
+        return f'<MediaJob {self.id}: {self.kind} {self.target}={self.target_id} ({self.status})>'
+
+
+class MediaBlob(db.Model):
+    """A content-addressed media file under uploads/media (see app/services/media_storage_service.py)"""
+    __tablename__ = 'media_blobs'
+
+    sha256 = db.Column(db.String(64), primary_key=True)
+    extension = db.Column(db.String(16), nullable=False)  # e.g. '.webm' or '.opus.webm'
+    size = db.Column(db.BigInteger, nullable=False)
+    created_at = db.Column(db.DateTime, default=now_hanoi)
+
+    def __repr__(self):
+        return f'<MediaBlob {self.sha256[:12]}{self.extension} ({self.size} bytes)>'
+
+
+class MediaAlias(db.Model):
+    """Old flat upload path of a recording moved into the content-addressed store"""
+    __tablename__ = 'media_aliases'
+
+    path = db.Column(db.String(200), primary_key=True)  # e.g. 'uploads/responses/response_1_2_1700000000.webm'
+    sha256 = db.Column(db.String(64), db.ForeignKey('media_blobs.sha256'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=now_hanoi)
+
+    def __repr__(self):
+        return f'<MediaAlias {self.path} -> {self.sha256[:12]}>'
+
+
 class Tip(db.Model):
     """Model for Tips/Resources (PDF materials)"""
     __tablename__ = 'tips'
@@ -4,14 +4,27 @@ Contains business logic and service classes following OOP principles
 """
 
 from abc import ABC, abstractmethod
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import date, datetime
 from flask import current_app
 from werkzeug.security import generate_password_hash, check_password_hash
 import time
 
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.orm import joinedload
+
 from app import db
-from app.models import User, Question, Response, Survey
+from app.models import User, Question, Response, Survey, TestSession, UserDailyProgress, now_hanoi
+from app.services.catalog_service import question_catalog
+from app.services.topic_service import strip_topic_prefix
+from app.services.sampling_service import question_sampler
+from app.services.scheduler_service import coverage_service
+from app.services.stats_service import user_stats_service
+from app.services.pagination import encode_cursor, decode_cursor
+from app.services.cache_service import user_cache
+from app.services import transcode_service  # noqa: F401 - queues new recordings for transcoding
+from app.services import audio_features_service  # noqa: F401 - queues new responses for feature extraction
+from app.services import transcription_service  # noqa: F401 - queues new responses for transcription
 
 
 class BaseService(ABC):
@@ -109,135 +122,165 @@ class UserService(BaseService):
             return user
         return None
     
-    def update_user_streak(self, user: User) -> bool:
-        """Update user's streak count"""
-        try:
-            user.update_streak()
-            return self.commit()
-        except Exception as e:
-            current_app.logger.error(f"Error updating streak: {e}")
-            self.rollback()
-            return False
-    
-    def get_user_statistics(self, user_id: int) -> Dict[str, Any]:
-        """Get user statistics"""
+    def get_user_statistics(self, user_id: int, include_recent: bool = False) -> Dict[str, Any]:
+        """Get user statistics
+        
+        Counters come from the materialized user_stats row (one primary-key
+        read); `include_recent` also loads the five latest responses. The
+        payload is cached per user and invalidated when their data changes.
+        """
         user = self.get_user_by_id(user_id)
         if not user:
             return {}
         
-        total_responses = Response.query.filter_by(user_id=user_id).count()
-        practice_responses_count = Response.query.filter_by(user_id=user_id, mode='practice').count()
-        test_responses_count = Response.query.filter_by(user_id=user_id, mode='test').count()
-        recent_responses = Response.query.filter_by(user_id=user_id)\
-            .order_by(Response.created_at.desc()).limit(5).all()
+        name = 'stats:recent' if include_recent else 'stats'
+        data = user_cache.get_or_set(user_id, name, lambda: self._build_statistics(user_id, include_recent))
+        
+        return dict(
+            data,
+            user=user,
+            streak_count=user.current_streak,
+            target_language=user.target_language
+        )
+    
+    def _build_statistics(self, user_id: int, include_recent: bool) -> Dict[str, Any]:
+        """Cacheable statistics payload (plain values only, no ORM instances)"""
+        stats = user_stats_service.get_stats(user_id)
+        recent_responses = []
+        if include_recent:
+            responses = Response.query.options(joinedload(Response.question))\
+                .filter_by(user_id=user_id)\
+                .order_by(Response.created_at.desc()).limit(5).all()
+            recent_responses = [{
+                'id': response.id,
+                'mode': response.mode,
+                'audio_url': response.audio_url,
+                'duration': response.duration,
+                'created_at': response.created_at,
+                'question': {
+                    'text': response.question.text,
+                    'topic': response.question.topic,
+                    'difficulty_level': response.question.difficulty_level
+                } if response.question else {}
+            } for response in responses]
         
         return {
-            'user': user,
-            'total_responses': total_responses,
-            'practice_responses_count': practice_responses_count,
-            'test_responses_count': test_responses_count,
-            'recent_responses': recent_responses,
-            'streak_count': user.current_streak,
-            'target_language': user.target_language
+            'total_responses': stats.total_responses,
+            'practice_responses_count': stats.practice_responses,
+            'test_responses_count': stats.test_responses,
+            'tests_completed': stats.tests_completed,
+            'last_response_at': stats.last_response_at,
+            'best_score': stats.best_score,
+            'avg_score': stats.avg_score,
+            'recent_responses': recent_responses
         }
 
 
 class QuestionService(BaseService):
-    """Service class for question-related operations"""
+    """Service class for question-related operations
+    
+    Topic lists and level/topic filters are answered from the in-memory
+    question catalog and random picks from the question sampler; only the
+    rows actually returned are loaded.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.catalog = question_catalog
+        self.sampler = question_sampler
+    
+    def _load_questions(self, question_ids) -> List[Question]:
+        """Load questions by primary key, preserving the given order"""
+        question_ids = list(question_ids)
+        if not question_ids:
+            return []
+        questions = Question.query.filter(Question.id.in_(question_ids)).all()
+        by_id = {question.id: question for question in questions}
+        return [by_id[qid] for qid in question_ids if qid in by_id]
     
     def get_question_by_id(self, question_id: int) -> Optional[Question]:
         """Get question by ID"""
         return Question.query.get(question_id)
     
     def get_questions_by_topic(self, topic: str, language: str = 'english') -> List[Question]:
-        """Get questions by topic and language"""
-        return Question.query.filter_by(topic=topic, language=language).all()
+        """Get questions by topic and language (topic number prefixes are ignored)"""
+        snapshot = self.catalog.snapshot()
+        return self._load_questions(snapshot.question_ids(language, topic=strip_topic_prefix(topic)))
     
     def get_questions_by_level(self, level: str, language: str = 'english') -> List[Question]:
         """Get questions by CEFR-style difficulty level (IM/IH/AL)"""
-        query = Question.query.filter_by(language=language)
-        if level:
-            query = query.filter_by(difficulty_level=level)
-        return query.all()
+        snapshot = self.catalog.snapshot()
+        return self._load_questions(snapshot.question_ids(language, level=level))
     
-    def get_random_questions(self, count: int = 1, language: str = 'english') -> List[Question]:
-        """Get random questions"""
-        return Question.query.filter_by(language=language)\
-            .order_by(db.func.random()).limit(count).all()
+    def get_random_questions(self, count: int = 1, language: str = 'english',
+                             exclude_ids: List[int] = None) -> List[Question]:
+        """Get random questions, avoiding `exclude_ids` where possible"""
+        return self._load_questions(self.sampler.sample(count, language, exclude_ids=exclude_ids))
     
     def get_all_topics(self, language: str = 'english', level: str = None) -> List[str]:
         """Get all available topics sorted alphabetically, optionally filtered by level"""
-        query = db.session.query(Question.topic)\
-            .filter_by(language=language)
-        
-        # Filter by level if specified
-        if level:
-            query = query.filter_by(difficulty_level=level)
-        
-        topics = query.distinct().all()
-        
-        # Process topics: remove number prefixes and deduplicate
-        processed_topics = set()
-        for topic_tuple in topics:
-            if topic_tuple[0]:
-                topic = topic_tuple[0]
-                # Remove number prefix (e.g., "01. Newspapers" -> "Newspapers")
-                if '. ' in topic:
-                    topic_name = topic.split('. ', 1)[1]
-                else:
-                    topic_name = topic
-                processed_topics.add(topic_name)
-        
-        # Sort and return
-        return sorted(list(processed_topics))
+        return self.catalog.snapshot().topics(language, level)
+    
+    def get_topics_by_levels(self, language: str = 'english', levels: List[str] = None) -> Tuple[int, Dict[str, List[str]]]:
+        """Topics for several levels from one catalog snapshot, with the catalog version they came from"""
+        snapshot = self.catalog.snapshot()
+        return snapshot.version, {level: snapshot.topics(language, level) for level in levels or []}
     
     def get_all_questions_count(self) -> int:
         """Get total count of all questions"""
-        return Question.query.count()
+        return self.catalog.snapshot().total
     
     def get_questions_by_topic_and_level(self, topic: str, language: str = 'english', level: str = None) -> List[Question]:
         """Get questions by topic, language, and difficulty level"""
-        # Search for questions where topic matches with or without number prefix
-        # For example, if user selects "Food", match both "Food" and "12. Food"
-        base_query = Question.query.filter_by(language=language)
-        
-        if level:
-            base_query = base_query.filter_by(difficulty_level=level)
-        
-        # Match either exact topic or topic with number prefix
-        questions = base_query.filter(
-            db.or_(
-                Question.topic == topic,
-                Question.topic.like(f'%. {topic}')
-            )
-        ).all()
-        
-        return questions
-    
-    def get_random_questions_by_level(self, count: int = 1, language: str = 'english', level: str = None) -> List[Question]:
-        """Get random questions filtered by level"""
-        query = Question.query.filter_by(language=language)
-        if level:
-            query = query.filter_by(difficulty_level=level)
-        return query.order_by(db.func.random()).limit(count).all()
+        # Catalog topics are prefix-stripped, so "Food" matches both "Food" and "12. Food"
+        snapshot = self.catalog.snapshot()
+        return self._load_questions(snapshot.question_ids(language, level, strip_topic_prefix(topic)))
+    
+    def get_random_questions_by_level(self, count: int = 1, language: str = 'english', level: str = None,
+                                      exclude_ids: List[int] = None) -> List[Question]:
+        """Get random questions filtered by level, avoiding `exclude_ids` where possible"""
+        return self._load_questions(self.sampler.sample(count, language, level, exclude_ids=exclude_ids))
+    
+    def pick_random_question_id(self, language: str = 'english', level: str = None, topic: str = None,
+                                exclude_ids: List[int] = None) -> Optional[int]:
+        """Pick one random question id for the filter without touching the database"""
+        ids = self.sampler.sample(1, language, level, strip_topic_prefix(topic) if topic else None,
+                                  exclude_ids=exclude_ids)
+        return ids[0] if ids else None
 
 
 class ResponseService(BaseService):
     """Service class for response-related operations"""
     
     def create_response(self, user_id: int, question_id: int, audio_url: str, 
-                       duration: float = None, mode: str = 'practice') -> Optional[Response]:
-        """Create a new response"""
+                       duration: float = None, mode: str = 'practice',
+                       test_session_id: int = None) -> Optional[Response]:
+        """Create a new response, optionally linked to a test session"""
         try:
             response = Response(
                 user_id=user_id,
                 question_id=question_id,
                 audio_url=audio_url,
                 duration=duration,
-                mode=mode
+                mode=mode,
+                test_session_id=test_session_id
             )
             
             self.db.session.add(response)
+            
+            # Keep per-user topic coverage in step with responses (same transaction)
+            coverage_service.record_attempt(user_id, self.db.session.get(Question, question_id))
+            
+            # Count today towards the user's streak (no-op after the first response of the day)
+            self.db.session.execute(User.record_activity(user_id))
+            
+            if test_session_id:
+                self.db.session.execute(
+                    update(TestSession)
+                    .where(TestSession.id == test_session_id)
+                    .values(response_count=TestSession.response_count + 1)
+                )
+            
             if self.commit():
                 return response
             return None
@@ -257,6 +300,37 @@ class ResponseService(BaseService):
         
         return query.all()
     
+    def get_history_page(self, user_id: int, limit: int = 30,
+                         cursor: str = None) -> Tuple[List[Response], Optional[str]]:
+        """One page of a user's responses, newest first, with questions eager-loaded
+        
+        Uses keyset pagination on (created_at, id): `cursor` is the value
+        returned for the previous page. Returns (responses, next_cursor);
+        raises ValueError for a malformed cursor.
+        """
+        query = Response.query.options(joinedload(Response.question))\
+            .filter(Response.user_id == user_id)
+        
+        position = decode_cursor(cursor, (datetime, int))
+        if position:
+            created_at, response_id = position
+            query = query.filter(or_(
+                Response.created_at < created_at,
+                and_(Response.created_at == created_at, Response.id < response_id)
+            ))
+        
+        rows = query.order_by(Response.created_at.desc(), Response.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+        return rows, next_cursor
+    
+    def count_active_days(self, user_id: int) -> int:
+        """Number of distinct days the user recorded at least one response, from the daily rollups"""
+        return self.db.session.query(func.count(func.distinct(UserDailyProgress.day)))\
+            .filter(UserDailyProgress.user_id == user_id, UserDailyProgress.attempts > 0).scalar() or 0
+    
     def get_response_by_id(self, response_id: int) -> Optional[Response]:
         """Get response by ID"""
         return Response.query.get(response_id)
@@ -303,6 +377,49 @@ class SurveyService(BaseService):
             return False
 
 
+class TestSessionService(BaseService):
+    """Service class for test sessions (one per survey-started sitting of the test mode)"""
+    
+    def start_session(self, user_id: int, survey: Survey = None) -> Optional[TestSession]:
+        """Start a new test session for a user, linked to the survey that opened it"""
+        try:
+            test_session = TestSession(user_id=user_id, survey=survey)
+            self.db.session.add(test_session)
+            if self.commit():
+                return test_session
+            return None
+            
+        except Exception as e:
+            current_app.logger.error(f"Error starting test session: {e}")
+            self.rollback()
+            return None
+    
+    def get_session(self, session_id: int, user_id: int) -> Optional[TestSession]:
+        """Get a test session by ID, only if it belongs to the user"""
+        if not session_id:
+            return None
+        test_session = self.db.session.get(TestSession, session_id)
+        if test_session is None or test_session.user_id != user_id:
+            return None
+        return test_session
+    
+    def get_sessions(self, session_ids: List[int]) -> Dict[int, TestSession]:
+        """Load several test sessions with their surveys in one query"""
+        session_ids = [session_id for session_id in set(session_ids) if session_id]
+        if not session_ids:
+            return {}
+        sessions = TestSession.query.options(joinedload(TestSession.survey))\
+            .filter(TestSession.id.in_(session_ids)).all()
+        return {test_session.id: test_session for test_session in sessions}
+    
+    def finish_session(self, test_session: TestSession) -> bool:
+        """Mark a test session as finished (first call wins)"""
+        if test_session is None or test_session.finished_at:
+            return False
+        test_session.finished_at = now_hanoi()
+        return self.commit()
+
+
 class AuthService(BaseService):
     """Service class for authentication operations"""
     
@@ -0,0 +1,230 @@
+"""
+Audio Features Service for OPIc Practice Portal
+Server-side prosody features for AI scoring, computed once per response and
+stored in responses.audio_features.
+
+Each recording is decoded to 16 kHz mono PCM with ffmpeg, then analysed
+with whole-array NumPy operations (no per-sample Python loops):
+
+- frame energies over 25 ms windows with a 10 ms hop
+- energy-based voice activity detection against the recording's own noise floor
+- a YIN pitch track (FFT autocorrelation, cumulative mean normalized
+  difference) over the voiced frames
+- pause ratio (silences of 250 ms or more between the first and last speech)
+- speaking rate from syllable nuclei (energy peaks) in the speech segments
+
+The keys match what the browser used to send (avg_pitch, pitch_variance,
+speaking_rate, pause_ratio, volume_consistency, duration), so
+AIService.score_response() consumes them unchanged.
+"""
+import subprocess
+from typing import Dict, Optional
+
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import MediaJob, Response
+from app.services.media_job_service import media_job_queue
+from app.services.media_storage_service import upload_path
+from app.services.transcode_service import audio_transcoder
+
+JOB_KIND = 'features'
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.010
+PITCH_FRAME_SECONDS = 0.040
+PITCH_HOP_SECONDS = 0.020
+MIN_PITCH, MAX_PITCH = 75.0, 400.0
+YIN_THRESHOLD = 0.15
+MIN_PAUSE_SECONDS = 0.25
+MIN_DYNAMIC_RANGE_DB = 10.0
+SYLLABLES_PER_WORD = 1.5
+DECODE_TIMEOUT = 120
+
+
+def _frames(samples: np.ndarray, length: int, hop: int) -> np.ndarray:
+    """(n_frames, length) strided view of `samples`"""
+    if len(samples) < length:
+        return np.empty((0, length), dtype=samples.dtype)
+    return np.lib.stride_tricks.sliding_window_view(samples, length)[::hop]
+
+
+def _runs(mask: np.ndarray):
+    """Start and end (exclusive) indices of the runs of True in a boolean array"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+class AudioFeatureExtractor:
+    """Decode recordings and compute prosody features"""
+
+    def decode(self, path: str) -> np.ndarray:
+        """Float32 mono samples in [-1, 1] at SAMPLE_RATE"""
+        completed = subprocess.run([
+            audio_transcoder.ffmpeg(), '-nostdin', '-hide_banner', '-loglevel', 'error',
+            '-i', path, '-vn', '-ac', '1', '-ar', str(SAMPLE_RATE), '-f', 's16le', '-'
+        ], capture_output=True, timeout=DECODE_TIMEOUT)
+        if completed.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {completed.stderr.decode(errors='replace').strip()[-500:]}")
+        return np.frombuffer(completed.stdout, dtype='<i2').astype(np.float32) / 32768.0
+
+    def voice_activity(self, energies_db: np.ndarray) -> np.ndarray:
+        """Speech frames: well above the recording's noise floor and not near digital silence"""
+        noise_floor = np.percentile(energies_db, 10)
+        peak = np.percentile(energies_db, 95)
+        if peak - noise_floor < MIN_DYNAMIC_RANGE_DB:
+            # Steady noise or silence throughout
+            return np.zeros(len(energies_db), dtype=bool)
+        threshold = max(noise_floor + 0.35 * (peak - noise_floor), -50.0)
+        return energies_db > threshold
+
+    def pitch_track(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        """YIN fundamental frequency (Hz) per pitch frame; NaN where unvoiced"""
+        length = int(PITCH_FRAME_SECONDS * sample_rate)
+        tau_min = int(sample_rate / MAX_PITCH)
+        tau_max = int(sample_rate / MIN_PITCH)
+        window = length - tau_max
+        frames = _frames(samples, length, int(PITCH_HOP_SECONDS * sample_rate)).astype(np.float64)
+        if not len(frames) or window <= 0:
+            return np.empty(0)
+
+        # d(tau) = e(0) + e(tau) - 2 r(tau), with r from one batched FFT cross-correlation
+        size = 1 << int(np.ceil(np.log2(length + window)))
+        spectrum = np.fft.rfft(frames, size) * np.conj(np.fft.rfft(frames[:, :window], size))
+        correlation = np.fft.irfft(spectrum, size)[:, :tau_max + 1]
+        energy = np.concatenate((np.zeros((len(frames), 1)), np.cumsum(frames ** 2, axis=1)), axis=1)
+        taus = np.arange(tau_max + 1)
+        shifted_energy = energy[:, taus + window] - energy[:, taus]
+        difference = np.maximum(energy[:, [window]] + shifted_energy - 2 * correlation, 0)
+
+        # Cumulative mean normalized difference
+        cumulative = np.cumsum(difference[:, 1:], axis=1)
+        normalized = np.ones_like(difference)
+        normalized[:, 1:] = difference[:, 1:] * taus[1:] / np.where(cumulative > 0, cumulative, 1)
+
+        # First dip below the threshold, followed down to its local minimum
+        candidates = normalized[:, tau_min:tau_max]
+        below = candidates < YIN_THRESHOLD
+        voiced = below.any(axis=1)
+        first = np.argmax(below, axis=1)
+        rising = np.diff(candidates, axis=1) >= 0
+        after_first = np.arange(rising.shape[1])[None, :] >= first[:, None]
+        local_min = np.argmax(rising & after_first, axis=1)
+        tau = (tau_min + np.where(local_min >= first, local_min, first)).astype(np.float64)
+
+        # Parabolic interpolation around the chosen lag
+        rows = np.arange(len(frames))
+        index = np.clip(tau.astype(int), 1, tau_max - 1)
+        left, centre, right = normalized[rows, index - 1], normalized[rows, index], normalized[rows, index + 1]
+        denominator = left - 2 * centre + right
+        curved = np.abs(denominator) > 1e-12
+        offset = np.where(curved, 0.5 * (left - right) / np.where(curved, denominator, 1), 0)
+        f0 = sample_rate / (index + np.clip(offset, -1, 1))
+        return np.where(voiced, f0, np.nan)
+
+    def extract(self, samples: np.ndarray, sample_rate: int = SAMPLE_RATE) -> Optional[Dict[str, float]]:
+        """Prosody features of a recording, or None when it holds no speech"""
+        duration = len(samples) / sample_rate
+        hop = int(HOP_SECONDS * sample_rate)
+        frames = _frames(samples, int(FRAME_SECONDS * sample_rate), hop)
+        if not len(frames):
+            return None
+
+        rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+        energies_db = 20 * np.log10(np.maximum(rms, 1e-6))
+        speech = self.voice_activity(energies_db)
+        if speech.sum() < 10:
+            return None
+
+        # Pauses: silent runs of MIN_PAUSE_SECONDS or more inside the speaking span
+        first, last = np.flatnonzero(speech)[[0, -1]]
+        span = speech[first:last + 1]
+        starts, ends = _runs(~span)
+        pause_frames = (ends - starts)[(ends - starts) * HOP_SECONDS >= MIN_PAUSE_SECONDS].sum()
+        pause_ratio = float(pause_frames / len(span))
+
+        # Syllable nuclei: local energy peaks in speech, at least 3 dB above their surroundings
+        smooth = np.convolve(energies_db, np.ones(5) / 5, mode='same')
+        peaks = (smooth[1:-1] > smooth[:-2]) & (smooth[1:-1] >= smooth[2:]) & speech[1:-1]
+        peak_index = np.flatnonzero(peaks) + 1
+        surroundings = np.lib.stride_tricks.sliding_window_view(np.pad(smooth, 10, mode='edge'), 21).min(axis=1)
+        syllables = int(np.sum(smooth[peak_index] - surroundings[peak_index] >= 3.0))
+        speaking_minutes = max(len(span) * HOP_SECONDS / 60, 1e-6)
+        speaking_rate = float(syllables / SYLLABLES_PER_WORD / speaking_minutes)
+
+        # Loudness steadiness while speaking: 1 = constant, 0 = very uneven
+        voiced_rms = rms[speech]
+        volume_consistency = float(np.clip(1 - voiced_rms.std() / (voiced_rms.mean() + 1e-3), 0, 1))
+
+        # Pitch only where the VAD heard speech (pitch frames sit on every other energy frame)
+        pitch = self.pitch_track(samples, sample_rate)
+        in_speech = speech[np.minimum(np.arange(len(pitch)) * round(PITCH_HOP_SECONDS / HOP_SECONDS), len(speech) - 1)]
+        pitch = pitch[np.isfinite(pitch) & in_speech]
+        if len(pitch):
+            # Octave errors sit far from the median; keep the speaker's own range
+            median = np.median(pitch)
+            pitch = pitch[(pitch > median / 1.8) & (pitch < median * 1.8)]
+
+        return {
+            'avg_pitch': round(float(pitch.mean()), 1) if len(pitch) else None,
+            'pitch_variance': round(float(pitch.var()), 1) if len(pitch) else None,
+            'speaking_rate': round(speaking_rate, 1),
+            'pause_ratio': round(pause_ratio, 3),
+            'volume_consistency': round(volume_consistency, 3),
+            'duration': round(duration, 2),
+        }
+
+    def features_for(self, response: Response) -> Optional[Dict[str, float]]:
+        """Stored features of a response, computing and saving them if missing"""
+        if response.audio_features is None and response.audio_url:
+            response.audio_features = self.extract(self.decode(upload_path(response.audio_url))) or {}
+            db.session.commit()
+        return response.audio_features or None
+
+    def handle(self, job: MediaJob) -> dict:
+        """Media job: compute and store the features of one response"""
+        table = Response.__table__
+        audio_url = db.session.execute(select(table.c.audio_url).where(table.c.id == job.target_id)).scalar()
+        if not audio_url:
+            return {'skipped': 'missing'}
+        features = self.extract(self.decode(upload_path(audio_url))) or {}
+        db.session.execute(update(table).where(table.c.id == job.target_id).values(audio_features=features))
+        db.session.commit()
+        return {'speech': bool(features)}
+
+    def enqueue_existing(self, batch_size: int = 1000) -> int:
+        """Queue responses stored without features; returns jobs added"""
+        queued_ids = select(MediaJob.target_id).where(MediaJob.kind == JOB_KIND, MediaJob.target == 'response',
+                                                      MediaJob.status.in_(('pending', 'running')))
+        connection = db.session.connection()
+        queued = last_id = 0
+        while True:
+            ids = db.session.execute(
+                select(Response.id).where(
+                    Response.id > last_id, Response.audio_features.is_(None), Response.audio_url.isnot(None),
+                    Response.id.not_in(queued_ids)
+                ).order_by(Response.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            queued += media_job_queue.enqueue(connection, JOB_KIND, 'response', ids)
+            last_id = ids[-1]
+        db.session.commit()
+        return queued
+
+
+audio_feature_extractor = AudioFeatureExtractor()
+media_job_queue.register(JOB_KIND, audio_feature_extractor.handle)
+
+
+@event.listens_for(Session, 'after_flush')
+def _enqueue_feature_extraction(session, flush_context):
+    """Queue new responses for feature extraction"""
+    if not has_app_context() or not current_app.config.get('AUDIO_FEATURES_ENABLED', True):
+        return
+    ids = [obj.id for obj in session.new if isinstance(obj, Response) and obj.audio_url]
+    if ids:
+        media_job_queue.enqueue(session.connection(), JOB_KIND, 'response', ids)
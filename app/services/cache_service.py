@@ -0,0 +1,102 @@
+"""
+User Cache Service for OPIc Practice Portal
+Caches per-user page payloads (dashboard, profile, practice index) in the
+Flask-Caching backend, keyed by user, a per-user generation and the question
+catalog version.
+
+Invalidation never enumerates keys: committing a change to a user's
+responses, surveys, test sessions or user row stores a new generation for
+that user, so older entries simply stop matching and expire. Generations live
+in the cache backend, so they only reach every worker with RedisCache;
+configure_cache() falls back to NullCache when SimpleCache would run in
+several gunicorn workers.
+"""
+import time
+from itertools import chain
+from typing import Any, Callable, Iterable
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import cache
+from app.models import Response, Survey, TestSession, User, UserStats, UserTopicCoverage
+from app.services.catalog_service import question_catalog
+
+DEFAULT_TIMEOUT = 300
+USER_OWNED_MODELS = (Response, Survey, TestSession, UserStats, UserTopicCoverage)
+
+
+def _generation_key(user_id: int) -> str:
+    return f'user_gen:{user_id}'
+
+
+class UserCache:
+    """Per-user data cache with generation-based invalidation"""
+
+    def _timeout(self) -> int:
+        return int(current_app.config.get('USER_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+
+    def _generation(self, user_id: int) -> int:
+        generation = cache.get(_generation_key(user_id))
+        if generation is None:
+            # First use or evicted: start from a fresh value so stale entries can't match
+            generation = time.time_ns()
+            cache.set(_generation_key(user_id), generation, timeout=0)
+        return generation
+
+    def key(self, user_id: int, name: str) -> str:
+        return f'user:{user_id}:{name}:g{self._generation(user_id)}:c{question_catalog.version}'
+
+    def get_or_set(self, user_id: int, name: str, builder: Callable[[], Any]) -> Any:
+        """Return the cached value for (user, name), building and storing it on a miss"""
+        try:
+            key = self.key(user_id, name)
+            value = cache.get(key)
+        except Exception as e:
+            current_app.logger.warning(f"[UserCache] Cache unavailable, building {name} directly: {e}")
+            return builder()
+
+        if value is None:
+            value = builder()
+            try:
+                cache.set(key, value, timeout=self._timeout())
+            except Exception as e:
+                current_app.logger.warning(f"[UserCache] Could not store {name}: {e}")
+        return value
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        """Start a new generation for each user; their cached entries stop matching"""
+        for user_id in set(user_ids):
+            if not user_id:
+                continue
+            try:
+                cache.set(_generation_key(user_id), time.time_ns(), timeout=0)
+            except Exception as e:
+                current_app.logger.warning(f"[UserCache] Could not invalidate user {user_id}: {e}")
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_cache_users(session, flush_context):
+    """Remember which users' data this transaction touched"""
+    users = session.info.setdefault('user_cache_invalidate', set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User):
+            users.add(obj.id)
+        elif isinstance(obj, USER_OWNED_MODELS):
+            users.add(obj.user_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_user_cache(session):
+    users = session.info.pop('user_cache_invalidate', None)
+    if users and has_app_context():
+        user_cache.invalidate(users)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_user_cache_after_rollback(session):
+    session.info.pop('user_cache_invalidate', None)
@@ -0,0 +1,213 @@
+"""
+Question Catalog Service for OPIc Practice Portal
+Keeps a per-process, array-backed index of the question bank so topic lists,
+level/topic filters and random picks (see sampling_service) are answered from memory.
+Topic lists come from topics / topic_levels (level availability), in the
+topics' sort order.
+
+The index is rebuilt lazily whenever the shared catalog version (stored in the
+catalog_versions table) changes. Any ORM write that touches a Question bumps
+that version inside the same transaction, so admin CRUD and imports running in
+one worker invalidate the catalog of every other worker too.
+"""
+import threading
+import time
+from array import array
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Question, Topic, TopicLevel, CatalogVersion
+from app.services.topic_service import strip_topic_prefix
+
+QUESTION_CATALOG = 'questions'
+DEFAULT_CHECK_INTERVAL = 5.0  # Seconds between shared version checks
+NO_IDS = memoryview(array('i')).toreadonly()
+
+
+class CatalogSnapshot:
+    """Immutable view of the question bank at a single catalog version"""
+
+    def __init__(self, version: int, rows, topic_rows=()):
+        self.version = version
+        self.built_at = time.time()
+
+        # (language, level) -> topic names in sort order; rows come ordered by language, sort order, name
+        ordered: Dict[Tuple[str, Optional[str]], List[str]] = {}
+        for language, name, level in topic_rows:
+            for key in ((language, None), (language, level)):
+                names = ordered.setdefault(key, [])
+                if not names or names[-1] != name:
+                    names.append(name)
+
+        # (language, level, topic) -> sorted question ids; None acts as a wildcard
+        index: Dict[Tuple[str, Optional[str], Optional[str]], array] = {}
+        unlinked: Dict[Tuple[str, Optional[str]], set] = {}
+        topic_ids: Dict[Tuple[str, str], int] = {}
+        all_ids = array('i')
+
+        for question_id, language, level, topic, topic_id, topic_name in rows:
+            all_ids.append(question_id)
+            language = language or 'english'
+            # Questions not yet linked to the topics table fall back to prefix stripping
+            topic_name = topic_name or strip_topic_prefix(topic)
+            if topic_id and topic_name:
+                topic_ids[(language, topic_name)] = topic_id
+
+            keys = [(language, None, None), (language, level, None)]
+            if topic_name:
+                keys.append((language, None, topic_name))
+                keys.append((language, level, topic_name))
+                if not topic_id:
+                    unlinked.setdefault((language, None), set()).add(topic_name)
+                    unlinked.setdefault((language, level), set()).add(topic_name)
+
+            # dict.fromkeys drops duplicate keys for questions without a level
+            for key in dict.fromkeys(keys):
+                ids = index.get(key)
+                if ids is None:
+                    ids = index[key] = array('i')
+                ids.append(question_id)
+
+        # Snapshots are shared across threads, so ids are handed out as read-only views
+        self.ids = memoryview(all_ids).toreadonly()  # Every question id, ascending (rows are ordered by id)
+        self.total = len(all_ids)
+        self._index = {key: memoryview(ids).toreadonly() for key, ids in index.items()}
+        # Topics of questions not linked yet follow the ordered ones, alphabetically
+        self._topics = {
+            key: tuple(ordered.get(key, ())) + tuple(sorted(unlinked.get(key, set()) - set(ordered.get(key, ()))))
+            for key in set(ordered) | set(unlinked)
+        }
+        self._topic_ids = topic_ids
+
+    def question_ids(self, language: str = 'english', level: str = None, topic: str = None) -> memoryview:
+        """Return a read-only view of the question ids matching the filter (ascending)"""
+        return self._index.get((language, level or None, topic or None), NO_IDS)
+
+    def topics(self, language: str = 'english', level: str = None) -> List[str]:
+        """Return prefix-stripped topic names in topic sort order"""
+        return list(self._topics.get((language, level or None), ()))
+
+    def topic_id(self, language: str, topic: str) -> Optional[int]:
+        """Return the topics.id for a topic name, if the question bank is linked"""
+        return self._topic_ids.get((language, topic))
+
+
+class QuestionCatalog:
+    """Lazily rebuilt, process-local question catalog"""
+
+    def __init__(self):
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        self._stale = True
+
+    def _check_interval(self) -> float:
+        if has_app_context():
+            return float(current_app.config.get('QUESTION_CATALOG_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL))
+        return DEFAULT_CHECK_INTERVAL
+
+    def _read_version(self) -> int:
+        """Read the shared catalog version on a dedicated connection"""
+        try:
+            with db.engine.connect() as connection:
+                version = connection.execute(
+                    select(CatalogVersion.version).where(CatalogVersion.name == QUESTION_CATALOG)
+                ).scalar()
+            return version or 0
+        except Exception as e:
+            current_app.logger.warning(f"[Catalog] Could not read catalog version: {e}")
+            return -1
+
+    def _build(self, version: int) -> CatalogSnapshot:
+        """Load the indexed columns of every question and the topic availability"""
+        started = time.perf_counter()
+        with db.engine.connect() as connection:
+            rows = connection.execute(
+                select(Question.id, Question.language, Question.difficulty_level, Question.topic,
+                       Question.topic_id, Topic.name)
+                .outerjoin(Topic, Question.topic_id == Topic.id)
+                .order_by(Question.id)
+            ).all()
+            topic_rows = connection.execute(
+                select(Topic.language, Topic.name, TopicLevel.level)
+                .join(TopicLevel, TopicLevel.topic_id == Topic.id)
+                .where(TopicLevel.question_count > 0)
+                .order_by(Topic.language, Topic.sort_order, Topic.name, TopicLevel.level)
+            ).all()
+        snapshot = CatalogSnapshot(version, rows, topic_rows)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        current_app.logger.info(
+            f"[Catalog] Built question catalog v{version}: {snapshot.total} questions in {elapsed_ms:.1f}ms"
+        )
+        return snapshot
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Return the current snapshot, rebuilding it if the shared version moved"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and not self._stale and now - self._last_check < self._check_interval():
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and not self._stale and now - self._last_check < self._check_interval():
+                return snapshot
+
+            version = self._read_version()
+            # A version of -1 means the counter table is unavailable; rebuild on every check
+            if snapshot is None or version < 0 or snapshot.version != version:
+                snapshot = self._snapshot = self._build(version)
+
+            self._last_check = time.monotonic()
+            self._stale = False
+            return snapshot
+
+    @property
+    def version(self) -> int:
+        """Catalog version the current snapshot was built from"""
+        return self.snapshot().version
+
+    def invalidate(self):
+        """Force a version check on the next access"""
+        self._stale = True
+
+
+question_catalog = QuestionCatalog()
+
+
+@event.listens_for(Session, 'before_flush')
+def _bump_catalog_version(session, flush_context, instances):
+    """Bump the shared catalog version once per transaction that writes questions"""
+    if session.info.get('question_catalog_bumped'):
+        return
+
+    changed = any(
+        isinstance(obj, Question) and (obj in session.new or obj in session.deleted or session.is_modified(obj))
+        for obj in chain(session.new, session.dirty, session.deleted)
+    )
+    if not changed:
+        return
+
+    with session.no_autoflush:
+        state = session.get(CatalogVersion, QUESTION_CATALOG)
+    if state is None:
+        session.add(CatalogVersion(name=QUESTION_CATALOG, version=1))
+    else:
+        state.version = CatalogVersion.version + 1
+    session.info['question_catalog_bumped'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_catalog_after_commit(session):
+    if session.info.pop('question_catalog_bumped', False):
+        question_catalog.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_catalog_flag_after_rollback(session):
+    session.info.pop('question_catalog_bumped', None)
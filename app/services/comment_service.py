@@ -0,0 +1,273 @@
+"""
+Comment Thread Service for OPIc Practice Portal
+Loads a page of comment threads (top-level comments, their replies, authors
+and the viewer's likes) with a fixed number of queries and assembles the
+tree in memory, instead of querying replies and likes per comment.
+
+Pages are addressed by keyset cursors over the sort key of each order
+("recent": pinned, created_at, id; "popular": pinned, likes_count,
+created_at, id), each backed by a matching index, so page 50 costs the same
+as page 1. Totals come from questions.comments_count, kept in step with
+top-level comment inserts and deletes by a flush listener.
+
+Likes are an idempotent insert-or-ignore / delete on comment_likes followed
+by a relative `likes_count = likes_count +/- 1` UPDATE, so concurrent likes
+never lose updates or trip the unique constraint; reconcile_likes() repairs
+any drift from comment_likes in bulk.
+"""
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, case, delete, event, exists, func, insert, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+
+from app import db
+from app.models import Comment, CommentLike, Question, now_hanoi
+from app.services.pagination import encode_cursor, decode_cursor
+
+IN_BATCH_SIZE = 500
+MAX_PAGE_SIZE = 50
+SORT_KEYS = {
+    'recent': (Comment.is_pinned, Comment.created_at, Comment.id),
+    'popular': (Comment.is_pinned, Comment.likes_count, Comment.created_at, Comment.id),
+}
+
+
+def _batches(ids: List[int]) -> Iterable[List[int]]:
+    for start in range(0, len(ids), IN_BATCH_SIZE):
+        yield ids[start:start + IN_BATCH_SIZE]
+
+
+class CommentThreadLoader:
+    """Batched loader for comment threads"""
+
+    def top_level_query(self, question_id: int, sort_by: str = 'recent'):
+        """Top-level comments of a question in sort order (all keys descending), authors joined"""
+        query = Comment.query.options(joinedload(Comment.author))\
+            .filter(Comment.question_id == question_id, Comment.parent_id.is_(None))
+        return query.order_by(*[column.desc() for column in SORT_KEYS[sort_by]])
+
+    def _after(self, sort_by: str, cursor: str):
+        """Filter for rows strictly after the cursor position in a descending sort"""
+        columns = SORT_KEYS[sort_by]
+        position = decode_cursor(cursor)
+        if len(position) != len(columns):
+            raise ValueError('Invalid cursor')
+        # [is_pinned, (likes_count,) created_at, id]
+        try:
+            pinned, *counts, created_at, comment_id = position
+            values = [bool(pinned), *[int(count) for count in counts],
+                      datetime.fromisoformat(created_at), int(comment_id)]
+        except TypeError as e:
+            raise ValueError(f'Invalid cursor: {e}') from e
+
+        # (k1, k2, ...) < (v1, v2, ...) spelled out so it works on every backend;
+        # booleans only compare by equality, and nothing sorts below an unpinned row
+        clauses = []
+        for index, (column, value) in enumerate(zip(columns, values)):
+            equal_prefix = [columns[i] == values[i] for i in range(index)]
+            if column is Comment.is_pinned:
+                if value:
+                    clauses.append(and_(*equal_prefix, column == False))  # noqa: E712
+                continue
+            clauses.append(and_(*equal_prefix, column < value))
+        return or_(*clauses)
+
+    def load_replies(self, parent_ids: List[int]) -> Dict[int, List[Comment]]:
+        """Replies of all given comments, oldest first, grouped by parent"""
+        replies: Dict[int, List[Comment]] = {parent_id: [] for parent_id in parent_ids}
+        for batch in _batches(parent_ids):
+            rows = Comment.query.options(joinedload(Comment.author))\
+                .filter(Comment.parent_id.in_(batch))\
+                .order_by(Comment.parent_id, Comment.created_at.asc(), Comment.id.asc()).all()
+            for reply in rows:
+                replies[reply.parent_id].append(reply)
+        return replies
+
+    def liked_ids(self, comment_ids: List[int], user_id: Optional[int]) -> Set[int]:
+        """IDs among `comment_ids` the user has liked"""
+        liked: Set[int] = set()
+        if not user_id:
+            return liked
+        for batch in _batches(comment_ids):
+            liked.update(comment_id for (comment_id,) in CommentLike.query.with_entities(CommentLike.comment_id)
+                         .filter(CommentLike.user_id == user_id, CommentLike.comment_id.in_(batch)))
+        return liked
+
+    def build_threads(self, comments: List[Comment], current_user_id: Optional[int] = None) -> List[dict]:
+        """Serialize top-level comments with their replies (two queries for any page size)"""
+        if not comments:
+            return []
+        replies = self.load_replies([comment.id for comment in comments])
+        all_ids = [comment.id for comment in comments]
+        all_ids.extend(reply.id for thread in replies.values() for reply in thread)
+        liked = self.liked_ids(all_ids, current_user_id)
+
+        threads = []
+        for comment in comments:
+            data = comment.to_dict(current_user_id=current_user_id, user_has_liked=comment.id in liked)
+            data['replies'] = [
+                reply.to_dict(current_user_id=current_user_id, user_has_liked=reply.id in liked)
+                for reply in replies[comment.id]
+            ]
+            threads.append(data)
+        return threads
+
+    def load_page(self, question_id: int, sort_by: str = 'recent', cursor: Optional[str] = None,
+                  limit: int = 10, current_user_id: Optional[int] = None) -> Tuple[List[dict], Optional[str], int]:
+        """One page of threads for a question
+
+        Returns (threads, next_cursor, total top-level comments); raises
+        ValueError for an unknown sort or a malformed cursor. Four queries
+        regardless of page depth or thread size: the cached total, top-level
+        comments with authors, replies with authors, and the viewer's likes.
+        """
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f'Unknown sort: {sort_by}')
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        total = db.session.query(Question.comments_count).filter(Question.id == question_id).scalar() or 0
+
+        query = self.top_level_query(question_id, sort_by)
+        if cursor:
+            query = query.filter(self._after(sort_by, cursor))
+        comments = query.limit(limit + 1).all()
+
+        next_cursor = None
+        if len(comments) > limit:
+            comments = comments[:limit]
+            last = comments[-1]
+            next_cursor = encode_cursor(*[getattr(last, column.key) for column in SORT_KEYS[sort_by]])
+        return self.build_threads(comments, current_user_id), next_cursor, total
+
+    def recount(self, connection, question_ids: Optional[Iterable[int]] = None) -> int:
+        """Recompute questions.comments_count from comments; all questions when `question_ids` is None"""
+        questions = Question.__table__
+        count = select(func.count(Comment.id))\
+            .where(Comment.question_id == questions.c.id, Comment.parent_id.is_(None))\
+            .scalar_subquery()
+        statement = update(questions).values(comments_count=count)
+        if question_ids is not None:
+            statement = statement.where(questions.c.id.in_(list(question_ids)))
+        return connection.execute(statement).rowcount
+
+
+comment_thread_loader = CommentThreadLoader()
+
+
+class CommentLikeService:
+    """Contention-safe likes: at most two statements per like or unlike"""
+
+    def _insert_like(self, comment_id: int, user_id: int) -> bool:
+        """Insert the like unless it exists or the comment is gone; True when a row was written"""
+        table = CommentLike.__table__
+        # INSERT ... SELECT ... WHERE EXISTS: a missing comment inserts nothing instead of failing the foreign key
+        source = select(
+            literal(comment_id, table.c.comment_id.type),
+            literal(user_id, table.c.user_id.type),
+            literal(now_hanoi(), table.c.created_at.type),
+        ).where(exists().where(Comment.__table__.c.id == comment_id))
+        columns = ['comment_id', 'user_id', 'created_at']
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            result = db.session.execute(dialect_insert(table).from_select(columns, source).on_conflict_do_nothing(
+                index_elements=[table.c.comment_id, table.c.user_id]
+            ))
+            return result.rowcount == 1
+
+        try:
+            with db.session.begin_nested():
+                return db.session.execute(insert(table).from_select(columns, source)).rowcount == 1
+        except IntegrityError:
+            return False
+
+    def _adjust(self, comment_id: int, delta: int):
+        """Relative likes_count update; returns (likes_count, author id, question id) or None"""
+        table = Comment.__table__
+        value = func.coalesce(table.c.likes_count, 0) + delta
+        statement = update(table).where(table.c.id == comment_id)\
+            .values(likes_count=case((value < 0, 0), else_=value))
+        if not db.session.get_bind().dialect.update_returning:
+            db.session.execute(statement)
+            return self._current(comment_id)
+        return db.session.execute(
+            statement.returning(table.c.likes_count, table.c.user_id, table.c.question_id)
+        ).first()
+
+    def _current(self, comment_id: int):
+        table = Comment.__table__
+        return db.session.execute(
+            select(table.c.likes_count, table.c.user_id, table.c.question_id).where(table.c.id == comment_id)
+        ).first()
+
+    def set_like(self, comment_id: int, user_id: int, liked: bool):
+        """Make the user's like state `liked`; idempotent
+
+        Returns (likes_count, changed, author_id, question_id), or None when
+        the comment does not exist. Nothing is committed here. Two statements:
+        the insert/delete, then the counter UPDATE ... RETURNING when the state
+        changed or a read of the counter when it did not.
+        """
+        if liked:
+            changed = self._insert_like(comment_id, user_id)
+        else:
+            changed = db.session.execute(
+                delete(CommentLike.__table__).where(CommentLike.comment_id == comment_id,
+                                                    CommentLike.user_id == user_id)
+            ).rowcount > 0
+
+        row = self._adjust(comment_id, 1 if liked else -1) if changed else self._current(comment_id)
+        if row is None:
+            return None
+        likes_count, author_id, question_id = row
+        return likes_count or 0, changed, author_id, question_id
+
+    def has_liked(self, comment_id: int, user_id: int) -> bool:
+        return db.session.execute(
+            select(CommentLike.id).where(CommentLike.comment_id == comment_id, CommentLike.user_id == user_id)
+        ).first() is not None
+
+    def reconcile_likes(self, connection, comment_ids: Optional[Iterable[int]] = None) -> int:
+        """Recompute likes_count from comment_likes where it drifted; returns rows fixed"""
+        comments = Comment.__table__
+        actual = select(func.count(CommentLike.id))\
+            .where(CommentLike.comment_id == comments.c.id).scalar_subquery()
+        statement = update(comments)\
+            .where(or_(comments.c.likes_count.is_(None), comments.c.likes_count != actual))\
+            .values(likes_count=actual)
+        if comment_ids is not None:
+            statement = statement.where(comments.c.id.in_(list(comment_ids)))
+        return connection.execute(statement).rowcount
+
+
+comment_like_service = CommentLikeService()
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_comments_count(session, flush_context):
+    """Keep questions.comments_count in step with top-level comments written in this flush"""
+    deltas = Counter()
+    for obj in session.new:
+        if isinstance(obj, Comment) and obj.parent_id is None:
+            deltas[obj.question_id] += 1
+    for obj in session.deleted:
+        if isinstance(obj, Comment) and obj.parent_id is None:
+            deltas[obj.question_id] -= 1
+    # Counters of deleted questions go away with the row
+    deleted_questions = {obj.id for obj in session.deleted if isinstance(obj, Question)}
+
+    questions = Question.__table__
+    connection = None
+    for question_id, delta in deltas.items():
+        if not delta or question_id in deleted_questions:
+            continue
+        connection = connection or session.connection()
+        connection.execute(
+            update(questions).where(questions.c.id == question_id)
+            .values(comments_count=questions.c.comments_count + delta)
+        )
@@ -0,0 +1,182 @@
+"""
+Media Job Service for OPIc Practice Portal
+A small durable queue for slow work on uploaded recordings (transcoding and
+other per-file stages), stored in the media_jobs table so it needs nothing
+beyond the database and survives restarts.
+
+Jobs are enqueued in the same transaction as the row they belong to and
+processed outside the request cycle by scripts/media_worker.py. Workers
+claim jobs with a conditional UPDATE, so several workers can run side by
+side; jobs left running by a crashed worker are put back after
+STALE_AFTER.
+"""
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy import and_, func, insert, select, update
+
+from app import db
+from app.models import MediaJob, now_hanoi
+from app.services.schema_cache import known_tables
+
+MAX_ATTEMPTS = 3
+STALE_AFTER = timedelta(minutes=15)
+
+
+def _now():
+    """Naive Asia/Ho_Chi_Minh time, like the stored values"""
+    return now_hanoi().replace(tzinfo=None)
+
+
+class MediaJobQueue:
+    """Enqueue, claim and run media jobs; handlers are registered per job kind"""
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[MediaJob], Optional[dict]]] = {}
+        self._batch_handlers: Dict[str, Callable[[List[MediaJob]], Dict[int, Any]]] = {}
+
+    def register(self, kind: str, handler: Callable[[MediaJob], Optional[dict]]) -> None:
+        """Handle jobs of `kind`; the handler's return value is stored as the job result"""
+        self._handlers[kind] = handler
+
+    def register_batch(self, kind: str, handler: Callable[[List[MediaJob]], Dict[int, Any]]) -> None:
+        """Handle the claimed jobs of `kind` together
+
+        The handler returns {job id: result}; a result that is an exception
+        fails that job only.
+        """
+        self._batch_handlers[kind] = handler
+
+    def kinds(self) -> List[str]:
+        """Job kinds with a registered handler"""
+        return sorted({**self._handlers, **self._batch_handlers})
+
+    def is_ready(self, connection) -> bool:
+        """Whether the media_jobs table exists (see KnownTables for how the answer is cached)"""
+        return known_tables.exists(connection, MediaJob.__tablename__)
+
+    # --- producers -----------------------------------------------------------
+
+    def enqueue(self, connection, kind: str, target: str, target_ids: Iterable[int]) -> int:
+        """Queue one job per target row on `connection` (the caller's transaction)"""
+        target_ids = sorted(set(target_ids))
+        if not target_ids or not self.is_ready(connection):
+            return 0
+        now = _now()
+        connection.execute(insert(MediaJob.__table__), [
+            {'kind': kind, 'target': target, 'target_id': target_id, 'status': 'pending',
+             'attempts': 0, 'created_at': now}
+            for target_id in target_ids
+        ])
+        return len(target_ids)
+
+    # --- workers -------------------------------------------------------------
+
+    def requeue_stale(self) -> int:
+        """Put back jobs whose worker died mid-run; returns the number requeued
+
+        A job that has already used MAX_ATTEMPTS is marked failed instead, so a
+        file that kills its worker (out of memory, a hanging ffmpeg) is not
+        retried forever.
+        """
+        now = _now()
+        stale = and_(MediaJob.status == 'running', MediaJob.started_at < now - STALE_AFTER)
+        db.session.execute(
+            update(MediaJob.__table__).where(stale, MediaJob.attempts >= MAX_ATTEMPTS)
+            .values(status='failed', error='Worker stopped while running the job', finished_at=now)
+        )
+        result = db.session.execute(
+            update(MediaJob.__table__).where(stale, MediaJob.attempts < MAX_ATTEMPTS)
+            .values(status='pending')
+        )
+        db.session.commit()
+        return result.rowcount or 0
+
+    def claim(self, kinds: Optional[Iterable[str]] = None, limit: int = 10) -> List[MediaJob]:
+        """Take up to `limit` pending jobs, oldest first; safe with concurrent workers"""
+        kinds = list(kinds or self.kinds())
+        if not kinds:
+            return []
+        candidates = db.session.execute(
+            select(MediaJob.id).where(MediaJob.status == 'pending', MediaJob.kind.in_(kinds))
+            .order_by(MediaJob.id).limit(limit)
+        ).scalars().all()
+
+        claimed = []
+        for job_id in candidates:
+            result = db.session.execute(
+                update(MediaJob.__table__)
+                .where(MediaJob.id == job_id, MediaJob.status == 'pending')
+                .values(status='running', attempts=MediaJob.attempts + 1, started_at=_now())
+            )
+            if result.rowcount == 1:
+                claimed.append(job_id)
+        db.session.commit()
+        if not claimed:
+            return []
+        return MediaJob.query.filter(MediaJob.id.in_(claimed)).order_by(MediaJob.id).all()
+
+    def run(self, job: MediaJob) -> bool:
+        """Run one claimed job and record the outcome; True on success
+
+        Failed jobs go back to pending until they have used MAX_ATTEMPTS.
+        """
+        try:
+            result = self._handlers[job.kind](job)
+        except Exception as e:
+            db.session.rollback()
+            result = e
+        ok = self._record(job, result)
+        db.session.commit()
+        return ok
+
+    def run_batch(self, jobs: List[MediaJob]) -> int:
+        """Run claimed jobs of one kind through its batch handler; returns the number that succeeded"""
+        try:
+            results = self._batch_handlers[jobs[0].kind](jobs)
+        except Exception as e:
+            db.session.rollback()
+            results = {job.id: e for job in jobs}
+        succeeded = sum(self._record(job, results.get(job.id)) for job in jobs)
+        db.session.commit()
+        return succeeded
+
+    def _record(self, job: MediaJob, result) -> bool:
+        """Store a job's outcome (not committed); failed jobs go back to pending until MAX_ATTEMPTS"""
+        job.finished_at = _now()
+        if isinstance(result, Exception):
+            current_app.logger.warning(f"[MediaJob] {job.kind} job {job.id} failed: {result}")
+            job.status = 'failed' if job.attempts >= MAX_ATTEMPTS else 'pending'
+            job.error = str(result)[:2000]
+            return False
+        job.status, job.result, job.error = 'done', result, None
+        return True
+
+    def work(self, kinds: Optional[Iterable[str]] = None, batch_size: int = 10) -> int:
+        """Process one batch of pending jobs; returns the number processed"""
+        self.requeue_stale()
+        jobs = self.claim(kinds, batch_size)
+        batches: Dict[str, List[MediaJob]] = {}
+        for job in jobs:
+            if job.kind in self._batch_handlers:
+                batches.setdefault(job.kind, []).append(job)
+            else:
+                self.run(job)
+        for batch in batches.values():
+            self.run_batch(batch)
+        return len(jobs)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Job counts by kind and status"""
+        rows = db.session.execute(
+            select(MediaJob.kind, MediaJob.status, func.count(MediaJob.id))
+            .group_by(MediaJob.kind, MediaJob.status)
+        ).all()
+        stats: Dict[str, Dict[str, int]] = {}
+        for kind, status, count in rows:
+            stats.setdefault(kind, {})[status] = count
+        return stats
+
+
+media_job_queue = MediaJobQueue()
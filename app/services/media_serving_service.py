@@ -0,0 +1,103 @@
+"""
+Media Serving Service for OPIc Practice Portal
+Sends stored files (recordings under /uploads, PDFs under /files) with
+HTTP caching and partial content:
+
+- a strong ETag (the SHA-256 for content-addressed recordings, otherwise
+  derived from size and mtime) and Last-Modified, answering If-None-Match /
+  If-Modified-Since with 304
+- Range / If-Range with 206 responses, so seeking in an audio player or
+  PDF viewer fetches only the bytes it needs
+- `Cache-Control: private` unless the call site marks the file public
+  (question audio, study PDFs), so shared proxies never keep a student's
+  recording; `immutable` for a year on content-addressed files, whose URL
+  always names the same bytes
+
+With MEDIA_OFFLOAD=x-accel (nginx) or x-sendfile (Apache/lighttpd), Flask
+only resolves and authorizes the request and the web server moves the
+bytes, including ranges. nginx needs one internal location per root, e.g.
+
+    location /protected/uploads/ { internal; alias /app/uploads/; }
+    location /protected/files/   { internal; alias /app/files/; }
+"""
+import mimetypes
+import os
+from typing import Optional
+from urllib.parse import quote
+
+from flask import current_app, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+
+OFFLOAD_MODES = ('x-accel', 'x-sendfile')
+DEFAULT_MAX_AGE = 3600
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class MediaServer:
+    """Conditional, range-capable file responses with optional web server offload"""
+
+    def offload_mode(self) -> Optional[str]:
+        mode = (current_app.config.get('MEDIA_OFFLOAD') or '').lower()
+        return mode if mode in OFFLOAD_MODES else None
+
+    def send(self, directory: str, filename: str, root: str, etag: Optional[str] = None,
+             immutable: bool = False, max_age: Optional[int] = None, mimetype: Optional[str] = None,
+             as_attachment: bool = False, download_name: Optional[str] = None, public: bool = False):
+        """Respond with `directory/filename`; `root` names the offload location ('uploads', 'files')
+
+        Raises NotFound for missing files and paths escaping `directory`.
+        """
+        if not os.path.isabs(directory):
+            directory = os.path.join(current_app.root_path, directory)
+        path = safe_join(directory, filename)
+        if path is None or not os.path.isfile(path):
+            raise NotFound()
+
+        stat = os.stat(path)
+        etag = etag or f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        if immutable:
+            max_age = IMMUTABLE_MAX_AGE
+        elif max_age is None:
+            max_age = int(current_app.config.get('MEDIA_CACHE_MAX_AGE', DEFAULT_MAX_AGE))
+        mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        mode = self.offload_mode()
+        if mode is None:
+            response = send_file(path, mimetype=mimetype, as_attachment=as_attachment,
+                                 download_name=download_name, conditional=True, etag=etag,
+                                 last_modified=stat.st_mtime, max_age=max_age)
+        else:
+            response = self._offload(mode, path, directory, filename, root, etag, stat.st_mtime, mimetype)
+            if download_name:
+                disposition = 'attachment' if as_attachment else 'inline'
+                response.headers.set('Content-Disposition', disposition, filename=download_name)
+
+        response.cache_control.public = public
+        response.cache_control.private = not public
+        response.cache_control.max_age = max_age
+        if immutable:
+            response.cache_control.immutable = True
+        return response
+
+    def _offload(self, mode: str, path: str, directory: str, filename: str, root: str,
+                 etag: str, mtime: float, mimetype: str):
+        """Empty response telling the web server which file to send"""
+        response = current_app.response_class(mimetype=mimetype)
+        response.set_etag(etag)
+        response.last_modified = mtime
+        if not is_resource_modified(request.environ, etag=etag, last_modified=response.last_modified):
+            response.status_code = 304
+            return response
+
+        if mode == 'x-sendfile':
+            response.headers['X-Sendfile'] = os.path.abspath(path)
+        else:
+            prefix = current_app.config.get('MEDIA_ACCEL_PREFIX', '/protected').rstrip('/')
+            relative = os.path.relpath(path, directory).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = f"{prefix}/{root}/{quote(relative)}"
+        return response
+
+
+media_server = MediaServer()
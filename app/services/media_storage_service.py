@@ -0,0 +1,250 @@
+"""
+Media Storage Service for OPIc Practice Portal
+Content-addressed storage for recordings. Each file is stored once under its
+SHA-256 in a two-level fan-out:
+
+    UPLOAD_FOLDER/media/ab/cd/abcd...ef.webm   (audio_url 'uploads/media/ab/cd/abcd...ef.webm')
+
+so no directory holds more than a few hundred entries, identical uploads
+share one file, and a URL always names the same bytes. media_blobs records
+the size and checksum of every stored file.
+
+Recordings saved before this layout live in flat directories
+(uploads/responses/, uploads/comments/). scripts/migrate_media_storage.py
+moves them in batches; media_aliases keeps the old paths resolvable, and
+/uploads/<path> redirects them to the new location.
+"""
+import hashlib
+import os
+import re
+import secrets
+import shutil
+from typing import Dict, Optional
+
+from flask import current_app
+from sqlalchemy import delete, exists, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Comment, MediaAlias, MediaBlob, Response, now_hanoi
+from app.services.schema_cache import known_tables
+
+MEDIA_DIRECTORY = 'media'
+CONTENT_URL_PATTERN = re.compile(r'^/?uploads/media/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})(\.[a-z0-9.]+)$')
+HASH_BUFFER_SIZE = 64 * 1024
+RECORDING_MODELS = (Response, Comment)
+
+
+def upload_path(audio_url: str) -> str:
+    """Filesystem path of an `uploads/...` URL"""
+    relative = audio_url.lstrip('/')
+    if relative.startswith('uploads/'):
+        relative = relative[len('uploads/'):]
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], relative)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(audio_url: Optional[str]) -> Optional[str]:
+    """SHA-256 named by a content-addressed URL, None for any other URL"""
+    match = CONTENT_URL_PATTERN.match(audio_url or '')
+    return match.group(1) if match else None
+
+
+class MediaStore:
+    """Store, resolve and release content-addressed recordings"""
+
+    def is_ready(self) -> bool:
+        """Whether the media_blobs/media_aliases tables exist (a missing table is re-checked)"""
+        return known_tables.exists(db.session.connection(), MediaAlias.__tablename__)
+
+    def url_for(self, sha256: str, extension: str) -> str:
+        return f"uploads/{MEDIA_DIRECTORY}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+    def incoming_path(self, extension: str) -> str:
+        """A fresh temporary path to write an upload to before storing it"""
+        directory = os.path.join(current_app.config['UPLOAD_FOLDER'], 'incoming')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{secrets.token_hex(16)}{extension}")
+
+    def store(self, source: str, extension: str, sha256: Optional[str] = None, move: bool = True) -> str:
+        """Put the file at `source` into the store and return its audio_url
+
+        Content already stored is reused. With `move` the source is consumed
+        (renamed or deleted); otherwise it is left in place. `sha256` skips
+        re-hashing a file whose checksum was just verified. The blob row is
+        added to the current transaction, not committed.
+        """
+        sha256 = (sha256 or file_sha256(source)).lower()
+        size = os.path.getsize(source)
+        url = self.url_for(sha256, extension)
+        destination = upload_path(url)
+
+        if os.path.exists(destination):
+            if move:
+                os.remove(source)
+        else:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            if move:
+                os.replace(source, destination)
+            else:
+                partial = f"{destination}.{secrets.token_hex(4)}.part"
+                try:
+                    os.link(source, partial)
+                except OSError:
+                    shutil.copyfile(source, partial)
+                os.replace(partial, destination)
+
+        if self.is_ready():
+            self._insert_ignore(MediaBlob.__table__, 'sha256',
+                                {'sha256': sha256, 'extension': extension, 'size': size, 'created_at': now_hanoi()})
+        return url
+
+    def save_upload(self, file_storage, extension: str) -> str:
+        """Store an uploaded werkzeug FileStorage; returns its audio_url"""
+        incoming = self.incoming_path(extension)
+        file_storage.save(incoming)
+        return self.store(incoming, extension)
+
+    def _insert_ignore(self, table, key: str, row: dict) -> None:
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            db.session.execute(dialect_insert(table).values(**row).on_conflict_do_nothing(index_elements=[key]))
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(table).values(**row))
+        except IntegrityError:
+            pass
+
+    # --- legacy paths --------------------------------------------------------
+
+    def alias(self, old_url: str, new_url: str) -> None:
+        """Make `old_url` resolve to the stored file `new_url` (current transaction)"""
+        sha256 = content_hash(new_url)
+        if sha256 and self.is_ready():
+            self._insert_ignore(MediaAlias.__table__, 'path',
+                                {'path': old_url.lstrip('/'), 'sha256': sha256, 'created_at': now_hanoi()})
+
+    def retarget(self, old_url: str, new_url: str) -> None:
+        """`old_url` was replaced by `new_url` (e.g. transcoded): point its aliases there too"""
+        if not self.is_ready():
+            return
+        old_sha256, new_sha256 = content_hash(old_url), content_hash(new_url)
+        if not new_sha256:
+            return
+        if old_sha256:
+            db.session.execute(update(MediaAlias.__table__)
+                               .where(MediaAlias.sha256 == old_sha256).values(sha256=new_sha256))
+        else:
+            self.alias(old_url, new_url)
+
+    def resolve(self, old_url: str) -> Optional[str]:
+        """Current URL of a moved legacy path, or None"""
+        if not self.is_ready():
+            return None
+        row = db.session.execute(
+            select(MediaBlob.sha256, MediaBlob.extension).join(MediaAlias, MediaAlias.sha256 == MediaBlob.sha256)
+            .where(MediaAlias.path == old_url.lstrip('/'))
+        ).first()
+        return self.url_for(*row) if row else None
+
+    def may_read(self, user, audio_url: str) -> bool:
+        """Whether `user` may play the recording at `audio_url`
+
+        Admins may play any recording, students their own responses, and
+        every signed-in user the voice comments shown under questions.
+        """
+        if getattr(user, 'is_admin', False):
+            return True
+        variants = (audio_url.lstrip('/'), '/' + audio_url.lstrip('/'))
+        if db.session.execute(select(exists().where(Response.user_id == user.id,
+                                                    Response.audio_url.in_(variants)))).scalar():
+            return True
+        return db.session.execute(select(exists().where(Comment.audio_url.in_(variants)))).scalar()
+
+    # --- cleanup -------------------------------------------------------------
+
+    def is_referenced(self, audio_url: str) -> bool:
+        """Whether any response or comment still points at `audio_url`"""
+        variants = (audio_url.lstrip('/'), '/' + audio_url.lstrip('/'))
+        return any(
+            db.session.execute(select(exists().where(or_(*(model.audio_url == v for v in variants))))).scalar()
+            for model in RECORDING_MODELS
+        )
+
+    def release(self, audio_url: str) -> bool:
+        """Delete a file nothing refers to any more; True when it was removed
+
+        Shared (deduplicated) files and files reachable through an alias are
+        kept. Commits the removal of the blob row.
+        """
+        if not audio_url or self.is_referenced(audio_url):
+            return False
+        sha256 = content_hash(audio_url)
+        if sha256 and self.is_ready():
+            if db.session.execute(select(exists().where(MediaAlias.sha256 == sha256))).scalar():
+                return False
+            db.session.execute(delete(MediaBlob.__table__).where(MediaBlob.sha256 == sha256))
+            db.session.commit()
+        path = upload_path(audio_url)
+        if os.path.exists(path):
+            os.remove(path)
+        return True
+
+    # --- migration -----------------------------------------------------------
+
+    def migrate_batch(self, model, last_id: int = 0, batch_size: int = 500) -> Dict[str, int]:
+        """Move the next `batch_size` flat-layout recordings of `model` into the store
+
+        Files are linked into place, the rows swapped with a compare-and-set
+        UPDATE and aliases recorded in one commit; the old files are removed
+        only afterwards, so an interrupted batch can simply be run again.
+        Returns counts and the last id seen (0 when nothing was left).
+        """
+        stats = {'moved': 0, 'missing': 0, 'changed': 0, 'last_id': 0}
+        table = model.__table__
+        rows = db.session.execute(
+            select(table.c.id, table.c.audio_url).where(
+                table.c.id > last_id, table.c.audio_url.isnot(None), table.c.audio_url != '',
+                ~table.c.audio_url.like(f'uploads/{MEDIA_DIRECTORY}/%')
+            ).order_by(table.c.id).limit(batch_size)
+        ).all()
+
+        moved_sources = []
+        for row_id, audio_url in rows:
+            stats['last_id'] = row_id
+            source = upload_path(audio_url)
+            new_url = self.resolve(audio_url)
+            if not new_url:
+                if not os.path.exists(source):
+                    stats['missing'] += 1
+                    continue
+                name = os.path.basename(source)
+                extension = '.opus.webm' if name.endswith('.opus.webm') else os.path.splitext(name)[1].lower()
+                new_url = self.store(source, extension, move=False)
+                self.alias(audio_url, new_url)
+                moved_sources.append(source)
+            swapped = db.session.execute(
+                update(table).where(table.c.id == row_id, table.c.audio_url == audio_url).values(audio_url=new_url)
+            ).rowcount == 1
+            stats['moved' if swapped else 'changed'] += 1
+        db.session.commit()
+
+        for source in moved_sources:
+            if os.path.exists(source):
+                os.remove(source)
+        return stats
+
+
+media_store = MediaStore()
@@ -0,0 +1,378 @@
+"""
+Notification Service for OPIc Practice Portal
+Notification retention: notifications older than NOTIFICATION_RETENTION_DAYS
+are hidden from reads right away and physically removed by a scheduled job
+(scripts/purge_notifications.py) in bounded id-range chunks, so the polling
+endpoint never writes.
+
+Unread counter: users.unread_notifications is adjusted in the same
+transaction as notification inserts, deletes and read-state changes made
+through the ORM; bulk statements recount the affected users. Like the feed,
+it only counts notifications inside the retention window; the purge job
+recounts the users whose notifications it expires. After commit
+the new value is pushed to the user's open tabs through the notification
+broker and stored in the cache, so badges update without polling and the
+badge endpoints answer without loading the user row.
+
+Outbox: every fan-out point (mentions, replies, likes, pins) goes through
+NotificationOutbox, which skips self-notifications and duplicates with one
+query and writes all new rows with a single multi-row insert.
+
+Feed: the notification panel is served by one joined query that projects
+just the columns it shows (actor, question topic, comment preview), so its
+cost does not grow with the page size.
+"""
+import re
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import case, delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app import cache, db
+from app.models import Comment, Notification, Question, User, now_hanoi
+from app.services.push_service import notification_broker
+
+DEFAULT_RETENTION_DAYS = 30
+UNREAD_CACHE_TIMEOUT = 3600  # Bounds staleness from writers in other processes (scripts)
+DEFAULT_PURGE_BATCH_SIZE = 5000
+
+
+class NotificationRetention:
+    """Retention window and batch purge for notifications"""
+
+    def retention_days(self) -> int:
+        return int(current_app.config.get('NOTIFICATION_RETENTION_DAYS', DEFAULT_RETENTION_DAYS))
+
+    def cutoff(self, retention_days: Optional[int] = None) -> datetime:
+        """Oldest created_at still kept (naive Asia/Ho_Chi_Minh time, like the stored values)"""
+        days = self.retention_days() if retention_days is None else retention_days
+        return now_hanoi().replace(tzinfo=None) - timedelta(days=days)
+
+    def purge(self, retention_days: Optional[int] = None,
+              batch_size: int = DEFAULT_PURGE_BATCH_SIZE) -> int:
+        """Delete expired notifications in id windows of `batch_size`, committing each chunk
+
+        Short transactions keep lock times bounded on both PostgreSQL and
+        SQLite; a crash midway loses nothing, the next run picks up the rest.
+        Returns the number of rows deleted.
+        """
+        cutoff = self.cutoff(retention_days)
+        low, high = db.session.execute(
+            select(func.min(Notification.id), func.max(Notification.id))
+            .where(Notification.created_at < cutoff)
+        ).one()
+        db.session.commit()
+        if low is None:
+            return 0
+
+        deleted = 0
+        for start in range(low, high + 1, batch_size):
+            window = (Notification.id >= start, Notification.id < start + batch_size,
+                      Notification.created_at < cutoff)
+            # Users losing unread notifications in this chunk need their counter recounted
+            user_ids = db.session.execute(
+                select(Notification.user_id).where(*window, Notification.is_read.isnot(True)).distinct()
+            ).scalars().all()
+            result = db.session.execute(
+                delete(Notification).where(*window).execution_options(synchronize_session=False)
+            )
+            unread_counter.refresh(user_ids)
+            db.session.commit()
+            deleted += result.rowcount or 0
+        return deleted
+
+
+notification_retention = NotificationRetention()
+
+
+def _unread_key(user_id: int) -> str:
+    return f'unread:{user_id}'
+
+
+class UnreadCounter:
+    """Maintains users.unread_notifications
+
+    Bulk statements that bypass the ORM (Query.delete/update) must call
+    refresh() for the users they touch.
+    """
+
+    def recount(self, connection, user_ids: Optional[Iterable[int]] = None) -> int:
+        """Recompute the counter from notifications in the retention window; all users when `user_ids` is None"""
+        users = User.__table__
+        unread = select(func.count(Notification.id))\
+            .where(Notification.user_id == users.c.id, Notification.is_read.isnot(True),
+                   Notification.created_at >= notification_retention.cutoff())\
+            .scalar_subquery()
+        statement = update(users).values(unread_notifications=unread)
+        if user_ids is not None:
+            user_ids = sorted(set(user_ids))
+            if not user_ids:
+                return 0
+            statement = statement.where(users.c.id.in_(user_ids))
+        return connection.execute(statement).rowcount
+
+    def refresh(self, user_ids: Iterable[int]) -> None:
+        """Recount users in the current transaction and push their new counters after commit"""
+        user_ids = set(user_ids)
+        self.recount(db.session.connection(), user_ids)
+        db.session.info.setdefault('notification_push', set()).update(user_ids)
+
+    def apply_deltas(self, connection, deltas: Dict[int, int]) -> None:
+        """Relative counter updates, never going below zero"""
+        users = User.__table__
+        for user_id, delta in deltas.items():
+            if not delta:
+                continue
+            value = users.c.unread_notifications + delta
+            connection.execute(
+                update(users).where(users.c.id == user_id)
+                .values(unread_notifications=case((value < 0, 0), else_=value))
+            )
+
+    def publish(self, connection, user_ids: Iterable[int]) -> None:
+        """Push the committed counters of `user_ids` to their open streams and the cache"""
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        counts = connection.execute(
+            select(User.id, User.unread_notifications).where(User.id.in_(user_ids))
+        ).all()
+        for user_id, count in counts:
+            self._store(user_id, count or 0)
+            notification_broker.publish(user_id, {'unread_count': count or 0})
+
+    def cached(self, user_id: int) -> Optional[int]:
+        """Badge count from the cache, falling back to the counter column; None when the user is gone"""
+        try:
+            count = cache.get(_unread_key(user_id))
+        except Exception as e:
+            current_app.logger.warning(f"[Notifications] Cache unavailable, reading unread count: {e}")
+            count = None
+        if count is not None:
+            return count
+        row = db.session.execute(select(User.unread_notifications).where(User.id == user_id)).first()
+        if row is None:
+            return None
+        self._store(user_id, row[0] or 0)
+        return row[0] or 0
+
+    def forget(self, user_ids: Iterable[int]) -> None:
+        for user_id in user_ids:
+            try:
+                cache.delete(_unread_key(user_id))
+            except Exception as e:
+                current_app.logger.warning(f"[Notifications] Could not drop cached count of user {user_id}: {e}")
+
+    def _store(self, user_id: int, count: int) -> None:
+        try:
+            cache.set(_unread_key(user_id), count, timeout=UNREAD_CACHE_TIMEOUT)
+        except Exception as e:
+            current_app.logger.warning(f"[Notifications] Could not cache unread count of user {user_id}: {e}")
+
+
+unread_counter = UnreadCounter()
+
+
+def extract_mentions(text: str) -> List[str]:
+    """Distinct @usernames in text (usernames may contain dots, underscores and hyphens)"""
+    return sorted(set(re.findall(r'@([\w.-]+)', text or '')))
+
+
+class NotificationOutbox:
+    """Single entry point for creating notifications in bulk
+
+    Rows are written in the caller's transaction (nothing is committed here);
+    unread counters are bumped with one UPDATE and pushed after the commit.
+    """
+
+    def notify(self, recipient_ids: Iterable[int], actor_id: int, type: str,
+               question_id: int, comment_id: Optional[int] = None) -> int:
+        """Notify each recipient once per (actor, type, comment); returns rows written"""
+        recipients = {user_id for user_id in recipient_ids if user_id and user_id != actor_id}
+        if not recipients:
+            return 0
+
+        existing = select(Notification.user_id).where(
+            Notification.user_id.in_(recipients),
+            Notification.actor_id == actor_id,
+            Notification.type == type,
+            Notification.comment_id.is_(None) if comment_id is None else Notification.comment_id == comment_id
+        )
+        recipients -= set(db.session.execute(existing).scalars())
+        if not recipients:
+            return 0
+
+        recipients = sorted(recipients)
+        now = now_hanoi()
+        db.session.execute(insert(Notification), [
+            {'user_id': user_id, 'actor_id': actor_id, 'type': type, 'question_id': question_id,
+             'comment_id': comment_id, 'is_read': False, 'created_at': now}
+            for user_id in recipients
+        ])
+        # Bulk inserts bypass the flush listeners: one new unread row per recipient
+        users = User.__table__
+        db.session.execute(
+            update(users).where(users.c.id.in_(recipients))
+            .values(unread_notifications=users.c.unread_notifications + 1)
+        )
+        db.session.info.setdefault('notification_push', set()).update(recipients)
+        return len(recipients)
+
+    def notify_mentions(self, comment, actor_id: int) -> int:
+        """Notify users @mentioned in a comment: resolve, dedupe and insert in three queries"""
+        usernames = extract_mentions(comment.content)
+        if not usernames:
+            return 0
+        user_ids = db.session.execute(
+            select(User.id).where(User.username.in_(usernames))
+        ).scalars().all()
+        return self.notify(user_ids, actor_id, 'mention', comment.question_id, comment.id)
+
+    def retract(self, recipient_id: int, actor_id: int, type: str, comment_id: Optional[int] = None) -> int:
+        """Remove a notification again (e.g. after an unlike) and fix the recipient's counter"""
+        result = db.session.execute(
+            delete(Notification).where(
+                Notification.user_id == recipient_id,
+                Notification.actor_id == actor_id,
+                Notification.type == type,
+                Notification.comment_id == comment_id
+            ).execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            unread_counter.refresh([recipient_id])
+        return result.rowcount
+
+
+notification_outbox = NotificationOutbox()
+
+
+class NotificationFeed:
+    """Pages of the notification panel without per-row lazy loads"""
+
+    PREVIEW_LENGTH = 100
+
+    def page(self, user_id: int, is_read: Optional[bool] = None,
+             offset: int = 0, limit: int = 20) -> Tuple[List[dict], int]:
+        """Serialized notifications within the retention window, newest first, and their total"""
+        conditions = [Notification.user_id == user_id,
+                      Notification.created_at >= notification_retention.cutoff()]
+        if is_read is not None:
+            conditions.append(Notification.is_read == is_read)
+
+        total = db.session.execute(
+            select(func.count(Notification.id)).where(*conditions)
+        ).scalar() or 0
+        if not total or offset >= total:
+            return [], total
+
+        rows = db.session.execute(
+            select(
+                Notification.id, Notification.type, Notification.question_id, Notification.comment_id,
+                Notification.is_read, Notification.created_at,
+                User.id.label('actor_id'), User.username, User.name, User.avatar,
+                Question.topic,
+                func.substr(Comment.content, 1, self.PREVIEW_LENGTH).label('comment_preview')
+            )
+            .join(User, User.id == Notification.actor_id)
+            .outerjoin(Question, Question.id == Notification.question_id)
+            .outerjoin(Comment, Comment.id == Notification.comment_id)
+            .where(*conditions)
+            .order_by(Notification.created_at.desc(), Notification.id.desc())
+            .offset(offset).limit(limit)
+        ).all()
+        return [self.serialize(row) for row in rows], total
+
+    def serialize(self, row) -> dict:
+        """Same shape as Notification.to_dict(), from a projected row"""
+        return {
+            'id': row.id,
+            'type': row.type,
+            'question_id': row.question_id,
+            'comment_id': row.comment_id,
+            'is_read': row.is_read,
+            'created_at': row.created_at.isoformat() if row.created_at else None,
+            'actor': {
+                'id': row.actor_id,
+                'username': row.username,
+                'name': row.name,
+                'avatar': row.avatar
+            },
+            'question_topic': row.topic,
+            'comment_preview': row.comment_preview
+        }
+
+
+notification_feed = NotificationFeed()
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_read_changes(session, flush_context, instances):
+    """Remember is_read changes while the attribute history is still available"""
+    changes = session.info.setdefault('notification_read_changes', [])
+    cutoff = None
+    for obj in session.dirty:
+        if not isinstance(obj, Notification):
+            continue
+        history = inspect(obj).attrs.is_read.history
+        if not history.has_changes():
+            continue
+        if has_app_context():
+            cutoff = cutoff or notification_retention.cutoff()
+            if obj.created_at and obj.created_at.replace(tzinfo=None) < cutoff:
+                continue  # Outside the retention window, so not in the counter
+        was_read = bool(history.deleted[0]) if history.deleted else False
+        if was_read != bool(obj.is_read):
+            changes.append((obj.user_id, 1 if was_read else -1))
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_unread_counters(session, flush_context):
+    """Adjust unread counters for notifications written in this flush"""
+    deltas: Dict[int, int] = {}
+    for obj in session.new:
+        if isinstance(obj, Notification) and not obj.is_read:
+            deltas[obj.user_id] = deltas.get(obj.user_id, 0) + 1
+    for user_id, delta in session.info.pop('notification_read_changes', ()):
+        deltas[user_id] = deltas.get(user_id, 0) + delta
+
+    # Deleted rows may have been expired, so recount those users
+    to_recount = {obj.user_id for obj in session.deleted if isinstance(obj, Notification)}
+    deleted_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    to_recount -= deleted_users
+    if deleted_users:
+        session.info.setdefault('notification_forget', set()).update(deleted_users)
+    deltas = {user_id: delta for user_id, delta in deltas.items()
+              if delta and user_id not in deleted_users and user_id not in to_recount}
+    if not deltas and not to_recount:
+        return
+
+    connection = session.connection()
+    unread_counter.apply_deltas(connection, deltas)
+    if to_recount:
+        unread_counter.recount(connection, to_recount)
+    session.info.setdefault('notification_push', set()).update(deltas, to_recount)
+
+
+@event.listens_for(Session, 'after_commit')
+def _push_unread_counters(session):
+    forgotten = session.info.pop('notification_forget', None)
+    if forgotten and has_app_context():
+        unread_counter.forget(forgotten)
+    user_ids = session.info.pop('notification_push', None)
+    if not user_ids or not has_app_context():
+        return
+    try:
+        # The transaction is over; read the committed values on a fresh connection
+        with db.engine.connect() as connection:
+            unread_counter.publish(connection, user_ids)
+    except Exception as e:
+        current_app.logger.warning(f"[Push] Could not publish unread counters: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_unread_changes_after_rollback(session):
+    session.info.pop('notification_read_changes', None)
+    session.info.pop('notification_push', None)
+    session.info.pop('notification_forget', None)
@@ -0,0 +1,49 @@
+"""
+Keyset pagination helpers for OPIc Practice Portal
+Cursors are opaque, URL-safe tokens holding the sort key of the last row on
+a page, so the next page is an indexed range scan instead of an OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence
+
+
+def encode_cursor(*values) -> str:
+    """Encode the sort key of the last row on a page"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _typed(value, kind):
+    """Cursor value as `kind` (datetime, int or bool); ValueError when it has another type"""
+    if kind is datetime and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if kind is int and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if kind is bool and isinstance(value, bool):
+        return value
+    raise ValueError('Invalid cursor')
+
+
+def decode_cursor(cursor: Optional[str], types: Optional[Sequence[type]] = None) -> Optional[List]:
+    """Decode a cursor from encode_cursor; raises ValueError for malformed input
+
+    With `types` the cursor must hold exactly one value per type, and each
+    value is converted (datetimes are parsed from their ISO form).
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {e}') from e
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    if types is not None:
+        if len(values) != len(types):
+            raise ValueError('Invalid cursor')
+        values = [_typed(value, kind) for value, kind in zip(values, types)]
+    return values
@@ -0,0 +1,263 @@
+"""
+Progress Service for OPIc Practice Portal
+Maintains user_daily_progress (one row per user, day, mode and question level)
+and serves score-trend series for progress charts straight from it.
+
+New responses and new scores are folded in with upserts in the same
+transaction; deleted responses and changed scores rebuild the affected
+user-days from `responses`, which is also what the backfill script does.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.models import Question, Response, User, UserDailyProgress, now_hanoi
+
+SERIES_RANGES = (7, 30, 90)
+COUNTER_COLUMNS = ('attempts', 'seconds_spoken', 'scored_count', 'score_sum')
+
+RollupKey = Tuple[int, date, str, str]
+
+
+def _to_date(value) -> Optional[date]:
+    """Normalize DATE(...) results (a string on SQLite) and datetimes to a date"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def _greatest(column, value):
+    """GREATEST(column, value) treating NULL as missing, portable across dialects"""
+    return case((or_(column.is_(None), column < value), value), else_=column)
+
+
+def _empty_rollup() -> dict:
+    row = {column: 0 for column in COUNTER_COLUMNS}
+    row['max_score'] = None
+    return row
+
+
+class ProgressService:
+    """Reads and maintains daily progress rollups"""
+
+    def _upsert(self, connection, key: RollupKey, delta: dict) -> None:
+        """Add a delta to one rollup row, creating it if needed"""
+        table = UserDailyProgress.__table__
+        user_id, day, mode, level = key
+        row = dict(delta, user_id=user_id, day=day, mode=mode, level=level)
+        increments = {column: table.c[column] + delta[column] for column in COUNTER_COLUMNS}
+        if delta['max_score'] is not None:
+            increments['max_score'] = _greatest(table.c.max_score, delta['max_score'])
+
+        dialect = connection.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            statement = dialect_insert(table).values(**row)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.user_id, table.c.day, table.c.mode, table.c.level],
+                set_=increments
+            ))
+            return
+
+        result = connection.execute(
+            update(table).where(and_(table.c.user_id == user_id, table.c.day == day,
+                                     table.c.mode == mode, table.c.level == level)).values(**increments)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(**row))
+
+    def apply_deltas(self, connection, deltas: Dict[RollupKey, dict]) -> None:
+        """Upsert per-(user, day, mode, level) increments"""
+        for key, delta in deltas.items():
+            self._upsert(connection, key, delta)
+
+    def rebuild(self, connection, user_days: Optional[Iterable[Tuple[int, date]]] = None) -> int:
+        """Recompute rollup rows from responses; everything when `user_days` is None"""
+        table = UserDailyProgress.__table__
+        responses = Response.__table__.c
+        day = func.date(responses.created_at)
+        query = select(
+            responses.user_id,
+            day,
+            func.coalesce(responses.mode, 'practice'),
+            func.coalesce(Question.difficulty_level, ''),
+            func.count(responses.id),
+            func.coalesce(func.sum(responses.duration), 0),
+            func.count(responses.ai_score),
+            func.coalesce(func.sum(responses.ai_score), 0),
+            func.max(responses.ai_score),
+        ).select_from(Response.__table__.outerjoin(Question.__table__, responses.question_id == Question.id))\
+            .where(responses.created_at.isnot(None))\
+            .group_by(responses.user_id, day, func.coalesce(responses.mode, 'practice'),
+                      func.coalesce(Question.difficulty_level, ''))
+
+        if user_days is None:
+            connection.execute(delete(table))
+        else:
+            user_days = sorted(set(user_days))
+            if not user_days:
+                return 0
+            for user_id, rollup_day in user_days:
+                connection.execute(delete(table).where(and_(table.c.user_id == user_id, table.c.day == rollup_day)))
+            # Each day spans [midnight, next midnight) of created_at
+            query = query.where(or_(*[
+                and_(responses.user_id == user_id,
+                     responses.created_at >= datetime.combine(rollup_day, datetime.min.time()),
+                     responses.created_at < datetime.combine(rollup_day + timedelta(days=1), datetime.min.time()))
+                for user_id, rollup_day in user_days
+            ]))
+
+        rows = [{
+            'user_id': user_id, 'day': _to_date(rollup_day), 'mode': mode, 'level': level,
+            'attempts': attempts, 'seconds_spoken': float(seconds or 0), 'scored_count': scored,
+            'score_sum': int(score_sum or 0), 'max_score': max_score
+        } for user_id, rollup_day, mode, level, attempts, seconds, scored, score_sum, max_score
+            in connection.execute(query)]
+        if rows:
+            connection.execute(insert(table), rows)
+        return len(rows)
+
+    def get_series(self, user_id: int, days: int = 30) -> Dict:
+        """Daily series for the last `days` days (zero-filled), read only from rollups"""
+        today = now_hanoi().date()
+        start = today - timedelta(days=days - 1)
+        rows = UserDailyProgress.query.filter(
+            UserDailyProgress.user_id == user_id,
+            UserDailyProgress.day >= start,
+            UserDailyProgress.day <= today
+        ).all()
+
+        points = {}
+        for offset in range(days):
+            point_day = start + timedelta(days=offset)
+            points[point_day] = {
+                'date': point_day.isoformat(), 'attempts': 0, 'minutes': 0.0,
+                'avg_score': None, 'max_score': None, 'practice': 0, 'test': 0, 'levels': {},
+                '_scored': 0, '_score_sum': 0
+            }
+
+        totals = {'attempts': 0, 'minutes': 0.0, 'scored': 0, 'score_sum': 0, 'max_score': None, 'levels': {}}
+        for row in rows:
+            point = points.get(_to_date(row.day))
+            if point is None:
+                continue
+            point['attempts'] += row.attempts
+            point['minutes'] += (row.seconds_spoken or 0) / 60.0
+            point[row.mode if row.mode in ('practice', 'test') else 'practice'] += row.attempts
+            if row.level:
+                point['levels'][row.level] = point['levels'].get(row.level, 0) + row.attempts
+                totals['levels'][row.level] = totals['levels'].get(row.level, 0) + row.attempts
+            point['_scored'] += row.scored_count
+            point['_score_sum'] += row.score_sum
+            if row.max_score is not None:
+                point['max_score'] = max(point['max_score'] or row.max_score, row.max_score)
+                totals['max_score'] = max(totals['max_score'] or row.max_score, row.max_score)
+
+        series: List[dict] = []
+        for point in points.values():
+            scored, score_sum = point.pop('_scored'), point.pop('_score_sum')
+            if scored:
+                point['avg_score'] = round(score_sum / scored, 1)
+            point['minutes'] = round(point['minutes'], 1)
+            totals['attempts'] += point['attempts']
+            totals['minutes'] += point['minutes']
+            totals['scored'] += scored
+            totals['score_sum'] += score_sum
+            series.append(point)
+
+        scored, score_sum = totals.pop('scored'), totals.pop('score_sum')
+        totals['avg_score'] = round(score_sum / scored, 1) if scored else None
+        totals['minutes'] = round(totals['minutes'], 1)
+        return {'days': days, 'series': series, 'totals': totals}
+
+
+progress_service = ProgressService()
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_progress_score_changes(session, flush_context, instances):
+    """Remember responses whose ai_score or duration changed (history is gone after flush)"""
+    changes = session.info.setdefault('progress_changes', [])
+    for obj in session.dirty:
+        if not isinstance(obj, Response):
+            continue
+        state = inspect(obj)
+        score, duration = state.attrs.ai_score.history, state.attrs.duration.history
+        if not score.has_changes() and not duration.has_changes():
+            continue
+        old_score = score.deleted[0] if score.deleted else None
+        changes.append((obj, old_score, obj.ai_score, duration.has_changes()))
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_daily_progress(session, flush_context):
+    """Fold responses written in this flush into the daily rollups"""
+    new_responses = [obj for obj in session.new if isinstance(obj, Response)]
+    changes = session.info.pop('progress_changes', ())
+    deleted = [obj for obj in session.deleted if isinstance(obj, Response)]
+    if not new_responses and not changes and not deleted:
+        return
+
+    deleted_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    connection = session.connection()
+
+    # Question levels for the new responses in one query
+    question_ids = {obj.question_id for obj in new_responses if obj.question_id}
+    levels = {}
+    if question_ids:
+        levels = dict(connection.execute(
+            select(Question.id, Question.difficulty_level).where(Question.id.in_(question_ids))
+        ).all())
+
+    deltas: Dict[RollupKey, dict] = {}
+    to_rebuild = set()
+    for obj in new_responses:
+        if obj.created_at is None or obj.user_id in deleted_users:
+            continue
+        key = (obj.user_id, obj.created_at.date(), obj.mode or 'practice', levels.get(obj.question_id) or '')
+        delta = deltas.setdefault(key, _empty_rollup())
+        delta['attempts'] += 1
+        delta['seconds_spoken'] += obj.duration or 0
+        if obj.ai_score is not None:
+            delta['scored_count'] += 1
+            delta['score_sum'] += obj.ai_score
+            delta['max_score'] = max(delta['max_score'] or obj.ai_score, obj.ai_score)
+
+    for obj, old_score, new_score, duration_changed in changes:
+        if obj.created_at is None or obj.user_id in deleted_users:
+            continue
+        if old_score is None and new_score is not None and not duration_changed:
+            # First score for a response: a plain increment
+            level = connection.execute(
+                select(Question.difficulty_level).where(Question.id == obj.question_id)
+            ).scalar()
+            key = (obj.user_id, obj.created_at.date(), obj.mode or 'practice', level or '')
+            delta = deltas.setdefault(key, _empty_rollup())
+            delta['scored_count'] += 1
+            delta['score_sum'] += new_score
+            delta['max_score'] = max(delta['max_score'] or new_score, new_score)
+        else:
+            to_rebuild.add((obj.user_id, obj.created_at.date()))
+
+    for obj in deleted:
+        if obj.created_at is not None and obj.user_id not in deleted_users:
+            to_rebuild.add((obj.user_id, obj.created_at.date()))
+
+    # Rebuilt days already include this flush; don't add their deltas twice
+    deltas = {key: delta for key, delta in deltas.items() if (key[0], key[1]) not in to_rebuild}
+    progress_service.apply_deltas(connection, deltas)
+    progress_service.rebuild(connection, to_rebuild)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_progress_changes_after_rollback(session):
+    session.info.pop('progress_changes', None)
@@ -0,0 +1,126 @@
+"""
+Push Service for OPIc Practice Portal
+Fans notification events out to a user's open browser tabs (Server-Sent
+Events streams) without touching the database.
+
+Each process keeps its own subscriber registry. With the in-memory backend
+(NOTIFICATION_PUSH_BACKEND=memory, the development server) events are
+delivered in-process only; with the Redis backend they are published on a
+Redis channel and every worker process runs one listener thread that hands
+them to its local subscribers.
+"""
+import json
+import queue
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from flask import current_app
+
+QUEUE_SIZE = 16
+CHANNEL_PATTERN = 'notify:*'
+
+
+class Subscription:
+    """One open stream: a bounded queue of events for a user"""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.events: queue.Queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    def get(self, timeout: float) -> Optional[dict]:
+        """Next event, or None when nothing arrived within `timeout` seconds"""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class NotificationBroker:
+    """In-process pub/sub for notification events, optionally bridged through Redis"""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._redis = None
+        self._channel_prefix = ''
+        self._listener: Optional[threading.Thread] = None
+
+    # --- configuration -------------------------------------------------------
+
+    def _backend(self):
+        """Redis client when the redis backend is configured, else None"""
+        if current_app.config.get('NOTIFICATION_PUSH_BACKEND', 'memory') != 'redis':
+            return None
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(current_app.config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'))
+            self._channel_prefix = current_app.config.get('CACHE_KEY_PREFIX', '')
+        return self._redis
+
+    def _ensure_listener(self, client) -> None:
+        """Start this process's Redis listener thread once"""
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, args=(client,),
+                                              name='notification-listener', daemon=True)
+            self._listener.start()
+
+    def _listen(self, client) -> None:
+        prefix = f'{self._channel_prefix}notify:'
+        while True:
+            try:
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self._channel_prefix + CHANNEL_PATTERN)
+                for message in pubsub.listen():
+                    channel = message['channel'].decode() if isinstance(message['channel'], bytes) else message['channel']
+                    self._deliver(int(channel[len(prefix):]), json.loads(message['data']))
+            except Exception:
+                # Connection dropped: back off and resubscribe; streams stay open meanwhile
+                time.sleep(1)
+
+    # --- subscribers ---------------------------------------------------------
+
+    def subscribe(self, user_id: int) -> Subscription:
+        client = self._backend()
+        if client is not None:
+            self._ensure_listener(client)
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def _deliver(self, user_id: int, event: dict) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.events.put_nowait(event)
+            except queue.Full:
+                # A stalled tab: events carry absolute values, so dropping is safe
+                pass
+
+    # --- publishing ----------------------------------------------------------
+
+    def publish(self, user_id: int, event: dict) -> None:
+        """Send an event to every open stream of the user, in any worker"""
+        client = self._backend()
+        if client is None:
+            self._deliver(user_id, event)
+            return
+        try:
+            client.publish(f'{self._channel_prefix}notify:{user_id}', json.dumps(event))
+        except Exception as e:
+            current_app.logger.warning(f"[Push] Could not publish to user {user_id}: {e}")
+
+
+notification_broker = NotificationBroker()
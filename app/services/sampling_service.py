@@ -0,0 +1,143 @@
+"""
+Question Sampling Service for OPIc Practice Portal
+Draws k distinct random question ids from dense NumPy id arrays kept per
+(language, level, topic) filter, instead of ORDER BY random() over the table.
+
+Pools are views over the question catalog snapshot and are dropped whenever
+the catalog version changes. Recently seen questions are excluded with a
+packed bitset over catalog positions, so a draw costs O(k) in the common case.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from flask import current_app, has_request_context, session
+
+from app.services.catalog_service import question_catalog, CatalogSnapshot
+
+RECENT_QUESTIONS_KEY = 'recent_practice_questions'
+DEFAULT_RECENT_LIMIT = 50
+
+
+class SeenBitset:
+    """Packed bitset of catalog positions (one bit per question)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.bits = np.zeros((size + 7) >> 3, dtype=np.uint8)
+
+    @classmethod
+    def from_positions(cls, size: int, positions: np.ndarray) -> 'SeenBitset':
+        bitset = cls(size)
+        if len(positions):
+            np.bitwise_or.at(bitset.bits, positions >> 3, (1 << (positions & 7)).astype(np.uint8))
+        return bitset
+
+    def contains(self, positions: np.ndarray) -> np.ndarray:
+        """Vectorized membership test; returns a boolean mask"""
+        return ((self.bits[positions >> 3] >> (positions & 7).astype(np.uint8)) & 1).astype(bool)
+
+
+class QuestionSampler:
+    """Constant-time random question sampling over the question catalog"""
+
+    def __init__(self, catalog=question_catalog):
+        self.catalog = catalog
+        # (snapshot, all catalog ids, per-filter pools), swapped as one unit
+        self._state: Tuple[Optional[CatalogSnapshot], np.ndarray, Dict] = (None, np.empty(0, dtype=np.int64), {})
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng()
+
+    def _current(self) -> Tuple[CatalogSnapshot, np.ndarray, Dict]:
+        """Return the sampling state, dropping pools built for an older catalog version"""
+        snapshot = self.catalog.snapshot()
+        state = self._state
+        if state[0] is not snapshot:
+            with self._lock:
+                state = self._state
+                if state[0] is not snapshot:
+                    all_ids = np.frombuffer(snapshot.ids, dtype=np.intc).astype(np.int64)
+                    state = self._state = (snapshot, all_ids, {})
+        return state
+
+    @staticmethod
+    def _pool(state, language: str, level: str = None, topic: str = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Dense (ids, catalog positions) arrays for a filter, built on first use"""
+        snapshot, all_ids, pools = state
+        key = (language, level or None, topic or None)
+        pool = pools.get(key)
+        if pool is None:
+            ids = np.frombuffer(snapshot.question_ids(language, level, topic), dtype=np.intc).astype(np.int64)
+            pool = pools[key] = (ids, np.searchsorted(all_ids, ids))
+        return pool
+
+    @staticmethod
+    def _seen_bitset(all_ids: np.ndarray, exclude_ids: Iterable[int]) -> Optional[SeenBitset]:
+        exclude = np.fromiter((int(qid) for qid in exclude_ids or () if qid), dtype=np.int64)
+        if not len(exclude) or not len(all_ids):
+            return None
+        positions = np.searchsorted(all_ids, exclude)
+        in_range = positions < len(all_ids)
+        positions, exclude = positions[in_range], exclude[in_range]
+        # Ids no longer in the catalog are simply ignored
+        positions = positions[all_ids[positions] == exclude]
+        return SeenBitset.from_positions(len(all_ids), positions)
+
+    def sample(self, count: int = 1, language: str = 'english', level: str = None, topic: str = None,
+               exclude_ids: Iterable[int] = None) -> List[int]:
+        """Draw up to `count` distinct question ids, preferring ids not in `exclude_ids`
+
+        Excluded ids are only returned when the filter has too few other
+        questions, so a user is never left without a question.
+        """
+        state = self._current()
+        ids, positions = self._pool(state, language, level, topic)
+        size = len(ids)
+        if size == 0 or count <= 0:
+            return []
+        count = min(count, size)
+
+        seen = self._seen_bitset(state[1], exclude_ids)
+        if seen is None:
+            return ids[self._rng.choice(size, size=count, replace=False)].tolist()
+
+        # Rejection sampling: over-draw a little and drop seen ids
+        draw = min(size, 2 * count + 8)
+        picks = self._rng.choice(size, size=draw, replace=False)
+        fresh = picks[~seen.contains(positions[picks])]
+        if len(fresh) >= count:
+            return ids[fresh[:count]].tolist()
+
+        # Heavily excluded pool: mask it once, then top up with seen ids if needed
+        unseen_mask = ~seen.contains(positions)
+        unseen = np.flatnonzero(unseen_mask)
+        if len(unseen) >= count:
+            return ids[self._rng.choice(unseen, size=count, replace=False)].tolist()
+        seen_idx = np.flatnonzero(~unseen_mask)
+        top_up = self._rng.choice(seen_idx, size=count - len(unseen), replace=False)
+        return ids[np.concatenate([self._rng.permutation(unseen), top_up])].tolist()
+
+
+class RecentQuestions:
+    """Per-user list of recently seen practice questions, kept in the session"""
+
+    @staticmethod
+    def _limit() -> int:
+        return int(current_app.config.get('RECENT_QUESTIONS_LIMIT', DEFAULT_RECENT_LIMIT))
+
+    @classmethod
+    def get(cls) -> List[int]:
+        if not has_request_context():
+            return []
+        return list(session.get(RECENT_QUESTIONS_KEY, []))
+
+    @classmethod
+    def add(cls, question_id: int) -> None:
+        if not has_request_context() or not question_id:
+            return
+        recent = [qid for qid in session.get(RECENT_QUESTIONS_KEY, []) if qid != question_id]
+        recent.append(question_id)
+        session[RECENT_QUESTIONS_KEY] = recent[-cls._limit():]
+
+
+question_sampler = QuestionSampler()
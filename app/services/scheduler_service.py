@@ -0,0 +1,179 @@
+"""
+Practice Scheduler Service for OPIc Practice Portal
+Picks the next practice question from incrementally maintained per-user
+topic coverage (user_topic_coverage) instead of a uniform random choice.
+
+CoverageService updates one coverage row per (user, topic, level) inside the
+response-insert transaction, so scheduling never has to scan `responses`.
+PracticeScheduler weights each topic by how overdue it is (spaced repetition)
+and how weak the user's rolling ai_score is, then draws an unseen question.
+"""
+import random
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Question, UserTopicCoverage, now_hanoi
+from app.services.catalog_service import question_catalog
+from app.services.sampling_service import question_sampler
+from app.services.topic_service import strip_topic_prefix
+
+# Days until a topic is due again, indexed by number of attempts so far
+REVIEW_INTERVALS_DAYS = [1, 2, 4, 7, 14, 30]
+UNSEEN_TOPIC_WEIGHT = 4.0      # Topics never practiced at this level
+NOT_DUE_MIN_WEIGHT = 0.2       # Floor for topics reviewed recently
+MAX_OVERDUE_FACTOR = 3.0
+SCORE_SMOOTHING = 0.3          # Weight of the newest ai_score in the rolling average
+
+
+def _elapsed_days(since: datetime) -> float:
+    """Days between `since` and now, tolerating naive datetimes read back from SQLite"""
+    now = now_hanoi()
+    if since.tzinfo is None:
+        now = now.replace(tzinfo=None)
+    return max((now - since).total_seconds() / 86400.0, 0.0)
+
+
+class CoverageService:
+    """Maintains user_topic_coverage rows on response insert and scoring"""
+
+    def _insert_row(self, user_id: int, topic_id: int, level: str) -> None:
+        """Insert an empty coverage row unless one exists; safe with concurrent first attempts"""
+        table = UserTopicCoverage.__table__
+        row = {'user_id': user_id, 'topic_id': topic_id, 'level': level,
+               'attempts': 0, 'scored_count': 0, 'seen_question_ids': []}
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            db.session.execute(dialect_insert(table).values(**row).on_conflict_do_nothing(
+                index_elements=[table.c.user_id, table.c.topic_id, table.c.level]
+            ))
+            return
+
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(table).values(**row))
+        except IntegrityError:
+            pass
+
+    def _get_row(self, user_id: int, topic_id: int, level: str) -> UserTopicCoverage:
+        """The coverage row, created if needed and locked until the caller's transaction ends"""
+        query = UserTopicCoverage.query.filter_by(user_id=user_id, topic_id=topic_id, level=level)
+        row = query.with_for_update().first()
+        if row is None:
+            self._insert_row(user_id, topic_id, level)
+            row = query.with_for_update().one()
+        return row
+
+    def record_attempt(self, user_id: int, question: Question) -> Optional[UserTopicCoverage]:
+        """Count a new response; call before the response transaction commits"""
+        if question is None or not question.topic_id or not question.difficulty_level:
+            return None
+
+        row = self._get_row(user_id, question.topic_id, question.difficulty_level)
+        row.attempts = (row.attempts or 0) + 1
+        row.last_attempt_at = now_hanoi()
+
+        # Track the current pass over the topic; start a new pass once every question was seen
+        seen = [qid for qid in (row.seen_question_ids or []) if qid != question.id]
+        seen.append(question.id)
+        snapshot = question_catalog.snapshot()
+        pool_size = len(snapshot.question_ids(question.language or 'english', question.difficulty_level,
+                                              strip_topic_prefix(question.topic)))
+        row.seen_question_ids = [question.id] if pool_size and len(seen) >= pool_size else seen
+        return row
+
+    def record_score(self, user_id: int, question: Question, score: int,
+                     previous: Optional[int] = None) -> Optional[UserTopicCoverage]:
+        """Fold an ai_score into the rolling average; call before committing the score
+
+        `previous` is the response's old score when it is re-scored: the
+        average then moves by the old->new difference instead of counting
+        the same answer again.
+        """
+        if score is None or question is None or not question.topic_id or not question.difficulty_level:
+            return None
+        if previous is not None and previous == score:
+            return None
+
+        row = self._get_row(user_id, question.topic_id, question.difficulty_level)
+        if not row.scored_count or row.score_avg is None or (previous is not None and row.scored_count == 1):
+            row.score_avg = float(score)
+        elif previous is not None:
+            row.score_avg = row.score_avg + SCORE_SMOOTHING * (float(score) - float(previous))
+        else:
+            row.score_avg = row.score_avg + SCORE_SMOOTHING * (float(score) - row.score_avg)
+        if previous is None or not row.scored_count:
+            row.scored_count = (row.scored_count or 0) + 1
+        return row
+
+    def get_user_coverage(self, user_id: int, level: str) -> Dict[int, UserTopicCoverage]:
+        """Coverage rows for one user and level, keyed by topic id (one indexed read)"""
+        rows = UserTopicCoverage.query.filter_by(user_id=user_id, level=level).all()
+        return {row.topic_id: row for row in rows}
+
+
+class PracticeScheduler:
+    """Chooses the next practice question using spaced repetition and weak-topic weighting"""
+
+    def __init__(self, coverage: CoverageService = None):
+        self.coverage = coverage or CoverageService()
+
+    def topic_weight(self, row: Optional[UserTopicCoverage]) -> float:
+        """Relative chance of scheduling a topic next"""
+        if row is None or not row.attempts:
+            return UNSEEN_TOPIC_WEIGHT
+
+        # Spaced repetition: a topic becomes due after an interval that grows with attempts
+        interval = REVIEW_INTERVALS_DAYS[min(row.attempts, len(REVIEW_INTERVALS_DAYS)) - 1]
+        elapsed = _elapsed_days(row.last_attempt_at) if row.last_attempt_at else interval
+        due = min(max(elapsed / interval, NOT_DUE_MIN_WEIGHT), MAX_OVERDUE_FACTOR)
+
+        # Weakest topics first: a score of 40 weighs twice as much as a score of 90
+        if row.score_avg is None:
+            weakness = 1.5
+        else:
+            weakness = 1.0 + max(0.0, 100.0 - row.score_avg) / 50.0
+        return due * weakness
+
+    def next_question_id(self, user_id: int, language: str = 'english', level: str = None,
+                         topic: str = None, exclude_ids: Iterable[int] = None) -> Optional[int]:
+        """Pick the next question for a user; `topic` pins the topic, otherwise one is scheduled"""
+        if not level:
+            ids = question_sampler.sample(1, language, exclude_ids=exclude_ids)
+            return ids[0] if ids else None
+
+        snapshot = question_catalog.snapshot()
+        coverage = self.coverage.get_user_coverage(user_id, level)
+
+        if topic:
+            topic_name = strip_topic_prefix(topic)
+        else:
+            topics = snapshot.topics(language, level)
+            if not topics:
+                return None
+            weights = [self.topic_weight(coverage.get(snapshot.topic_id(language, name))) for name in topics]
+            topic_name = random.choices(topics, weights=weights, k=1)[0]
+
+        # Prefer questions not seen in the current pass over this topic, nor recently
+        exclude = set(exclude_ids or ())
+        row = coverage.get(snapshot.topic_id(language, topic_name))
+        if row is not None:
+            exclude.update(row.seen_question_ids or ())
+
+        ids = question_sampler.sample(1, language, level, topic_name, exclude_ids=exclude)
+        if not ids:
+            current_app.logger.info(f"[Scheduler] No questions for {language}/{level}/{topic_name}")
+            return None
+        return ids[0]
+
+
+coverage_service = CoverageService()
+practice_scheduler = PracticeScheduler(coverage_service)
@@ -0,0 +1,45 @@
+"""
+Schema presence checks for OPIc Practice Portal
+Optional tables (search index, media jobs, media store) are created by
+scripts after the app may already be running. A table that exists is
+remembered for the life of the process; a missing one is looked up again
+after RECHECK_SECONDS, so running workers pick up a migration without a
+restart and without inspecting the schema on every flush.
+"""
+import time
+from typing import Dict, Set, Tuple
+
+from sqlalchemy import inspect
+
+RECHECK_SECONDS = 30.0
+
+
+class KnownTables:
+    """Cached `has_table` per database URL"""
+
+    def __init__(self, recheck_seconds: float = RECHECK_SECONDS):
+        self.recheck_seconds = recheck_seconds
+        self._found: Set[Tuple[str, str]] = set()
+        self._missing_since: Dict[Tuple[str, str], float] = {}
+
+    def exists(self, connection, table_name: str) -> bool:
+        key = (str(connection.engine.url), table_name)
+        if key in self._found:
+            return True
+        checked_at = self._missing_since.get(key)
+        if checked_at is not None and time.monotonic() - checked_at < self.recheck_seconds:
+            return False
+        if inspect(connection).has_table(table_name):
+            self._found.add(key)
+            self._missing_since.pop(key, None)
+            return True
+        self._missing_since[key] = time.monotonic()
+        return False
+
+    def forget(self) -> None:
+        """Drop all cached results (e.g. after creating or dropping tables)"""
+        self._found.clear()
+        self._missing_since.clear()
+
+
+known_tables = KnownTables()
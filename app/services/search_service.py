@@ -0,0 +1,294 @@
+"""
+Search Service for OPIc Practice Portal
+Full-text search over questions, sample answers and comments.
+
+Every searchable item is a document in one index: an FTS5 virtual table
+(`search_index`) on SQLite, or a `search_documents` table with a generated
+tsvector column and a GIN index on PostgreSQL. Documents are rewritten in
+the same transaction as the rows they mirror (flush listener); the
+scripts/rebuild_search_index.py script creates and backfills the index.
+
+Queries match every term as a prefix, are ranked (bm25 / ts_rank_cd, with
+titles weighted above bodies) and return highlighted snippets.
+"""
+import html
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect, select, text
+from sqlalchemy.orm import Session
+
+from app.models import Comment, Question
+from app.services.schema_cache import known_tables
+
+KINDS = {'question': 0, 'answer': 1, 'comment': 2}
+KIND_NAMES = {code: name for name, code in KINDS.items()}
+MAX_TERMS = 8
+MAX_RESULTS = 50
+INDEXED_ATTRIBUTES = {
+    Question: ('topic', 'text', 'sample_answer_text', 'language'),
+    Comment: ('content',),
+}
+
+# Highlight markers: control characters can't occur in escaped output, so they
+# survive html.escape() and are then turned into <mark> tags
+MARK_START, MARK_END = '\x02', '\x03'
+
+SQLITE_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "kind UNINDEXED, ref_id UNINDEXED, question_id UNINDEXED, language UNINDEXED, title, body, "
+    "tokenize = 'unicode61 remove_diacritics 2')",
+)
+POSTGRES_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS search_documents ("
+    "kind SMALLINT NOT NULL, ref_id INTEGER NOT NULL, question_id INTEGER NOT NULL, "
+    "language VARCHAR(20), title TEXT NOT NULL DEFAULT '', body TEXT NOT NULL DEFAULT '', "
+    "document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')) STORED, "
+    "PRIMARY KEY (kind, ref_id))",
+    "CREATE INDEX IF NOT EXISTS idx_search_documents_document ON search_documents USING GIN (document)",
+)
+
+
+def _clean(value: Optional[str]) -> str:
+    """Plain text for indexing (question texts are stored HTML-escaped)"""
+    return html.unescape(value or '').strip()
+
+
+def _terms(query: str) -> List[str]:
+    """Word terms of a user query; punctuation and operators are dropped"""
+    return re.findall(r'\w+', (query or '').lower())[:MAX_TERMS]
+
+
+def _highlight(value: Optional[str]) -> str:
+    """HTML-safe text with the matched terms wrapped in <mark>"""
+    escaped = html.escape(value or '')
+    return escaped.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def documents_for(obj, languages: Dict[int, str]) -> List[Tuple[str, int, dict]]:
+    """Index documents (kind, ref_id, fields) for a question or comment
+
+    Comments take the language of their question from `languages`
+    (question id -> language).
+    """
+    if isinstance(obj, Question):
+        fields = {'question_id': obj.id, 'language': obj.language, 'title': _clean(obj.topic)}
+        documents = [('question', obj.id, dict(fields, body=_clean(obj.text)))]
+        if obj.sample_answer_text:
+            documents.append(('answer', obj.id, dict(fields, body=_clean(obj.sample_answer_text))))
+        return documents
+    if isinstance(obj, Comment):
+        return [('comment', obj.id, {
+            'question_id': obj.question_id, 'language': languages.get(obj.question_id),
+            'title': '', 'body': _clean(obj.content)
+        })]
+    return []
+
+
+class SearchIndex:
+    """Dialect-specific full-text index over questions, sample answers and comments"""
+
+    # --- schema --------------------------------------------------------------
+
+    def _dialect(self, connection) -> str:
+        return connection.dialect.name
+
+    def table_name(self, connection) -> str:
+        return 'search_index' if self._dialect(connection) == 'sqlite' else 'search_documents'
+
+    def is_ready(self, connection) -> bool:
+        """Whether the index exists (see KnownTables for how the answer is cached)"""
+        return known_tables.exists(connection, self.table_name(connection))
+
+    def create_schema(self, connection) -> None:
+        dialect = self._dialect(connection)
+        if dialect not in ('sqlite', 'postgresql'):
+            raise RuntimeError(f'Full-text search is not supported on {dialect}')
+        for statement in SQLITE_SCHEMA if dialect == 'sqlite' else POSTGRES_SCHEMA:
+            connection.execute(text(statement))
+
+    # --- writes --------------------------------------------------------------
+
+    def remove(self, connection, keys: Iterable[Tuple[str, int]]) -> None:
+        """Delete documents by (kind, ref_id)"""
+        keys = list(keys)
+        if not keys:
+            return
+        if self._dialect(connection) == 'sqlite':
+            # rowid encodes the key, so deletes are rowid lookups
+            connection.execute(text("DELETE FROM search_index WHERE rowid = :rowid"),
+                               [{'rowid': ref_id * 4 + KINDS[kind]} for kind, ref_id in keys])
+        else:
+            connection.execute(text("DELETE FROM search_documents WHERE kind = :kind AND ref_id = :ref_id"),
+                               [{'kind': KINDS[kind], 'ref_id': ref_id} for kind, ref_id in keys])
+
+    def write(self, connection, documents: Iterable[Tuple[str, int, dict]]) -> None:
+        """Insert documents; callers remove the old versions first"""
+        rows = [dict(fields, kind=KINDS[kind], ref_id=ref_id, rowid=ref_id * 4 + KINDS[kind])
+                for kind, ref_id, fields in documents]
+        if not rows:
+            return
+        if self._dialect(connection) == 'sqlite':
+            connection.execute(text(
+                "INSERT INTO search_index (rowid, kind, ref_id, question_id, language, title, body) "
+                "VALUES (:rowid, :kind, :ref_id, :question_id, :language, :title, :body)"
+            ), rows)
+        else:
+            connection.execute(text(
+                "INSERT INTO search_documents (kind, ref_id, question_id, language, title, body) "
+                "VALUES (:kind, :ref_id, :question_id, :language, :title, :body)"
+            ), rows)
+
+    def _languages(self, connection, question_ids: Iterable[int]) -> Dict[int, str]:
+        question_ids = sorted(set(question_ids))
+        if not question_ids:
+            return {}
+        questions = Question.__table__
+        return dict(connection.execute(
+            select(questions.c.id, questions.c.language).where(questions.c.id.in_(question_ids))
+        ).all())
+
+    def reindex(self, connection, objects: Iterable) -> None:
+        """Replace the documents of questions and comments"""
+        objects = list(objects)
+        keys = []
+        for obj in objects:
+            if isinstance(obj, Question):
+                keys += [('question', obj.id), ('answer', obj.id)]
+            elif isinstance(obj, Comment):
+                keys.append(('comment', obj.id))
+        self.remove(connection, keys)
+
+        languages = self._languages(connection, [obj.question_id for obj in objects if isinstance(obj, Comment)])
+        self.write(connection, [document for obj in objects for document in documents_for(obj, languages)])
+
+        # Comments inherit their question's language
+        questions = [{'language': obj.language, 'question_id': obj.id, 'kind': KINDS['comment']}
+                     for obj in objects if isinstance(obj, Question)]
+        if questions:
+            connection.execute(text(
+                f"UPDATE {self.table_name(connection)} SET language = :language "
+                "WHERE question_id = :question_id AND kind = :kind"
+            ), questions)
+
+    def rebuild(self, connection, batch_size: int = 1000) -> int:
+        """Recreate every document from questions and comments; returns the document count"""
+        connection.execute(text(f"DELETE FROM {self.table_name(connection)}"))
+        languages = dict(connection.execute(select(Question.__table__.c.id, Question.__table__.c.language)).all())
+        session = Session(bind=connection)
+        total = 0
+        for model in (Question, Comment):
+            last_id = 0
+            while True:
+                rows = session.query(model).filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+                if not rows:
+                    break
+                documents = [document for obj in rows for document in documents_for(obj, languages)]
+                self.write(connection, documents)
+                total += len(documents)
+                last_id = rows[-1].id
+                session.expunge_all()
+        session.close()
+        return total
+
+    # --- reads ---------------------------------------------------------------
+
+    def search(self, connection, query: str, kinds: Optional[Iterable[str]] = None,
+               language: Optional[str] = None, limit: int = 20) -> List[dict]:
+        """Ranked matches for every term of `query` as a prefix
+
+        Each result has kind, ref_id, question_id, language, rank and
+        HTML-safe `title`/`snippet` with the matches in <mark>.
+        """
+        terms = _terms(query)
+        if not terms:
+            return []
+        limit = max(1, min(limit, MAX_RESULTS))
+        kind_codes = [KINDS[kind] for kind in (kinds or KINDS) if kind in KINDS]
+        if not kind_codes:
+            return []
+        params = {'limit': limit, 'language': language}
+        kind_params = {f'kind{index}': code for index, code in enumerate(kind_codes)}
+        params.update(kind_params)
+        kind_filter = ', '.join(f':{name}' for name in kind_params)
+
+        if self._dialect(connection) == 'sqlite':
+            params['match'] = ' '.join('"%s"*' % term for term in terms)
+            statement = text(
+                "SELECT kind, ref_id, question_id, language, bm25(search_index, 0, 0, 0, 0, 5.0, 1.0) AS rank, "
+                f"highlight(search_index, 4, '{MARK_START}', '{MARK_END}') AS title, "
+                f"snippet(search_index, 5, '{MARK_START}', '{MARK_END}', '…', 24) AS snippet "
+                "FROM search_index WHERE search_index MATCH :match "
+                f"AND kind IN ({kind_filter}) AND (:language IS NULL OR language = :language) "
+                "ORDER BY rank LIMIT :limit"
+            )
+        else:
+            params['match'] = ' & '.join(f'{term}:*' for term in terms)
+            headline = f'StartSel="{MARK_START}", StopSel="{MARK_END}", MaxWords=30, MinWords=12, MaxFragments=2'
+            statement = text(
+                "SELECT kind, ref_id, question_id, language, ts_rank_cd(document, query) AS rank, "
+                f"ts_headline('simple', title, query, '{headline}, HighlightAll=true') AS title, "
+                f"ts_headline('simple', body, query, '{headline}') AS snippet "
+                "FROM search_documents, to_tsquery('simple', :match) AS query "
+                f"WHERE document @@ query AND kind IN ({kind_filter}) "
+                "AND (CAST(:language AS VARCHAR) IS NULL OR language = :language) "
+                "ORDER BY rank DESC LIMIT :limit"
+            )
+
+        return [{
+            'kind': KIND_NAMES[row.kind],
+            'ref_id': row.ref_id,
+            'question_id': row.question_id,
+            'language': row.language,
+            'rank': float(row.rank),
+            'title': _highlight(row.title),
+            'snippet': _highlight(row.snippet)
+        } for row in connection.execute(statement, params)]
+
+    def matching_question_ids(self, connection, query: str) -> List[int]:
+        """IDs of questions whose topic, text or sample answer matches (for filtering listings)"""
+        terms = _terms(query)
+        if not terms:
+            return []
+        if self._dialect(connection) == 'sqlite':
+            statement = text("SELECT DISTINCT question_id FROM search_index "
+                             "WHERE search_index MATCH :match AND kind IN (0, 1)")
+            match = ' '.join('"%s"*' % term for term in terms)
+        else:
+            statement = text("SELECT DISTINCT question_id FROM search_documents "
+                             "WHERE document @@ to_tsquery('simple', :match) AND kind IN (0, 1)")
+            match = ' & '.join(f'{term}:*' for term in terms)
+        return [row[0] for row in connection.execute(statement, {'match': match})]
+
+
+search_index = SearchIndex()
+
+
+def _text_changed(obj) -> bool:
+    """Whether an indexed attribute of a persistent question or comment changed"""
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in INDEXED_ATTRIBUTES[type(obj)])
+
+
+@event.listens_for(Session, 'after_flush')
+def _sync_search_index(session, flush_context):
+    """Rewrite index documents for questions and comments written in this flush
+
+    Bulk statements and database-level cascades bypass this listener;
+    scripts/rebuild_search_index.py brings the index back in step.
+    """
+    changed = [obj for obj in session.new if isinstance(obj, (Question, Comment))]
+    changed += [obj for obj in session.dirty if isinstance(obj, (Question, Comment)) and _text_changed(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, (Question, Comment))]
+    if not changed and not deleted:
+        return
+
+    connection = session.connection()
+    if not search_index.is_ready(connection):
+        return
+    search_index.reindex(connection, changed)
+    keys = []
+    for obj in deleted:
+        keys += [('question', obj.id), ('answer', obj.id)] if isinstance(obj, Question) else [('comment', obj.id)]
+    search_index.remove(connection, keys)
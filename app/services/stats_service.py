@@ -0,0 +1,189 @@
+"""
+User Statistics Service for OPIc Practice Portal
+Keeps the user_stats table (per-user response counters) in step with the
+responses and surveys tables so dashboard statistics are one primary-key read.
+
+Counters are adjusted with relative UPDATEs in the same transaction as the
+response insert; deletes and score downgrades rebuild the affected users'
+rows from `responses`, which is also what the repair script does in bulk.
+"""
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import case, delete, event, func, insert, inspect, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Response, Survey, User, UserStats
+
+COUNTER_COLUMNS = ('total_responses', 'practice_responses', 'test_responses',
+                   'tests_completed', 'score_sum', 'scored_count')
+
+
+def _empty_row(user_id: int) -> dict:
+    row = {column: 0 for column in COUNTER_COLUMNS}
+    row.update(user_id=user_id, last_response_at=None, best_score=None)
+    return row
+
+
+class UserStatsService:
+    """Reads and maintains materialized user statistics"""
+
+    def get_stats(self, user_id: int) -> UserStats:
+        """Statistics for a user by primary key
+
+        Users without a row yet (created before the table existed) get an
+        unsaved row computed on the fly; run scripts/rebuild_user_stats.py
+        to materialize them.
+        """
+        stats = db.session.get(UserStats, user_id)
+        if stats is None:
+            rows = self._aggregate(db.session.connection(), [user_id])
+            stats = UserStats(**rows.get(user_id, _empty_row(user_id)))
+        return stats
+
+    def _aggregate(self, connection, user_ids: Optional[Iterable[int]] = None) -> Dict[int, dict]:
+        """Compute stats rows from responses and surveys with two grouped queries"""
+        responses = Response.__table__.c
+        query = select(
+            responses.user_id,
+            func.count(responses.id),
+            func.sum(case((responses.mode == 'practice', 1), else_=0)),
+            func.sum(case((responses.mode == 'test', 1), else_=0)),
+            func.max(responses.created_at),
+            func.max(responses.ai_score),
+            func.coalesce(func.sum(responses.ai_score), 0),
+            func.count(responses.ai_score),
+        ).group_by(responses.user_id)
+        surveys = select(Survey.user_id, func.count(Survey.id)).group_by(Survey.user_id)
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            query = query.where(responses.user_id.in_(user_ids))
+            surveys = surveys.where(Survey.user_id.in_(user_ids))
+
+        rows = {}
+        for user_id, total, practice, test, last_at, best, score_sum, scored in connection.execute(query):
+            row = rows[user_id] = _empty_row(user_id)
+            row.update(total_responses=total, practice_responses=practice or 0, test_responses=test or 0,
+                       last_response_at=last_at, best_score=best, score_sum=int(score_sum or 0),
+                       scored_count=scored)
+        for user_id, count in connection.execute(surveys):
+            rows.setdefault(user_id, _empty_row(user_id))['tests_completed'] = count
+        return rows
+
+    def rebuild(self, connection, user_ids: Optional[Iterable[int]] = None) -> int:
+        """Recompute user_stats rows from scratch; all users when `user_ids` is None"""
+        if user_ids is None:
+            user_ids = connection.execute(select(User.id)).scalars().all()
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return 0
+
+        rows = self._aggregate(connection, user_ids)
+        connection.execute(delete(UserStats.__table__).where(UserStats.user_id.in_(user_ids)))
+        connection.execute(insert(UserStats.__table__), [
+            rows.get(user_id, _empty_row(user_id)) for user_id in user_ids
+        ])
+        return len(user_ids)
+
+    def apply_deltas(self, connection, deltas: Dict[int, dict]) -> None:
+        """Apply counter increments with relative UPDATEs; missing rows are rebuilt"""
+        table = UserStats.__table__
+        missing = []
+        for user_id, delta in deltas.items():
+            values = {column: table.c[column] + delta[column] for column in COUNTER_COLUMNS if delta[column]}
+            best = delta['best_score']
+            if best is not None:
+                values['best_score'] = case(
+                    (or_(table.c.best_score.is_(None), table.c.best_score < best), best),
+                    else_=table.c.best_score
+                )
+            last_at = delta['last_response_at']
+            if last_at is not None:
+                values['last_response_at'] = case(
+                    (or_(table.c.last_response_at.is_(None), table.c.last_response_at < last_at), last_at),
+                    else_=table.c.last_response_at
+                )
+            if not values:
+                continue
+            result = connection.execute(update(table).where(table.c.user_id == user_id).values(**values))
+            if result.rowcount == 0:
+                missing.append(user_id)
+
+        # The flushed rows are already visible, so a rebuild includes this change
+        self.rebuild(connection, missing)
+
+
+user_stats_service = UserStatsService()
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_score_changes(session, flush_context, instances):
+    """Remember ai_score changes while the attribute history is still available"""
+    changes = session.info.setdefault('user_stats_score_changes', [])
+    for obj in session.dirty:
+        if not isinstance(obj, Response):
+            continue
+        history = inspect(obj).attrs.ai_score.history
+        if history.has_changes():
+            changes.append((obj.user_id, history.deleted[0] if history.deleted else None, obj.ai_score))
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_user_stats(session, flush_context):
+    """Adjust user_stats for responses and surveys written in this flush"""
+    deltas: Dict[int, dict] = {}
+    to_rebuild = set()
+
+    def delta_for(user_id):
+        return deltas.setdefault(user_id, _empty_row(user_id))
+
+    for obj in session.new:
+        if isinstance(obj, Response):
+            delta = delta_for(obj.user_id)
+            delta['total_responses'] += 1
+            if obj.mode == 'practice':
+                delta['practice_responses'] += 1
+            elif obj.mode == 'test':
+                delta['test_responses'] += 1
+            if obj.created_at is not None and (delta['last_response_at'] is None
+                                               or obj.created_at > delta['last_response_at']):
+                delta['last_response_at'] = obj.created_at
+            if obj.ai_score is not None:
+                delta['score_sum'] += obj.ai_score
+                delta['scored_count'] += 1
+                delta['best_score'] = max(delta['best_score'] or obj.ai_score, obj.ai_score)
+        elif isinstance(obj, Survey):
+            delta_for(obj.user_id)['tests_completed'] += 1
+
+    for user_id, old, new in session.info.pop('user_stats_score_changes', ()):
+        if old is not None and (new is None or new < old):
+            # A lowered score may invalidate best_score; recount this user
+            to_rebuild.add(user_id)
+            continue
+        delta = delta_for(user_id)
+        delta['score_sum'] += new - (old or 0)
+        delta['scored_count'] += 1 if old is None else 0
+        delta['best_score'] = max(delta['best_score'] or new, new)
+
+    for obj in session.deleted:
+        if isinstance(obj, Response):
+            to_rebuild.add(obj.user_id)
+        elif isinstance(obj, Survey):
+            delta_for(obj.user_id)['tests_completed'] -= 1
+
+    # Rows of deleted users go away with the user (cascade)
+    deleted_users = {obj.id for obj in session.deleted if isinstance(obj, User)}
+    to_rebuild -= deleted_users
+    deltas = {user_id: delta for user_id, delta in deltas.items()
+              if user_id not in deleted_users and user_id not in to_rebuild}
+    if not deltas and not to_rebuild:
+        return
+
+    connection = session.connection()
+    user_stats_service.apply_deltas(connection, deltas)
+    user_stats_service.rebuild(connection, to_rebuild)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_score_changes_after_rollback(session):
+    session.info.pop('user_stats_score_changes', None)
@@ -0,0 +1,131 @@
+"""
+Topic Service for OPIc Practice Portal
+Maintains the normalized topic dimension (topics / topic_levels) that replaces
+number-prefixed topic strings such as "01. Newspapers".
+
+Question.topic stays the source of truth that admins edit; a flush listener
+keeps Question.topic_id and the per-level question counts in sync. The
+question catalog (catalog_service) lists topics from topics / topic_levels in
+sort order.
+"""
+import re
+from itertools import chain
+from typing import Optional, Tuple
+
+from sqlalchemy import delete, event, func, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app.models import Question, Topic, TopicLevel
+
+TOPIC_PREFIX_PATTERN = re.compile(r'^\s*(\d+)\.\s+(.+?)\s*$')
+
+
+def parse_topic(topic: str) -> Tuple[Optional[int], Optional[str]]:
+    """Split a raw topic into (sort_order, display name), e.g. "01. Newspapers" -> (1, "Newspapers")"""
+    if not topic:
+        return None, None
+    match = TOPIC_PREFIX_PATTERN.match(topic)
+    if match:
+        return int(match.group(1)), match.group(2)
+    return None, topic.strip()
+
+
+def strip_topic_prefix(topic: str) -> str:
+    """Remove number prefix from a topic (e.g., "01. Newspapers" -> "Newspapers")"""
+    return parse_topic(topic)[1] if topic else topic
+
+
+class TopicService:
+    """Service for maintaining the topic dimension"""
+
+    def resolve(self, session, raw_topic: str, language: str, pending: dict = None) -> Optional[Topic]:
+        """Find or create the Topic for a raw topic string
+
+        `pending` caches topics created earlier in the same flush so bulk
+        imports don't create duplicates before they reach the database.
+        """
+        sort_order, name = parse_topic(raw_topic)
+        if not name:
+            return None
+        language = language or 'english'
+        key = (language, name)
+
+        if pending is not None and key in pending:
+            topic = pending[key]
+        else:
+            with session.no_autoflush:
+                topic = session.query(Topic).filter_by(language=language, name=name).first()
+            if topic is None:
+                topic = Topic(name=name, language=language, sort_order=sort_order or 0)
+                session.add(topic)
+            if pending is not None:
+                pending[key] = topic
+
+        if sort_order is not None and not topic.sort_order:
+            topic.sort_order = sort_order
+        return topic
+
+    def refresh_levels(self, connection, topic_ids) -> None:
+        """Recompute topic_levels rows for the given topics from the questions table"""
+        topic_ids = [topic_id for topic_id in set(topic_ids) if topic_id]
+        if not topic_ids:
+            return
+        connection.execute(delete(TopicLevel.__table__).where(TopicLevel.topic_id.in_(topic_ids)))
+        rows = connection.execute(
+            select(Question.topic_id, Question.difficulty_level, func.count(Question.id))
+            .where(Question.topic_id.in_(topic_ids), Question.difficulty_level.isnot(None))
+            .group_by(Question.topic_id, Question.difficulty_level)
+        ).all()
+        if rows:
+            connection.execute(insert(TopicLevel.__table__), [
+                {'topic_id': topic_id, 'level': level, 'question_count': count}
+                for topic_id, level, count in rows
+            ])
+
+
+topic_service = TopicService()
+
+
+@event.listens_for(Session, 'before_flush')
+def _sync_question_topics(session, flush_context, instances):
+    """Point new or re-topiced questions at their Topic row"""
+    affected = session.info.setdefault('topics_to_refresh', [])
+    pending = {}
+
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, Question):
+            continue
+
+        if obj in session.deleted:
+            affected.append(obj.topic_id)
+            continue
+
+        state = inspect(obj)
+        is_new = obj in session.new
+        if not is_new and not any(
+            state.attrs[attr].history.has_changes() for attr in ('topic', 'language', 'difficulty_level')
+        ):
+            continue
+
+        # Old topic loses a question (or a level) when the topic or level changes
+        affected.extend(value for value in state.attrs.topic_id.history.unchanged or () if value)
+        affected.extend(value for value in state.attrs.topic_id.history.deleted or () if value)
+
+        topic = topic_service.resolve(session, obj.topic, obj.language, pending)
+        obj.topic_ref = topic
+        if topic is not None:
+            affected.append(topic)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _refresh_topic_levels(session, flush_context):
+    affected = session.info.pop('topics_to_refresh', None)
+    if not affected:
+        return
+    topic_ids = [item.id if isinstance(item, Topic) else item for item in affected]
+    topic_service.refresh_levels(session.connection(), topic_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _reset_topic_refresh_after_rollback(session):
+    session.info.pop('topics_to_refresh', None)
@@ -0,0 +1,161 @@
+"""
+Transcode Service for OPIc Practice Portal
+Normalizes uploaded recordings (voice comments, practice and test responses)
+to mono Opus in WebM at AUDIO_OPUS_BITRATE with EBU R128 loudness
+normalization. A WAV comment shrinks by an order of magnitude, and every
+recording plays back at the same level.
+
+New recordings are queued as 'transcode' media jobs in the transaction that
+stores them; scripts/media_worker.py runs ffmpeg outside the request cycle,
+stores the result in the content-addressed media store, then swaps
+audio_url with a compare-and-set UPDATE (a row edited or deleted meanwhile
+keeps its file) and releases the original only after the commit.
+"""
+import os
+import shutil
+import subprocess
+from typing import Dict, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import Comment, MediaJob, Response
+from app.services.media_job_service import media_job_queue
+from app.services.media_storage_service import media_store, upload_path
+
+JOB_KIND = 'transcode'
+TRANSCODED_SUFFIX = '.opus.webm'
+TARGETS = {'comment': Comment, 'response': Response}
+DEFAULT_BITRATE = '32k'
+DEFAULT_LOUDNESS_TARGET = -16.0
+DEFAULT_TIMEOUT = 300
+
+
+def needs_transcode(audio_url: Optional[str]) -> bool:
+    return bool(audio_url) and not audio_url.endswith(TRANSCODED_SUFFIX)
+
+
+class AudioTranscoder:
+    """ffmpeg-based Opus transcoding of stored recordings"""
+
+    def ffmpeg(self) -> str:
+        binary = current_app.config.get('FFMPEG_BINARY') or shutil.which('ffmpeg')
+        if not binary:
+            raise RuntimeError('ffmpeg is not installed')
+        return binary
+
+    def command(self, source: str, destination: str) -> list:
+        bitrate = current_app.config.get('AUDIO_OPUS_BITRATE', DEFAULT_BITRATE)
+        loudness = float(current_app.config.get('AUDIO_LOUDNESS_TARGET', DEFAULT_LOUDNESS_TARGET))
+        return [
+            self.ffmpeg(), '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+            '-i', source, '-vn', '-map_metadata', '-1',
+            '-af', f'loudnorm=I={loudness}:TP=-1.5:LRA=11', '-ac', '1', '-ar', '48000',
+            '-c:a', 'libopus', '-b:a', bitrate, '-application', 'voip',
+            '-f', 'webm', destination
+        ]
+
+    def transcode_file(self, source: str) -> str:
+        """Write `<name>.opus.webm` next to `source` atomically; returns its path"""
+        destination = os.path.splitext(source)[0] + TRANSCODED_SUFFIX
+        partial = destination + '.part'
+        timeout = int(current_app.config.get('AUDIO_TRANSCODE_TIMEOUT', DEFAULT_TIMEOUT))
+        try:
+            completed = subprocess.run(self.command(source, partial), capture_output=True, timeout=timeout)
+            if completed.returncode != 0 or not os.path.exists(partial) or not os.path.getsize(partial):
+                raise RuntimeError(f"ffmpeg failed: {completed.stderr.decode(errors='replace').strip()[-500:]}")
+            os.replace(partial, destination)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return destination
+
+    def handle(self, job: MediaJob) -> dict:
+        """Transcode one comment or response recording and swap its audio_url"""
+        table = TARGETS[job.target].__table__
+        audio_url = db.session.execute(select(table.c.audio_url).where(table.c.id == job.target_id)).scalar()
+        if not needs_transcode(audio_url):
+            return {'skipped': 'missing' if not audio_url else 'already transcoded'}
+
+        source = upload_path(audio_url)
+        if not os.path.exists(source):
+            return {'skipped': 'file not found'}
+        bytes_before = os.path.getsize(source)
+        destination = self.transcode_file(source)
+        bytes_after = os.path.getsize(destination)
+        new_url = media_store.store(destination, TRANSCODED_SUFFIX)
+
+        swapped = db.session.execute(
+            update(table).where(table.c.id == job.target_id, table.c.audio_url == audio_url)
+            .values(audio_url=new_url)
+        ).rowcount == 1
+        if swapped:
+            media_store.retarget(audio_url, new_url)
+        db.session.commit()
+        if not swapped:
+            # Deleted or re-uploaded meanwhile: keep whatever the row points to now
+            media_store.release(new_url)
+            return {'skipped': 'changed'}
+
+        media_store.release(audio_url)
+        return {'bytes_before': bytes_before, 'bytes_after': bytes_after, 'audio_url': new_url}
+
+    def enqueue_existing(self, batch_size: int = 1000) -> int:
+        """Queue every stored recording not yet transcoded or waiting in the queue; returns jobs added"""
+        queued = 0
+        connection = db.session.connection()
+        for target, model in TARGETS.items():
+            queued_ids = select(MediaJob.target_id).where(MediaJob.kind == JOB_KIND, MediaJob.target == target,
+                                                          MediaJob.status.in_(('pending', 'running')))
+            last_id = 0
+            while True:
+                ids = db.session.execute(
+                    select(model.id).where(
+                        model.id > last_id, model.audio_url.isnot(None), model.audio_url != '',
+                        ~model.audio_url.like(f'%{TRANSCODED_SUFFIX}'), model.id.not_in(queued_ids)
+                    ).order_by(model.id).limit(batch_size)
+                ).scalars().all()
+                if not ids:
+                    break
+                queued += media_job_queue.enqueue(connection, JOB_KIND, target, ids)
+                last_id = ids[-1]
+        db.session.commit()
+        return queued
+
+    def savings(self) -> Dict[str, int]:
+        """Files transcoded and bytes before/after, from completed jobs"""
+        totals = {'files': 0, 'bytes_before': 0, 'bytes_after': 0}
+        results = db.session.execute(
+            select(MediaJob.result).where(MediaJob.kind == JOB_KIND, MediaJob.status == 'done')
+            .execution_options(yield_per=1000)
+        ).scalars()
+        for result in results:
+            if result and 'bytes_before' in result:
+                totals['files'] += 1
+                totals['bytes_before'] += result['bytes_before']
+                totals['bytes_after'] += result['bytes_after']
+        totals['bytes_saved'] = totals['bytes_before'] - totals['bytes_after']
+        return totals
+
+
+audio_transcoder = AudioTranscoder()
+media_job_queue.register(JOB_KIND, audio_transcoder.handle)
+
+
+@event.listens_for(Session, 'after_flush')
+def _enqueue_transcodes(session, flush_context):
+    """Queue new comment and response recordings for transcoding"""
+    if not has_app_context() or not current_app.config.get('AUDIO_TRANSCODE_ENABLED', True):
+        return
+    targets = {}
+    for obj in session.new:
+        for target, model in TARGETS.items():
+            if isinstance(obj, model) and needs_transcode(obj.audio_url):
+                targets.setdefault(target, []).append(obj.id)
+    if not targets:
+        return
+    connection = session.connection()
+    for target, ids in targets.items():
+        media_job_queue.enqueue(connection, JOB_KIND, target, ids)
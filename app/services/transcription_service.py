@@ -0,0 +1,246 @@
+"""
+Transcription Service for OPIc Practice Portal
+Fills Response.transcript on the server, so scoring no longer depends on
+the browser's speech recognition or an external API.
+
+New responses are queued as 'transcribe' media jobs; scripts/media_worker.py
+claims them in batches and hands each batch to the configured engine:
+
+- 'faster-whisper' (default): Whisper on the CPU via CTranslate2
+  (`pip install faster-whisper` on the worker host). TRANSCRIPTION_CONCURRENCY
+  files are decoded in parallel, each with TRANSCRIPTION_CPU_THREADS threads.
+- 'fake': returns a fixed text without reading audio, for tests and
+  development machines.
+
+Engines implement TranscriptionEngine.transcribe(); register more in ENGINES.
+Each job result records per-file timing (processing seconds, audio
+seconds, real-time factor). A transcript typed or recognized in the browser
+is never overwritten.
+"""
+import os
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models import MediaJob, Question, Response
+from app.services.media_job_service import media_job_queue
+from app.services.media_storage_service import upload_path
+
+JOB_KIND = 'transcribe'
+DEFAULT_ENGINE = 'faster-whisper'
+DEFAULT_MODEL = 'base'
+DEFAULT_COMPUTE_TYPE = 'int8'
+DEFAULT_CONCURRENCY = 2
+DEFAULT_CPU_THREADS = 2
+LANGUAGE_CODES = {'english': 'en', 'korean': 'ko'}
+
+
+class TranscriptionEngine(ABC):
+    """Speech-to-text backend"""
+
+    name = ''
+
+    @abstractmethod
+    def transcribe(self, path: str, language: Optional[str] = None) -> Dict[str, Any]:
+        """Transcribe one file; returns {'text': str, 'audio_seconds': float}"""
+
+    def transcribe_batch(self, items: List[Tuple[str, Optional[str]]], concurrency: int = 1) -> List[Any]:
+        """Transcribe (path, language) pairs with `concurrency` files in flight
+
+        Returns one entry per item, in order: the transcribe() result plus
+        its processing 'seconds', or the exception it raised.
+        """
+        def timed(item):
+            started = time.perf_counter()
+            try:
+                result = self.transcribe(*item)
+            except Exception as e:
+                return e
+            return dict(result, seconds=round(time.perf_counter() - started, 3))
+
+        if concurrency <= 1 or len(items) <= 1:
+            return [timed(item) for item in items]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return list(pool.map(timed, items))
+
+
+class FasterWhisperEngine(TranscriptionEngine):
+    """Whisper on the CPU with faster-whisper (CTranslate2, int8 by default)"""
+
+    name = 'faster-whisper'
+
+    def __init__(self, model: str = DEFAULT_MODEL, compute_type: str = DEFAULT_COMPUTE_TYPE,
+                 concurrency: int = DEFAULT_CONCURRENCY, cpu_threads: int = DEFAULT_CPU_THREADS):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise RuntimeError('faster-whisper is not installed. Install with: pip install faster-whisper')
+        self.model = WhisperModel(model, device='cpu', compute_type=compute_type,
+                                  cpu_threads=cpu_threads, num_workers=max(concurrency, 1))
+
+    def transcribe(self, path: str, language: Optional[str] = None) -> Dict[str, Any]:
+        segments, info = self.model.transcribe(path, language=language, beam_size=1, vad_filter=True)
+        text = ' '.join(segment.text.strip() for segment in segments).strip()
+        return {'text': text, 'audio_seconds': round(float(info.duration), 2)}
+
+
+class FakeTranscriptionEngine(TranscriptionEngine):
+    """Deterministic transcripts without audio decoding (tests, development)"""
+
+    name = 'fake'
+
+    def __init__(self, text: str = 'This is a fake transcript.', **_settings):
+        self.text = text
+
+    def transcribe(self, path: str, language: Optional[str] = None) -> Dict[str, Any]:
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        return {'text': self.text, 'audio_seconds': 0.0}
+
+
+ENGINES = {
+    FasterWhisperEngine.name: FasterWhisperEngine,
+    FakeTranscriptionEngine.name: FakeTranscriptionEngine,
+}
+
+
+class TranscriptionService:
+    """Run queued transcription jobs through the configured engine"""
+
+    def __init__(self):
+        self._engine: Optional[TranscriptionEngine] = None
+        self._engine_key = None
+
+    def enabled(self) -> bool:
+        return bool(current_app.config.get('TRANSCRIPTION_ENABLED', False))
+
+    def settings(self) -> Dict[str, Any]:
+        config = current_app.config
+        return {
+            'engine': config.get('TRANSCRIPTION_ENGINE', DEFAULT_ENGINE),
+            'model': config.get('TRANSCRIPTION_MODEL', DEFAULT_MODEL),
+            'compute_type': config.get('TRANSCRIPTION_COMPUTE_TYPE', DEFAULT_COMPUTE_TYPE),
+            'concurrency': int(config.get('TRANSCRIPTION_CONCURRENCY', DEFAULT_CONCURRENCY)),
+            'cpu_threads': int(config.get('TRANSCRIPTION_CPU_THREADS', DEFAULT_CPU_THREADS)),
+        }
+
+    def engine(self) -> TranscriptionEngine:
+        """The configured engine, loaded once per worker process"""
+        settings = self.settings()
+        key = tuple(sorted(settings.items()))
+        if self._engine is None or self._engine_key != key:
+            engine_class = ENGINES.get(settings['engine'])
+            if engine_class is None:
+                raise RuntimeError(f"Unknown TRANSCRIPTION_ENGINE '{settings['engine']}' "
+                                   f"(available: {', '.join(sorted(ENGINES))})")
+            options = {k: v for k, v in settings.items() if k != 'engine'}
+            self._engine, self._engine_key = engine_class(**options), key
+        return self._engine
+
+    def handle_batch(self, jobs: List[MediaJob]) -> Dict[int, Any]:
+        """Media jobs: transcribe a batch of responses and store transcripts left empty"""
+        table = Response.__table__
+        rows = {
+            row.id: row for row in db.session.execute(
+                select(table.c.id, table.c.audio_url, table.c.transcript, Question.language)
+                .join(Question, Question.id == table.c.question_id)
+                .where(table.c.id.in_([job.target_id for job in jobs]))
+            )
+        }
+
+        results: Dict[int, Any] = {}
+        pending = []
+        for job in jobs:
+            row = rows.get(job.target_id)
+            if row is None or not row.audio_url:
+                results[job.id] = {'skipped': 'missing'}
+            elif row.transcript:
+                results[job.id] = {'skipped': 'has transcript'}
+            elif not os.path.exists(upload_path(row.audio_url)):
+                results[job.id] = {'skipped': 'file not found'}
+            else:
+                pending.append((job, upload_path(row.audio_url), LANGUAGE_CODES.get(row.language)))
+        if not pending:
+            return results
+
+        engine = self.engine()
+        outputs = engine.transcribe_batch([(path, language) for _, path, language in pending],
+                                          self.settings()['concurrency'])
+        for (job, _, _), output in zip(pending, outputs):
+            if isinstance(output, Exception):
+                results[job.id] = output
+                continue
+            text = output.pop('text')
+            written = bool(text) and db.session.execute(
+                update(table).where(table.c.id == job.target_id,
+                                    or_(table.c.transcript.is_(None), table.c.transcript == ''))
+                .values(transcript=text)
+            ).rowcount == 1
+            audio_seconds = output.get('audio_seconds') or 0
+            results[job.id] = dict(
+                output, engine=engine.name, chars=len(text), written=written,
+                realtime_factor=round(output['seconds'] / audio_seconds, 3) if audio_seconds else None
+            )
+        db.session.commit()
+        return results
+
+    def enqueue_existing(self, batch_size: int = 1000) -> int:
+        """Queue responses without a transcript; returns jobs added (none while disabled)"""
+        if not self.enabled():
+            return 0
+        queued_ids = select(MediaJob.target_id).where(MediaJob.kind == JOB_KIND, MediaJob.target == 'response',
+                                                      MediaJob.status.in_(('pending', 'running')))
+        connection = db.session.connection()
+        queued = last_id = 0
+        while True:
+            ids = db.session.execute(
+                select(Response.id).where(
+                    Response.id > last_id, or_(Response.transcript.is_(None), Response.transcript == ''),
+                    Response.audio_url.isnot(None), Response.id.not_in(queued_ids)
+                ).order_by(Response.id).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            queued += media_job_queue.enqueue(connection, JOB_KIND, 'response', ids)
+            last_id = ids[-1]
+        db.session.commit()
+        return queued
+
+    def metrics(self) -> Dict[str, Any]:
+        """Files transcribed, audio and processing time, from completed jobs"""
+        totals = {'files': 0, 'audio_seconds': 0.0, 'seconds': 0.0}
+        per_file = []
+        results = db.session.execute(
+            select(MediaJob.result).where(MediaJob.kind == JOB_KIND, MediaJob.status == 'done')
+            .execution_options(yield_per=1000)
+        ).scalars()
+        for result in results:
+            if result and 'seconds' in result:
+                totals['files'] += 1
+                totals['audio_seconds'] += result.get('audio_seconds') or 0
+                totals['seconds'] += result['seconds']
+                per_file.append(result['seconds'])
+        per_file.sort()
+        totals['p95_seconds'] = per_file[int(0.95 * (len(per_file) - 1))] if per_file else 0.0
+        totals['realtime_factor'] = (totals['seconds'] / totals['audio_seconds']) if totals['audio_seconds'] else None
+        return totals
+
+
+transcriber = TranscriptionService()
+media_job_queue.register_batch(JOB_KIND, transcriber.handle_batch)
+
+
+@event.listens_for(Session, 'after_flush')
+def _enqueue_transcription(session, flush_context):
+    """Queue new responses for transcription"""
+    if not has_app_context() or not transcriber.enabled():
+        return
+    ids = [obj.id for obj in session.new if isinstance(obj, Response) and obj.audio_url]
+    if ids:
+        media_job_queue.enqueue(session.connection(), JOB_KIND, 'response', ids)
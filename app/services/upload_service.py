@@ -0,0 +1,179 @@
+"""
+Upload Service for OPIc Practice Portal
+Resumable, chunked uploads for response recordings.
+
+A client opens an upload with the total size, then sends chunks with their
+byte offset; each chunk is streamed straight to `UPLOAD_FOLDER/incoming/`,
+so a worker never holds a recording in memory and a dropped connection
+costs one chunk, not the whole answer. The server's offset is the source of
+truth: a chunk at the wrong offset is refused with the current offset, and
+the client resumes from there. Finalizing checks the size and SHA-256; the
+response endpoints store the data from there and discard the upload only
+once the response is saved, so a failed save can be retried.
+
+State lives next to the data (`<id>.json` + `<id>.part`), so any worker
+process can serve any chunk.
+"""
+import hashlib
+import json
+import os
+import re
+import secrets
+import time
+from typing import Optional
+
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:  # Windows development servers
+    fcntl = None
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+STALE_AFTER_SECONDS = 24 * 3600
+COPY_BUFFER_SIZE = 64 * 1024
+UPLOAD_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{20,64}$')
+
+
+class UploadError(ValueError):
+    """Invalid upload request; `status` is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploadService:
+    """Filesystem-backed resumable uploads"""
+
+    def _directory(self) -> str:
+        directory = os.path.join(current_app.config['UPLOAD_FOLDER'], 'incoming')
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _paths(self, upload_id: str):
+        if not UPLOAD_ID_PATTERN.match(upload_id or ''):
+            raise UploadError('Unknown upload', 404)
+        base = os.path.join(self._directory(), upload_id)
+        return base + '.json', base + '.part'
+
+    def _load(self, upload_id: str, user_id: int):
+        meta_path, data_path = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadError('Unknown upload', 404)
+        if meta['user_id'] != user_id:
+            raise UploadError('Unknown upload', 404)
+        return meta, meta_path, data_path
+
+    def chunk_size(self) -> int:
+        return int(current_app.config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+
+    def create(self, user_id: int, size: int) -> dict:
+        """Open an upload of `size` bytes; returns its id and the chunk size to use"""
+        max_size = int(current_app.config.get('MAX_RECORDING_SIZE', DEFAULT_MAX_UPLOAD_SIZE))
+        if isinstance(size, bool) or not isinstance(size, int) or size <= 0:
+            raise UploadError('size must be a positive integer')
+        if size > max_size:
+            raise UploadError(f'Recording is too large (max {max_size // (1024 * 1024)} MB)', 413)
+
+        self.purge_stale()
+        upload_id = secrets.token_urlsafe(24)
+        meta_path, data_path = self._paths(upload_id)
+        open(data_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump({'user_id': user_id, 'size': size, 'created_at': time.time()}, f)
+        return {'upload_id': upload_id, 'offset': 0, 'size': size, 'chunk_size': self.chunk_size()}
+
+    def status(self, upload_id: str, user_id: int) -> dict:
+        """Bytes received so far, to resume after a reload or a failed chunk"""
+        meta, _, data_path = self._load(upload_id, user_id)
+        return {'upload_id': upload_id, 'offset': os.path.getsize(data_path), 'size': meta['size']}
+
+    def append(self, upload_id: str, user_id: int, offset: int, stream, length: Optional[int]) -> int:
+        """Write one chunk at `offset`, streaming from `stream`; returns the new offset
+
+        Raises UploadError(409) carrying the current offset when `offset`
+        does not match what has been received (e.g. a retried chunk that did
+        arrive), so the client can continue from the right place.
+        """
+        meta, _, data_path = self._load(upload_id, user_id)
+        try:
+            f = open(data_path, 'r+b')
+        except FileNotFoundError:
+            raise UploadError('Unknown upload', 404)
+        with f:
+            # One writer at a time: a retried chunk racing the original waits, then sees the new offset
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            current = f.seek(0, os.SEEK_END)
+            if offset != current:
+                raise UploadError('Offset mismatch', 409, offset=current)
+            if not length or length > self.chunk_size() or current + length > meta['size']:
+                raise UploadError('Invalid chunk length')
+
+            written = 0
+            while written < length:
+                block = stream.read(min(COPY_BUFFER_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+            if written != length:
+                # Connection dropped mid-chunk: drop the partial chunk so the client can resend it
+                f.truncate(current)
+                raise UploadError('Incomplete chunk', 400, offset=current)
+        return current + written
+
+    def finalize(self, upload_id: str, user_id: int, sha256: Optional[str]) -> str:
+        """Verify size and checksum; returns the path of the complete data
+
+        The upload stays in place (finalizing again is harmless) until
+        discard() is called after its response has been saved.
+        """
+        meta, _, data_path = self._load(upload_id, user_id)
+        size = os.path.getsize(data_path)
+        if size != meta['size']:
+            raise UploadError('Upload is incomplete', 409, offset=size)
+
+        digest = hashlib.sha256()
+        with open(data_path, 'rb') as f:
+            for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+                digest.update(block)
+        if not sha256 or digest.hexdigest() != sha256.lower():
+            raise UploadError('Checksum mismatch', 422)
+        return data_path
+
+    def discard(self, upload_id: str, user_id: int) -> None:
+        """Delete a finished upload once its data has been stored and saved"""
+        try:
+            _, meta_path, data_path = self._load(upload_id, user_id)
+        except UploadError:
+            return
+        for path in (meta_path, data_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def purge_stale(self, max_age: int = STALE_AFTER_SECONDS) -> int:
+        """Delete abandoned uploads older than `max_age` seconds"""
+        directory = self._directory()
+        cutoff = time.time() - max_age
+        removed = 0
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+
+chunked_uploads = ChunkedUploadService()
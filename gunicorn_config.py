@@ -10,8 +10,10 @@ bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
 backlog = 2048
 
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1  # Recommended formula
-worker_class = 'sync'  # Use 'gevent' or 'eventlet' for async if needed
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))  # Recommended formula
+os.environ['WEB_CONCURRENCY'] = str(workers)  # Lets the app see it runs in several processes (cache backend)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')  # 'gthread' or 'gevent' for notification push (SSE)
+threads = int(os.getenv('GUNICORN_THREADS', '1'))  # Threads per worker with 'gthread'
 worker_connections = 1000
 max_requests = 1000  # Restart workers after this many requests (prevents memory leaks)
 max_requests_jitter = 50
@@ -0,0 +1,47 @@
+"""
+Migration script to add responses.audio_features
+Prosody features used by AI scoring are now computed on the server and
+stored with each response. Safe to run repeatedly. Afterwards queue the
+existing recordings with:
+
+    python scripts/media_worker.py --enqueue-existing --once
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+
+
+def add_audio_features_column():
+    """Add the responses.audio_features JSON column"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            response_columns = [col['name'] for col in inspector.get_columns('responses')]
+            if 'audio_features' not in response_columns:
+                db.session.execute(text("ALTER TABLE responses ADD COLUMN audio_features JSON"))
+                db.session.commit()
+                print("  [OK] Added responses.audio_features column")
+            else:
+                print("  [OK] responses.audio_features already exists")
+
+            print("\n✓ Audio features migration completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error adding audio features column: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if add_audio_features_column() else 1)
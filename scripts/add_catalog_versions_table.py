@@ -0,0 +1,43 @@
+"""
+Migration script to add the catalog_versions table
+The question catalog uses this table to notice question bank changes made by
+other workers (admin CRUD, imports) and rebuild its in-memory index.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import CatalogVersion
+from app.services.catalog_service import QUESTION_CATALOG
+
+
+def add_catalog_versions_table():
+    """Create the catalog_versions table and seed the question catalog counter"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            CatalogVersion.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ catalog_versions table ready")
+
+            if not db.session.get(CatalogVersion, QUESTION_CATALOG):
+                db.session.add(CatalogVersion(name=QUESTION_CATALOG, version=1))
+                db.session.commit()
+                print(f"✓ Seeded '{QUESTION_CATALOG}' catalog version")
+            else:
+                print(f"✓ '{QUESTION_CATALOG}' catalog version already exists")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error adding catalog_versions table: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if add_catalog_versions_table() else 1)
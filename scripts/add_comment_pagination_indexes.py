@@ -0,0 +1,62 @@
+"""
+Migration script for keyset-paginated comments
+Adds questions.comments_count (top-level comments per question) and backfills
+it, normalizes NULL is_pinned/likes_count values so they sort like the model
+defaults, and creates one composite index per comment sort order plus the
+reply lookup index. Safe to run repeatedly.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+from app.models import Comment
+from app.services.comment_service import comment_thread_loader
+
+
+def add_comment_pagination_indexes():
+    """Add comments_count, backfill it and create the comment sort indexes"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            question_columns = [col['name'] for col in inspector.get_columns('questions')]
+            if 'comments_count' not in question_columns:
+                db.session.execute(text(
+                    "ALTER TABLE questions ADD COLUMN comments_count INTEGER NOT NULL DEFAULT 0"
+                ))
+                print("  [OK] Added questions.comments_count column")
+
+            db.session.execute(text("UPDATE comments SET is_pinned = FALSE WHERE is_pinned IS NULL"))
+            db.session.execute(text("UPDATE comments SET likes_count = 0 WHERE likes_count IS NULL"))
+
+            count = comment_thread_loader.recount(db.session.connection())
+            print(f"  [OK] Recounted comments for {count} questions")
+
+            comment_indexes = [index['name'] for index in inspector.get_indexes('comments')]
+            for index in Comment.__table__.indexes:
+                if index.name not in comment_indexes:
+                    index.create(bind=db.session.connection())
+                    print(f"  [OK] Created {index.name} index")
+                else:
+                    print(f"  {index.name} index already exists")
+
+            db.session.commit()
+            print("\n✓ Comment pagination migration completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error migrating comments: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if add_comment_pagination_indexes() else 1)
@@ -0,0 +1,37 @@
+"""
+Migration script to add the media_jobs table
+Background work on uploaded recordings (Opus transcoding) is queued in
+media_jobs and processed by scripts/media_worker.py. Safe to run repeatedly.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import MediaJob
+
+
+def add_media_jobs_table():
+    """Create the media_jobs table and its status index"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            MediaJob.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ media_jobs table ready")
+
+            print("\n✓ Media jobs migration completed successfully!")
+            print("  Run 'python scripts/media_worker.py --enqueue-existing --once' to transcode existing recordings.")
+            return True
+
+        except Exception as e:
+            print(f"✗ Error adding media_jobs table: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if add_media_jobs_table() else 1)
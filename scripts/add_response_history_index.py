@@ -0,0 +1,44 @@
+"""
+Migration script to add the responses history index
+The activity history pages through a user's responses by (created_at, id);
+this composite index turns each page into a short index range scan.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+
+
+def add_response_history_index():
+    """Create idx_responses_user_created if it does not exist"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            response_indexes = [index['name'] for index in inspector.get_indexes('responses')]
+            if 'idx_responses_user_created' not in response_indexes:
+                db.session.execute(text(
+                    "CREATE INDEX idx_responses_user_created ON responses (user_id, created_at, id)"
+                ))
+                db.session.commit()
+                print("✓ Created idx_responses_user_created index")
+            else:
+                print("✓ idx_responses_user_created index already exists")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error adding responses history index: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if add_response_history_index() else 1)
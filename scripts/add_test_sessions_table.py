@@ -0,0 +1,132 @@
+"""
+Migration script to add test sessions
+Creates the test_sessions table and responses.test_session_id, then backfills
+sessions for existing test responses with the old history heuristic: test
+responses less than 2 hours apart belong to one session, linked to the user's
+survey from the same day. Safe to run repeatedly - only unlinked responses
+are grouped.
+"""
+import sys
+import os
+from datetime import timedelta
+from itertools import groupby
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, select, text, update, bindparam
+
+from app import create_app, db
+from app.models import Response, Survey, TestSession
+
+SESSION_GAP = timedelta(hours=2)
+
+
+def _split_sessions(rows):
+    """Split one user's (id, created_at) rows, oldest first, on gaps of 2 hours or more"""
+    session = []
+    for row in rows:
+        if session and row.created_at - session[-1].created_at >= SESSION_GAP:
+            yield session
+            session = []
+        session.append(row)
+    if session:
+        yield session
+
+
+def _match_survey(surveys, started_at):
+    """Latest same-day survey taken before the session started, else the latest one that day"""
+    same_day = [survey for survey in surveys if survey.created_at.date() == started_at.date()]
+    before = [survey for survey in same_day if survey.created_at <= started_at]
+    candidates = before or same_day
+    return max(candidates, key=lambda survey: survey.created_at) if candidates else None
+
+
+def add_test_sessions_table():
+    """Create test_sessions and group existing test responses into sessions"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            TestSession.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ test_sessions table ready")
+
+            inspector = inspect(db.engine)
+            response_columns = [col['name'] for col in inspector.get_columns('responses')]
+            if 'test_session_id' not in response_columns:
+                db.session.execute(text(
+                    "ALTER TABLE responses ADD COLUMN test_session_id INTEGER REFERENCES test_sessions(id)"
+                ))
+                print("  [OK] Added responses.test_session_id column")
+
+            response_indexes = [index['name'] for index in inspector.get_indexes('responses')]
+            if 'ix_responses_test_session_id' not in response_indexes:
+                db.session.execute(text(
+                    "CREATE INDEX ix_responses_test_session_id ON responses (test_session_id)"
+                ))
+                print("  [OK] Created ix_responses_test_session_id index")
+            db.session.commit()
+
+            # Surveys not yet linked to a session, per user (there is one per test taken)
+            linked = select(TestSession.survey_id).where(TestSession.survey_id.isnot(None))
+            surveys_by_user = {}
+            for survey in db.session.execute(
+                select(Survey.id, Survey.user_id, Survey.created_at).where(Survey.id.notin_(linked))
+            ):
+                surveys_by_user.setdefault(survey.user_id, []).append(survey)
+
+            rows = db.session.execute(
+                select(Response.id, Response.user_id, Response.created_at)
+                .where(Response.mode == 'test', Response.test_session_id.is_(None),
+                       Response.created_at.isnot(None))
+                .order_by(Response.user_id, Response.created_at, Response.id)
+            ).all()
+
+            session_count = 0
+            for user_id, user_rows in groupby(rows, key=lambda row: row.user_id):
+                surveys = surveys_by_user.get(user_id, [])
+                assignments = []
+                for session_rows in _split_sessions(user_rows):
+                    started_at = session_rows[0].created_at
+                    survey = _match_survey(surveys, started_at)
+                    if survey is not None:
+                        surveys.remove(survey)
+                    test_session = TestSession(
+                        user_id=user_id,
+                        survey_id=survey.id if survey else None,
+                        response_count=len(session_rows),
+                        started_at=started_at,
+                        finished_at=session_rows[-1].created_at
+                    )
+                    db.session.add(test_session)
+                    assignments.append((test_session, session_rows))
+                db.session.flush()
+
+                db.session.execute(
+                    update(Response.__table__)
+                    .where(Response.__table__.c.id == bindparam('response_id'))
+                    .values(test_session_id=bindparam('session_id')),
+                    [
+                        {'response_id': row.id, 'session_id': test_session.id}
+                        for test_session, session_rows in assignments
+                        for row in session_rows
+                    ]
+                )
+                db.session.commit()
+                session_count += len(assignments)
+
+            print(f"  [OK] Grouped {len(rows)} test responses into {session_count} sessions")
+
+            print("\n✓ Test session migration completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error migrating test sessions: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if add_test_sessions_table() else 1)
@@ -0,0 +1,99 @@
+"""
+Migration script to add the normalized topic dimension
+Creates the topics / topic_levels tables, adds questions.topic_id and
+backfills it by parsing existing number-prefixed topics ("01. Newspapers").
+Safe to run repeatedly - it also repairs topic_levels counts.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, select, text, update, bindparam
+
+from app import create_app, db
+from app.models import Question, Topic, TopicLevel, CatalogVersion
+from app.services.topic_service import parse_topic, topic_service
+from app.services.catalog_service import QUESTION_CATALOG
+
+
+def add_topics_table():
+    """Create topic tables and link every question to its topic"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            Topic.__table__.create(bind=db.engine, checkfirst=True)
+            TopicLevel.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ topics and topic_levels tables ready")
+
+            inspector = inspect(db.engine)
+            question_columns = [col['name'] for col in inspector.get_columns('questions')]
+            if 'topic_id' not in question_columns:
+                db.session.execute(text("ALTER TABLE questions ADD COLUMN topic_id INTEGER REFERENCES topics(id)"))
+                print("  [OK] Added questions.topic_id column")
+
+            question_indexes = [index['name'] for index in inspector.get_indexes('questions')]
+            if 'idx_questions_topic_level' not in question_indexes:
+                db.session.execute(text(
+                    "CREATE INDEX idx_questions_topic_level ON questions (topic_id, difficulty_level)"
+                ))
+                print("  [OK] Created idx_questions_topic_level index")
+            db.session.commit()
+
+            # Parse every topic string once and create missing Topic rows
+            rows = db.session.execute(select(Question.id, Question.topic, Question.language)).all()
+            topics = {
+                (topic.language, topic.name): topic
+                for topic in Topic.query.all()
+            }
+            assignments = []
+            for question_id, raw_topic, language in rows:
+                sort_order, name = parse_topic(raw_topic)
+                if not name:
+                    continue
+                key = (language or 'english', name)
+                topic = topics.get(key)
+                if topic is None:
+                    topic = topics[key] = Topic(name=name, language=key[0], sort_order=sort_order or 0)
+                    db.session.add(topic)
+                elif sort_order is not None and not topic.sort_order:
+                    topic.sort_order = sort_order
+                assignments.append((question_id, key))
+            db.session.flush()
+
+            # Bulk-assign topic ids without loading Question objects
+            if assignments:
+                db.session.execute(
+                    update(Question.__table__)
+                    .where(Question.__table__.c.id == bindparam('question_id'))
+                    .values(topic_id=bindparam('new_topic_id')),
+                    [{'question_id': qid, 'new_topic_id': topics[key].id} for qid, key in assignments]
+                )
+            print(f"  [OK] Linked {len(assignments)} questions to {len(topics)} topics")
+
+            topic_service.refresh_levels(db.session.connection(), [topic.id for topic in topics.values()])
+            print("  [OK] Rebuilt topic level availability")
+
+            # Make running workers rebuild their question catalog
+            if 'catalog_versions' in inspector.get_table_names():
+                db.session.execute(
+                    update(CatalogVersion.__table__)
+                    .where(CatalogVersion.__table__.c.name == QUESTION_CATALOG)
+                    .values(version=CatalogVersion.__table__.c.version + 1)
+                )
+            db.session.commit()
+            print("\n✓ Topic migration completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error migrating topics: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if add_topics_table() else 1)
@@ -0,0 +1,48 @@
+"""
+Migration script for the unread notifications counter
+Adds users.unread_notifications and fills it from the notifications table.
+Safe to run repeatedly; rerun it to repair counters after manual data fixes.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+from app.services.notification_service import unread_counter
+
+
+def add_unread_notifications_counter():
+    """Add users.unread_notifications and recount it for every user"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+            user_columns = [col['name'] for col in inspector.get_columns('users')]
+            if 'unread_notifications' not in user_columns:
+                db.session.execute(text(
+                    "ALTER TABLE users ADD COLUMN unread_notifications INTEGER NOT NULL DEFAULT 0"
+                ))
+                print("  [OK] Added users.unread_notifications column")
+
+            count = unread_counter.recount(db.session.connection())
+            db.session.commit()
+            print(f"  [OK] Recounted unread notifications for {count} users")
+
+            print("\n✓ Unread notifications counter migration completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error adding unread notifications counter: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if add_unread_notifications_counter() else 1)
@@ -0,0 +1,73 @@
+"""
+Migration script to add the user_topic_coverage table
+The practice scheduler reads one coverage row per (user, topic, level) instead
+of scanning responses. Rows are backfilled from existing responses with a
+single grouped query; safe to run repeatedly (existing rows are rebuilt).
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, func, insert, select
+
+from app import create_app, db
+from app.models import Question, Response, UserTopicCoverage
+
+
+def add_user_topic_coverage_table():
+    """Create user_topic_coverage and rebuild it from the responses table"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            UserTopicCoverage.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ user_topic_coverage table ready")
+
+            rows = db.session.execute(
+                select(
+                    Response.user_id,
+                    Question.topic_id,
+                    Question.difficulty_level,
+                    func.count(Response.id),
+                    func.max(Response.created_at),
+                    func.avg(Response.ai_score),
+                    func.count(Response.ai_score),
+                )
+                .join(Question, Response.question_id == Question.id)
+                .where(Question.topic_id.isnot(None), Question.difficulty_level.isnot(None))
+                .group_by(Response.user_id, Question.topic_id, Question.difficulty_level)
+            ).all()
+
+            db.session.execute(delete(UserTopicCoverage.__table__))
+            if rows:
+                db.session.execute(insert(UserTopicCoverage.__table__), [
+                    {
+                        'user_id': user_id,
+                        'topic_id': topic_id,
+                        'level': level,
+                        'attempts': attempts,
+                        'last_attempt_at': last_attempt_at,
+                        'score_avg': float(score_avg) if score_avg is not None else None,
+                        'scored_count': scored_count,
+                        'seen_question_ids': [],
+                    }
+                    for user_id, topic_id, level, attempts, last_attempt_at, score_avg, scored_count in rows
+                ])
+            db.session.commit()
+            print(f"  [OK] Backfilled {len(rows)} coverage rows from responses")
+
+            print("\n✓ User topic coverage migration completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error adding user_topic_coverage table: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if add_user_topic_coverage_table() else 1)
@@ -0,0 +1,128 @@
+"""
+Background worker for media jobs
+Processes queued media jobs (see app/services/media_job_service.py):
+transcoding new recordings to Opus, extracting prosody features and
+transcribing responses. Run it as a long-lived service next to gunicorn, or
+from cron with --once:
+
+    python scripts/media_worker.py                      # poll forever
+    */5 * * * * cd /path/to/app && python scripts/media_worker.py --once
+
+Options: --kind K limits the worker to one job kind (repeatable),
+--batch-size N jobs claimed per round; transcription jobs of a round go to
+the engine together (default 10), --sleep S seconds between polls when idle
+(default 5), --enqueue-existing queues recordings stored before these
+stages were enabled (transcription only with TRANSCRIPTION_ENABLED=true),
+--stats prints queue counts, bytes saved
+and transcription timings, then exits.
+"""
+import sys
+import os
+import argparse
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.services.media_job_service import media_job_queue
+from app.services.transcode_service import audio_transcoder
+from app.services.audio_features_service import audio_feature_extractor
+from app.services.transcription_service import JOB_KIND as TRANSCRIBE_KIND, transcriber
+
+# Job settings read by the handlers (the web app sets them in app.py)
+CONFIG_FROM_ENV = {
+    'AUDIO_OPUS_BITRATE': str,
+    'AUDIO_LOUDNESS_TARGET': float,
+    'AUDIO_TRANSCODE_TIMEOUT': int,
+    'FFMPEG_BINARY': str,
+    'TRANSCRIPTION_ENABLED': lambda value: value.lower() == 'true',
+    'TRANSCRIPTION_ENGINE': str,
+    'TRANSCRIPTION_MODEL': str,
+    'TRANSCRIPTION_COMPUTE_TYPE': str,
+    'TRANSCRIPTION_CONCURRENCY': int,
+    'TRANSCRIPTION_CPU_THREADS': int,
+}
+
+
+def print_stats():
+    for kind, counts in sorted(media_job_queue.stats().items()):
+        summary = ', '.join(f"{status}={count}" for status, count in sorted(counts.items()))
+        print(f"  [OK] {kind}: {summary}")
+    savings = audio_transcoder.savings()
+    print(f"  [OK] Transcoded {savings['files']} files: "
+          f"{savings['bytes_before'] / 1048576:.1f} MB -> {savings['bytes_after'] / 1048576:.1f} MB "
+          f"({savings['bytes_saved'] / 1048576:.1f} MB saved)")
+    metrics = transcriber.metrics()
+    if metrics['files']:
+        print(f"  [OK] Transcribed {metrics['files']} files: {metrics['audio_seconds'] / 60:.1f} min of audio "
+              f"in {metrics['seconds'] / 60:.1f} min (real-time factor {metrics['realtime_factor'] or 0:.2f}, "
+              f"p95 {metrics['p95_seconds']:.1f} s per file)")
+
+
+def run_worker(kinds=None, batch_size=10, sleep=5.0, once=False, enqueue_existing=False, stats=False):
+    """Process media jobs until the queue is empty (--once) or forever"""
+    app = create_app()
+    for key, cast in CONFIG_FROM_ENV.items():
+        if os.environ.get(key):
+            app.config[key] = cast(os.environ[key])
+
+    with app.app_context():
+        try:
+            if stats:
+                print_stats()
+                return True
+
+            if enqueue_existing:
+                queued = audio_transcoder.enqueue_existing()
+                print(f"  [OK] Queued {queued} existing recordings for transcoding")
+                queued = audio_feature_extractor.enqueue_existing()
+                print(f"  [OK] Queued {queued} existing responses for feature extraction")
+                queued = transcriber.enqueue_existing()
+                print(f"  [OK] Queued {queued} existing responses for transcription")
+
+            if not transcriber.enabled():
+                # Leave queued transcription jobs pending until TRANSCRIPTION_ENABLED=true
+                kinds = [kind for kind in (kinds or media_job_queue.kinds()) if kind != TRANSCRIBE_KIND]
+                print("  [OK] Transcription is disabled (TRANSCRIPTION_ENABLED=false); skipping its jobs")
+                if not kinds:
+                    return True
+
+            processed = 0
+            while True:
+                count = media_job_queue.work(kinds, batch_size)
+                processed += count
+                if count:
+                    print(f"  [OK] Processed {count} jobs ({processed} total)")
+                    continue
+                if once:
+                    break
+                db.session.remove()
+                time.sleep(sleep)
+
+            print_stats()
+            print("\n✓ Media worker finished successfully!")
+            return True
+
+        except KeyboardInterrupt:
+            print("\nStopped.")
+            return True
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error running media worker: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Process queued media jobs')
+    parser.add_argument('--kind', action='append', default=None, help='job kind to process (repeatable)')
+    parser.add_argument('--batch-size', type=int, default=10, help='jobs claimed per round')
+    parser.add_argument('--sleep', type=float, default=5.0, help='seconds between polls when idle')
+    parser.add_argument('--once', action='store_true', help='exit when the queue is empty')
+    parser.add_argument('--enqueue-existing', action='store_true', help='queue recordings stored before the media stages')
+    parser.add_argument('--stats', action='store_true', help='print queue counts, bytes saved and transcription timings, then exit')
+    args = parser.parse_args()
+    sys.exit(0 if run_worker(args.kind, args.batch_size, args.sleep, args.once,
+                             args.enqueue_existing, args.stats) else 1)
@@ -0,0 +1,72 @@
+"""
+Migration script for the content-addressed media store
+Creates the media_blobs and media_aliases tables, then moves recordings from
+the flat uploads/responses/ and uploads/comments/ directories into
+uploads/media/ab/cd/<sha256>.<ext> in batches (see
+app/services/media_storage_service.py). Old URLs keep working through
+media_aliases. Safe to interrupt and run again.
+
+Options: --batch-size N rows per commit (default 500), --sleep S seconds
+between batches to spare the disk (default 0), --tables-only creates the
+tables without moving files.
+"""
+import sys
+import os
+import argparse
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import Comment, MediaAlias, MediaBlob, Response
+from app.services.media_storage_service import media_store
+
+
+def migrate_media_storage(batch_size=500, sleep=0.0, tables_only=False):
+    """Create the media store tables and move existing recordings into the store"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            MediaBlob.__table__.create(bind=db.engine, checkfirst=True)
+            MediaAlias.__table__.create(bind=db.engine, checkfirst=True)
+            print("  [OK] media_blobs and media_aliases tables ready")
+            if tables_only:
+                print("\n✓ Media storage tables created successfully!")
+                return True
+
+            for model in (Response, Comment):
+                totals = {'moved': 0, 'missing': 0, 'changed': 0}
+                last_id = 0
+                while True:
+                    stats = media_store.migrate_batch(model, last_id, batch_size)
+                    if not stats['last_id']:
+                        break
+                    last_id = stats['last_id']
+                    for key in totals:
+                        totals[key] += stats[key]
+                    print(f"  [OK] {model.__tablename__}: up to id {last_id}, moved {totals['moved']}")
+                    if sleep:
+                        time.sleep(sleep)
+                print(f"  [OK] {model.__tablename__}: moved {totals['moved']}, "
+                      f"missing files {totals['missing']}, changed meanwhile {totals['changed']}")
+
+            print("\n✓ Media storage migration completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error migrating media storage: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move recordings into the content-addressed media store')
+    parser.add_argument('--batch-size', type=int, default=500, help='rows per commit')
+    parser.add_argument('--sleep', type=float, default=0.0, help='seconds between batches')
+    parser.add_argument('--tables-only', action='store_true', help='create the tables without moving files')
+    args = parser.parse_args()
+    sys.exit(0 if migrate_media_storage(args.batch_size, args.sleep, args.tables_only) else 1)
@@ -0,0 +1,52 @@
+"""
+Scheduled notification retention job
+Deletes notifications older than the retention window in bounded id-range
+chunks, one short transaction per chunk, and recounts the unread badges of
+the users affected. Run it hourly, so badges stop counting expired
+notifications soon after the feed hides them, e.g. from cron:
+
+    15 * * * * cd /path/to/app && python scripts/purge_notifications.py
+
+Options: --days N overrides NOTIFICATION_RETENTION_DAYS (default 30),
+--batch-size N sets the id window per chunk (default 5000).
+"""
+import sys
+import os
+import argparse
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.services.notification_service import DEFAULT_PURGE_BATCH_SIZE, notification_retention
+
+
+def purge_notifications(days=None, batch_size=DEFAULT_PURGE_BATCH_SIZE):
+    """Delete notifications past the retention window"""
+    app = create_app()
+    if days is None:
+        days = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 30))
+
+    with app.app_context():
+        try:
+            cutoff = notification_retention.cutoff(days)
+            deleted = notification_retention.purge(days, batch_size)
+            print(f"  [OK] Deleted {deleted} notifications created before {cutoff:%Y-%m-%d %H:%M}")
+
+            print("\n✓ Notification purge completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error purging notifications: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Delete notifications past the retention window')
+    parser.add_argument('--days', type=int, default=None, help='retention in days')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_PURGE_BATCH_SIZE, help='ids per delete chunk')
+    args = parser.parse_args()
+    sys.exit(0 if purge_notifications(args.days, args.batch_size) else 1)
@@ -0,0 +1,42 @@
+"""
+Backfill script for the user_daily_progress rollup table
+Creates the table if needed and rebuilds every user's daily rollups from the
+responses table with one grouped query. Safe to run at any time.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import UserDailyProgress
+from app.services.progress_service import progress_service
+
+
+def rebuild_daily_progress():
+    """Create user_daily_progress and recompute it from responses"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            UserDailyProgress.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ user_daily_progress table ready")
+
+            count = progress_service.rebuild(db.session.connection())
+            db.session.commit()
+            print(f"  [OK] Wrote {count} daily rollup rows")
+
+            print("\n✓ Daily progress backfill completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error rebuilding daily progress: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if rebuild_daily_progress() else 1)
@@ -0,0 +1,45 @@
+"""
+Create and backfill the full-text search index
+Creates the dialect-specific index (an FTS5 virtual table on SQLite, a
+search_documents table with a GIN-indexed tsvector on PostgreSQL) if it is
+missing, then rewrites every document from questions, sample answers and
+comments. Safe to re-run: use it after deploying search and to repair the
+index after bulk imports or manual data fixes.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.services.search_service import search_index
+
+
+def rebuild_search_index():
+    """Create the search index if needed and re-index all content"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            connection = db.session.connection()
+            search_index.create_schema(connection)
+            print(f"  [OK] Search index table '{search_index.table_name(connection)}' is ready")
+
+            documents = search_index.rebuild(connection)
+            db.session.commit()
+            print(f"  [OK] Indexed {documents} documents")
+
+            print("\n✓ Search index rebuilt successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error rebuilding search index: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if rebuild_search_index() else 1)
@@ -0,0 +1,43 @@
+"""
+Repair script for the user_stats table
+Creates the table if needed and rebuilds every user's counters from the
+responses and surveys tables in bulk (two grouped queries). Safe to run at
+any time, e.g. after manual data fixes.
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import UserStats
+from app.services.stats_service import user_stats_service
+
+
+def rebuild_user_stats():
+    """Create user_stats and recompute it for all users"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            UserStats.__table__.create(bind=db.engine, checkfirst=True)
+            print("✓ user_stats table ready")
+
+            count = user_stats_service.rebuild(db.session.connection())
+            db.session.commit()
+            print(f"  [OK] Rebuilt statistics for {count} users")
+
+            print("\n✓ User statistics rebuild completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error rebuilding user statistics: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if rebuild_user_stats() else 1)
@@ -0,0 +1,42 @@
+"""
+Periodic reconciler for comment like counters
+Recomputes comments.likes_count from comment_likes in one bulk UPDATE,
+touching only comments whose counter drifted (e.g. after manual data fixes
+or an interrupted deploy). Likes keep the counter exact on their own; run
+this nightly as a safety net, e.g. from cron:
+
+    30 3 * * * cd /path/to/app && python scripts/reconcile_comment_likes.py
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.services.comment_service import comment_like_service
+
+
+def reconcile_comment_likes():
+    """Fix likes_count for every comment whose counter drifted"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            fixed = comment_like_service.reconcile_likes(db.session.connection())
+            db.session.commit()
+            print(f"  [OK] Reconciled like counts for {fixed} comments")
+
+            print("\n✓ Comment like reconciliation completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error reconciling comment likes: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if reconcile_comment_likes() else 1)
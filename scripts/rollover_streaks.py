@@ -0,0 +1,43 @@
+"""
+Daily streak rollover job
+Resets streak_count to 0 for every user whose last activity is before
+yesterday (Asia/Ho_Chi_Minh), in one bulk UPDATE. Streaks are only ever
+increased when a response is saved, so this is the only place broken
+streaks are written back; run it shortly after midnight, e.g. from cron:
+
+    5 0 * * * cd /path/to/app && python scripts/rollover_streaks.py
+"""
+import sys
+import os
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, today_hanoi
+
+
+def rollover_streaks():
+    """Reset broken streaks for all users"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            today = today_hanoi()
+            result = db.session.execute(User.rollover_broken_streaks(today))
+            db.session.commit()
+            print(f"  [OK] Reset {result.rowcount} broken streaks (today is {today.isoformat()})")
+
+            print("\n✓ Streak rollover completed successfully!")
+            return True
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error rolling over streaks: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    sys.exit(0 if rollover_streaks() else 1)